@@ -45,6 +45,9 @@ pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 class ClipByExtent(GdalAlgorithm):
 
+    # gdal_translate can write a VRT referencing the input
+    virtualRasterOutputs = True
+
     INPUT = 'INPUT'
     OUTPUT = 'OUTPUT'
     NO_DATA = 'NO_DATA'
@@ -52,6 +52,9 @@ pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 class ClipByMask(GdalAlgorithm):
 
+    # gdalwarp can write a warped VRT referencing the input
+    virtualRasterOutputs = True
+
     INPUT = 'INPUT'
     OUTPUT = 'OUTPUT'
     NO_DATA = 'NO_DATA'
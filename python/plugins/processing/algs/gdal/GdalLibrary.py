@@ -0,0 +1,615 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    GdalLibrary.py
+    ---------------------
+    Date                 : June 2017
+    Copyright            : (C) 2017 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'June 2017'
+__copyright__ = '(C) 2017, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import uuid
+import shlex
+
+from osgeo import gdal, ogr, osr
+
+from qgis.core import QgsMessageLog
+
+from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
+from processing.algs.gdal.GdalUtils import GdalUtils
+from processing.tools.system import isWindows
+
+# number of values taken by the options of the GDAL python scripts and
+# ogr2ogr, which are parsed here instead of by GDAL. Commands using
+# other options are run as a separate process.
+MERGE_OPTIONS = {'-o': 1, '-of': 1, '-f': 1, '-ot': 1, '-co': 1, '-n': 1,
+                 '-a_nodata': 1, '-ps': 2, '-tap': 0, '-separate': 0,
+                 '-q': 0, '-v': 0}
+CONTOUR_OPTIONS = {'-a': 1, '-i': 1, '-f': 1, '-of': 1, '-b': 1, '-3d': 0,
+                   '-snodata': 1, '-inodata': 0, '-off': 1, '-nln': 1,
+                   '-dsco': 1, '-lco': 1, '-q': 0}
+POLYGONIZE_OPTIONS = {'-f': 1, '-of': 1, '-b': 1, '-mask': 1, '-nomask': 0,
+                      '-8': 0, '-q': 0}
+PROXIMITY_OPTIONS = {'-of': 1, '-ot': 1, '-co': 1, '-srcband': 1,
+                     '-dstband': 1, '-values': 1, '-distunits': 1,
+                     '-maxdist': 1, '-nodata': 1, '-use_input_nodata': 1,
+                     '-fixed-buf-val': 1, '-q': 0}
+FILLNODATA_OPTIONS = {'-md': 1, '-si': 1, '-b': 1, '-mask': 1, '-nomask': 0,
+                      '-of': 1, '-co': 1, '-o': 1, '-q': 0}
+SIEVE_OPTIONS = {'-st': 1, '-4': 0, '-8': 0, '-of': 1, '-mask': 1,
+                 '-nomask': 0, '-q': 0}
+OGR2OGR_OPTIONS = {'-f': 1, '-of': 1, '-append': 0, '-overwrite': 0,
+                   '-update': 0, '-addfields': 0, '-progress': 0,
+                   '-skipfailures': 0, '-explodecollections': 0,
+                   '-preserve_fid': 0, '-unsetFid': 0, '-nomd': 0,
+                   '-sql': 1, '-dialect': 1, '-where': 1, '-select': 1,
+                   '-nln': 1, '-nlt': 1, '-dsco': 1, '-lco': 1, '-oo': 1,
+                   '-doo': 1, '-s_srs': 1, '-t_srs': 1, '-a_srs': 1,
+                   '-spat': 4, '-spat_srs': 1, '-geomfield': 1,
+                   '-clipsrclayer': 1, '-clipsrcsql': 1,
+                   '-clipsrcwhere': 1, '-clipdstlayer': 1,
+                   '-clipdstsql': 1, '-clipdstwhere': 1, '-segmentize': 1,
+                   '-simplify': 1, '-gt': 1, '-fid': 1, '-limit': 1,
+                   '-zfield': 1, '-dim': 1, '-fieldTypeToString': 1,
+                   '-mapFieldType': 1, '-fieldmap': 1, '-wrapdateline': 0,
+                   '-datelineoffset': 1, '-mo': 1}
+
+
+class GdalLibrary(object):
+
+    """Runs the console commands of the GDAL algorithms with the GDAL
+    Python bindings, in the QGIS process, instead of starting the GDAL
+    utilities in a shell.
+
+    Only the utilities and options with an equivalent in the bindings
+    are supported. run() returns False for any other command, so it can
+    be run as a separate process instead. As the outputs are written in
+    the QGIS process, commands can also use in-memory (/vsimem/) or VRT
+    files written by previous commands.
+    """
+
+    @staticmethod
+    def isAvailable():
+        # the utilities are available as functions since GDAL 2.1
+        return hasattr(gdal, 'Translate') and hasattr(gdal, 'VectorTranslate')
+
+    @staticmethod
+    def parse(commands):
+        """Returns the name of the utility and the list of arguments of
+        a command, split as the shell would do it.
+        """
+        command = ' '.join([str(c) for c in commands])
+        if isWindows():
+            tokens = [GdalLibrary._unquote(t) for t in shlex.split(command, posix=False)]
+        else:
+            tokens = shlex.split(command)
+        if tokens and tokens[0].lower() == 'cmd.exe':
+            # cmd.exe /C script.bat
+            tokens = tokens[2:]
+        if not tokens:
+            return None, []
+        name = os.path.splitext(os.path.basename(tokens[0]))[0]
+        return name, tokens[1:]
+
+    @staticmethod
+    def _unquote(token):
+        if len(token) > 1 and token[0] == '"' and token[-1] == '"':
+            return token[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+        return token
+
+    @staticmethod
+    def prepare(commands):
+        """Returns a function running a command in-process, taking a GDAL
+        progress callback, or None if the command is not supported.
+        """
+        if not GdalLibrary.isAvailable():
+            return None
+        try:
+            name, args = GdalLibrary.parse(commands)
+        except ValueError:
+            # unbalanced quotes
+            return None
+        if name not in RUNNERS:
+            return None
+
+        config = []
+        while '--config' in args:
+            i = args.index('--config')
+            if i + 2 >= len(args):
+                return None
+            config.append((args[i + 1], args[i + 2]))
+            del args[i:i + 3]
+
+        function = RUNNERS[name](args)
+        if function is None:
+            return None
+
+        # options are set for the current thread only, so commands run
+        # at the same time from other threads are not affected (the
+        # bindings of older GDAL versions only set them globally)
+        getOption = getattr(gdal, 'GetThreadLocalConfigOption', gdal.GetConfigOption)
+        setOption = getattr(gdal, 'SetThreadLocalConfigOption', gdal.SetConfigOption)
+
+        def run(callback):
+            values = [(key, getOption(key)) for key, value in config]
+            for key, value in config:
+                setOption(key, value)
+            try:
+                return function(callback)
+            finally:
+                for key, value in values:
+                    setOption(key, value)
+        return run
+
+    @staticmethod
+    def run(commands, feedback):
+        """Runs a GDAL command in-process, reporting its messages and
+        progress to feedback. Returns the lines of its console output, or
+        None without running it if the command is not supported.
+        """
+        function = GdalLibrary.prepare(commands)
+        if function is None:
+            return None
+
+        fused_command = ' '.join([str(c) for c in commands])
+        QgsMessageLog.logMessage(fused_command, 'Processing', QgsMessageLog.INFO)
+        feedback.pushInfo('GDAL command:')
+        feedback.pushCommandInfo(fused_command)
+        feedback.pushInfo('GDAL command output:')
+
+        loglines = []
+        loglines.append('GDAL execution console output')
+
+        def handler(errorClass, errorNumber, message):
+            feedback.pushConsoleInfo(message)
+            loglines.append(message + '\n')
+
+        gdal.PushErrorHandler(handler)
+        try:
+            output = function(GdalUtils.progressCallback(feedback))
+        except GeoAlgorithmExecutionException:
+            if not feedback.isCanceled():
+                raise
+            output = None
+        finally:
+            gdal.PopErrorHandler()
+
+        if output:
+            for line in output.splitlines():
+                feedback.pushConsoleInfo(line)
+                loglines.append(line + '\n')
+        QgsMessageLog.logMessage(''.join(loglines), 'Processing', QgsMessageLog.INFO)
+        return loglines
+
+
+def _options(args, arities):
+    """Splits the arguments of a command into a dict of options and a
+    list of positional arguments, using the number of values taken by
+    each option. Options given more than once are stored as lists.
+    Returns None, None if there is an unknown option.
+    """
+    options = {}
+    positional = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in arities:
+            count = arities[arg]
+            if count and i + count >= len(args):
+                return None, None
+            value = args[i + 1:i + 1 + count]
+            value = True if count == 0 else value[0] if count == 1 else value
+            options.setdefault(arg, []).append(value)
+            i += count + 1
+        elif arg.startswith('-') and not _isNumber(arg):
+            return None, None
+        else:
+            positional.append(arg)
+            i += 1
+    return options, positional
+
+
+def _isNumber(s):
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+
+def _last(options, name, default=None):
+    return options[name][-1] if name in options else default
+
+
+def _open(source, flags=None):
+    if flags is None:
+        dataset = gdal.Open(source)
+    else:
+        dataset = gdal.OpenEx(source, flags)
+    if dataset is None:
+        raise GeoAlgorithmExecutionException(gdal.GetLastErrorMsg())
+    return dataset
+
+
+def _check(result):
+    if result is None or result is False or (isinstance(result, int) and result == 0):
+        raise GeoAlgorithmExecutionException(gdal.GetLastErrorMsg())
+    # dropping the last reference to a dataset closes it, writing it
+    # to disk
+    return None
+
+
+def _srs(dataset):
+    wkt = dataset.GetProjectionRef()
+    return osr.SpatialReference(wkt) if wkt else None
+
+
+def _createRaster(source, destination, format, dataType, bands=1, options=None):
+    driver = gdal.GetDriverByName(format)
+    if driver is None:
+        raise GeoAlgorithmExecutionException('Unknown raster format: {}'.format(format))
+    dataset = driver.Create(destination, source.RasterXSize, source.RasterYSize,
+                            bands, dataType, options or [])
+    if dataset is None:
+        raise GeoAlgorithmExecutionException(gdal.GetLastErrorMsg())
+    wkt = source.GetProjection()
+    if wkt:
+        dataset.SetProjection(wkt)
+    dataset.SetGeoTransform(source.GetGeoTransform())
+    return dataset
+
+
+def _createVector(destination, format, options=None):
+    driver = ogr.GetDriverByName(format)
+    if driver is None:
+        raise GeoAlgorithmExecutionException('Unknown vector format: {}'.format(format))
+    dataSource = driver.CreateDataSource(destination, options or [])
+    if dataSource is None:
+        raise GeoAlgorithmExecutionException(gdal.GetLastErrorMsg())
+    return dataSource
+
+
+def _maskBand(band, options):
+    """Returns the dataset of the mask band (which must be kept open
+    while the band is used) and the mask band to use for a band.
+    """
+    if '-nomask' in options:
+        return None, None
+    if '-mask' in options:
+        dataset = _open(_last(options, '-mask'))
+        return dataset, dataset.GetRasterBand(1)
+    return None, band.GetMaskBand()
+
+
+def _translate(args):
+    if len(args) < 2 or '-sds' in args:
+        return None
+    options, source, destination = args[:-2], args[-2], args[-1]
+    return lambda callback: _check(gdal.Translate(destination, _open(source), options=list(options),
+                                                  callback=callback))
+
+
+def _warp(args):
+    if len(args) < 2:
+        return None
+    options, source, destination = args[:-2], args[-2], args[-1]
+    if os.path.exists(destination):
+        # gdalwarp updates existing files
+        return None
+    options = [o for o in options if o != '-overwrite']
+    return lambda callback: _check(gdal.Warp(destination, _open(source), options=options,
+                                             callback=callback))
+
+
+def _buildvrt(args):
+    args = [a for a in args if a != '-overwrite']
+    if '-input_file_list' not in args:
+        return None
+    i = args.index('-input_file_list')
+    listFile = args[i + 1]
+    del args[i:i + 2]
+    if not args:
+        return None
+    options, destination = args[:-1], args[-1]
+
+    def run(callback):
+        with open(listFile) as f:
+            sources = [line.strip() for line in f if line.strip()]
+        return _check(gdal.BuildVRT(destination, sources, options=options, callback=callback))
+    return run
+
+
+def _merge(args):
+    options, sources = _options(args, MERGE_OPTIONS)
+    if options is None or '-o' not in options or not sources:
+        return None
+    destination = _last(options, '-o')
+    if os.path.exists(destination):
+        # gdal_merge.py updates existing files
+        return None
+
+    def run(callback):
+        # the sources are mosaicked in a virtual raster and then
+        # written in the output format, with the pixel size of the
+        # first file as gdal_merge.py does
+        vrt = '/vsimem/merge_{}.vrt'.format(uuid.uuid4().hex)
+        try:
+            if '-ps' in options:
+                xRes, yRes = [abs(float(v)) for v in _last(options, '-ps')]
+            else:
+                geotransform = _open(sources[0]).GetGeoTransform()
+                xRes, yRes = abs(geotransform[1]), abs(geotransform[5])
+            _check(gdal.BuildVRT(vrt, sources,
+                                 resolution='user', xRes=xRes, yRes=yRes,
+                                 separate='-separate' in options,
+                                 targetAlignedPixels='-tap' in options,
+                                 srcNodata=_last(options, '-n', 'None'),
+                                 VRTNodata='None'))
+            kwargs = {'format': _last(options, '-of', _last(options, '-f', 'GTiff')),
+                      'creationOptions': options.get('-co', []),
+                      'callback': callback}
+            if '-ot' in options:
+                kwargs['outputType'] = gdal.GetDataTypeByName(_last(options, '-ot'))
+            if '-a_nodata' in options:
+                kwargs['noData'] = _last(options, '-a_nodata')
+            return _check(gdal.Translate(destination, vrt, **kwargs))
+        finally:
+            gdal.Unlink(vrt)
+    return run
+
+
+def _contour(args):
+    options, positional = _options(args, CONTOUR_OPTIONS)
+    if options is None or len(positional) != 2 or '-i' not in options:
+        return None
+    source, destination = positional
+    if os.path.exists(destination):
+        return None
+
+    def run(callback):
+        dataset = _open(source)
+        band = dataset.GetRasterBand(int(_last(options, '-b', 1)))
+        useNoData = False
+        noData = 0
+        if '-snodata' in options:
+            useNoData, noData = True, float(_last(options, '-snodata'))
+        elif '-inodata' not in options:
+            noData = band.GetNoDataValue()
+            useNoData = noData is not None
+            noData = noData or 0
+
+        format = _last(options, '-f', _last(options, '-of', 'ESRI Shapefile'))
+        dataSource = _createVector(destination, format, options.get('-dsco'))
+        geometryType = ogr.wkbLineString25D if '-3d' in options else ogr.wkbLineString
+        layer = dataSource.CreateLayer(_last(options, '-nln', 'contour'), _srs(dataset),
+                                       geometryType, options.get('-lco', []))
+        layer.CreateField(ogr.FieldDefn('ID', ogr.OFTInteger))
+        elevationField = -1
+        if '-a' in options:
+            layer.CreateField(ogr.FieldDefn(_last(options, '-a'), ogr.OFTReal))
+            elevationField = 1
+        result = gdal.ContourGenerate(band, float(_last(options, '-i')), float(_last(options, '-off', 0)),
+                                      [], int(useNoData), noData, layer, 0, elevationField,
+                                      callback=callback)
+        return _check(result == 0)
+    return run
+
+
+def _rasterize(args):
+    if len(args) < 2:
+        return None
+    options, source, destination = args[:-2], args[-2], args[-1]
+
+    def run(callback):
+        if os.path.exists(destination):
+            # burns the features into the existing raster, as
+            # gdal_rasterize does
+            target = _open(destination, gdal.OF_RASTER | gdal.OF_UPDATE)
+        else:
+            target = destination
+        return _check(gdal.Rasterize(target, _open(source, gdal.OF_VECTOR), options=list(options),
+                                     callback=callback))
+    return run
+
+
+def _polygonize(args):
+    options, positional = _options(args, POLYGONIZE_OPTIONS)
+    if options is None or len(positional) < 2 or len(positional) > 4:
+        return None
+    source, destination = positional[:2]
+    layerName = positional[2] if len(positional) > 2 else 'out'
+    fieldName = positional[3] if len(positional) > 3 else 'DN'
+    if os.path.exists(destination):
+        # gdal_polygonize.py appends to existing files
+        return None
+
+    def run(callback):
+        dataset = _open(source)
+        band = dataset.GetRasterBand(int(_last(options, '-b', 1)))
+        maskDataset, mask = _maskBand(band, options)
+        format = _last(options, '-f', _last(options, '-of', 'GML'))
+        dataSource = _createVector(destination, format)
+        layer = dataSource.CreateLayer(layerName, _srs(dataset))
+        layer.CreateField(ogr.FieldDefn(fieldName, ogr.OFTInteger))
+        polygonizeOptions = ['8CONNECTED=8'] if '-8' in options else []
+        result = gdal.Polygonize(band, mask, layer, 0, polygonizeOptions, callback=callback)
+        return _check(result == 0)
+    return run
+
+
+def _proximity(args):
+    options, positional = _options(args, PROXIMITY_OPTIONS)
+    if options is None or len(positional) != 2:
+        return None
+    source, destination = positional
+    if os.path.exists(destination):
+        # gdal_proximity.py writes to existing files
+        return None
+
+    def run(callback):
+        dataset = _open(source)
+        band = dataset.GetRasterBand(int(_last(options, '-srcband', 1)))
+        output = _createRaster(dataset, destination, _last(options, '-of', 'GTiff'),
+                               gdal.GetDataTypeByName(_last(options, '-ot', 'Float32')),
+                               options=options.get('-co'))
+        proximityOptions = []
+        for option, name in [('-values', 'VALUES'), ('-distunits', 'DISTUNITS'),
+                             ('-maxdist', 'MAXDIST'), ('-nodata', 'NODATA'),
+                             ('-use_input_nodata', 'USE_INPUT_NODATA'),
+                             ('-fixed-buf-val', 'FIXED_BUF_VAL')]:
+            if option in options:
+                proximityOptions.append('{}={}'.format(name, _last(options, option)))
+        result = gdal.ComputeProximity(band, output.GetRasterBand(1), proximityOptions,
+                                       callback=callback)
+        return _check(result == 0)
+    return run
+
+
+def _fillnodata(args):
+    options, positional = _options(args, FILLNODATA_OPTIONS)
+    if options is None or len(positional) != 2:
+        return None
+    source, destination = positional
+
+    def run(callback):
+        dataset = _open(source)
+        band = dataset.GetRasterBand(int(_last(options, '-b', 1)))
+        maskDataset, mask = _maskBand(band, options)
+        output = _createRaster(dataset, destination, _last(options, '-of', 'GTiff'),
+                               band.DataType, options=options.get('-co'))
+        outputBand = output.GetRasterBand(1)
+        # copy the band in blocks of rows
+        rows = 256
+        for y in range(0, dataset.RasterYSize, rows):
+            count = min(rows, dataset.RasterYSize - y)
+            outputBand.WriteRaster(0, y, dataset.RasterXSize, count,
+                                   band.ReadRaster(0, y, dataset.RasterXSize, count))
+        noData = band.GetNoDataValue()
+        if noData is not None:
+            outputBand.SetNoDataValue(noData)
+        if band.GetRasterColorTable() is not None:
+            outputBand.SetRasterColorTable(band.GetRasterColorTable())
+        outputBand.SetRasterColorInterpretation(band.GetRasterColorInterpretation())
+        result = gdal.FillNodata(outputBand, mask, float(_last(options, '-md', 100)),
+                                 int(_last(options, '-si', 0)), options.get('-o', []),
+                                 callback=callback)
+        return _check(result == 0)
+    return run
+
+
+def _sieve(args):
+    options, positional = _options(args, SIEVE_OPTIONS)
+    if options is None or len(positional) != 2:
+        return None
+    source, destination = positional
+
+    def run(callback):
+        dataset = _open(source)
+        band = dataset.GetRasterBand(1)
+        maskDataset, mask = _maskBand(band, options)
+        output = _createRaster(dataset, destination, _last(options, '-of', 'GTiff'), band.DataType)
+        result = gdal.SieveFilter(band, mask, output.GetRasterBand(1),
+                                  int(_last(options, '-st', 2)),
+                                  8 if '-8' in options else 4,
+                                  callback=callback)
+        return _check(result == 0)
+    return run
+
+
+def _dem(args):
+    if not args:
+        return None
+    mode = args[0]
+    kwargs = {}
+    if mode == 'color-relief':
+        if len(args) < 4:
+            return None
+        source, kwargs['colorFilename'], destination = args[1:4]
+        options = args[4:]
+    else:
+        if len(args) < 3:
+            return None
+        source, destination = args[1:3]
+        options = args[3:]
+    return lambda callback: _check(gdal.DEMProcessing(destination, _open(source), mode,
+                                                      options=list(options), callback=callback,
+                                                      **kwargs))
+
+
+def _ogr2ogr(args):
+    arities = dict(OGR2OGR_OPTIONS)
+    options = []
+    positional = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ('-clipsrc', '-clipdst'):
+            # a datasource, WKT geometry or 'spat_extent', or 4 coordinates
+            count = 4 if i + 1 < len(args) and _isNumber(args[i + 1]) else 1
+        elif arg in arities:
+            count = arities[arg]
+        elif arg.startswith('-') and not _isNumber(arg):
+            return None
+        else:
+            positional.append(arg)
+            i += 1
+            continue
+        if i + count >= len(args):
+            return None
+        options.extend(args[i:i + count + 1])
+        i += count + 1
+    if len(positional) < 2:
+        return None
+    destination, source, layers = positional[0], positional[1], positional[2:]
+    # trailing arguments are taken as layer names
+    return lambda callback: _check(gdal.VectorTranslate(destination, _open(source, gdal.OF_VECTOR),
+                                                        options=options + layers, callback=callback))
+
+
+def _info(args):
+    if not args:
+        return None
+    options, source = args[:-1], args[-1]
+
+    def run(callback):
+        info = gdal.Info(_open(source), options=list(options))
+        if info is None:
+            raise GeoAlgorithmExecutionException(gdal.GetLastErrorMsg())
+        return info
+    return run
+
+
+# functions parsing the arguments of each supported utility and
+# returning a function that runs it, or None if it can not be run
+# in-process
+RUNNERS = {'gdal_translate': _translate,
+           'gdalwarp': _warp,
+           'gdalbuildvrt': _buildvrt,
+           'gdal_merge': _merge,
+           'gdal_contour': _contour,
+           'gdal_rasterize': _rasterize,
+           'gdal_polygonize': _polygonize,
+           'gdal_proximity': _proximity,
+           'gdal_fillnodata': _fillnodata,
+           'gdal_sieve': _sieve,
+           'gdaldem': _dem,
+           'ogr2ogr': _ogr2ogr,
+           'gdalinfo': _info}
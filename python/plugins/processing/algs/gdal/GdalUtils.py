@@ -32,7 +32,7 @@ import os
 import subprocess
 import platform
 
-from osgeo import gdal
+from osgeo import gdal, osr
 
 from qgis.core import (QgsApplication,
                        QgsVectorFileWriter,
@@ -41,6 +41,7 @@ from qgis.core import (QgsApplication,
                        QgsMessageLog,
                        QgsSettings)
 from processing.core.ProcessingConfig import ProcessingConfig
+from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.tools.system import isWindows, isMac
 
 try:
@@ -53,31 +54,25 @@ except:
 class GdalUtils(object):
 
     GDAL_HELP_PATH = 'GDAL_HELP_PATH'
+    GDAL_IN_PROCESS = 'GDAL_IN_PROCESS'
 
     supportedRasters = None
+    preparedPath = None
 
     @staticmethod
     def runGdal(commands, feedback=None):
+        """Runs a GDAL command and returns the lines of its console
+        output.
+        """
         if feedback is None:
             feedback = QgsProcessingFeedback()
-        envval = os.getenv('PATH')
-        # We need to give some extra hints to get things picked up on OS X
-        isDarwin = False
-        try:
-            isDarwin = platform.system() == 'Darwin'
-        except IOError:  # https://travis-ci.org/m-kuhn/QGIS#L1493-L1526
-            pass
-        if isDarwin and os.path.isfile(os.path.join(QgsApplication.prefixPath(), "bin", "gdalinfo")):
-            # Looks like there's a bundled gdal. Let's use it.
-            os.environ['PATH'] = "{}{}{}".format(os.path.join(QgsApplication.prefixPath(), "bin"), os.pathsep, envval)
-            os.environ['DYLD_LIBRARY_PATH'] = os.path.join(QgsApplication.prefixPath(), "lib")
-        else:
-            # Other platforms should use default gdal finder codepath
-            settings = QgsSettings()
-            path = settings.value('/GdalTools/gdalPath', '')
-            if not path.lower() in envval.lower().split(os.pathsep):
-                envval += '{}{}'.format(os.pathsep, path)
-                os.putenv('PATH', envval)
+        if ProcessingConfig.getSetting(GdalUtils.GDAL_IN_PROCESS):
+            from processing.algs.gdal.GdalLibrary import GdalLibrary
+            loglines = GdalLibrary.run(commands, feedback)
+            if loglines is not None:
+                GdalUtils.consoleOutput = loglines
+                return loglines
+        GdalUtils.prepareEnvironment()
 
         fused_command = ' '.join([str(c) for c in commands])
         QgsMessageLog.logMessage(fused_command, 'Processing', QgsMessageLog.INFO)
@@ -110,9 +105,41 @@ class GdalUtils(object):
 
             QgsMessageLog.logMessage('\n'.join(loglines), 'Processing', QgsMessageLog.INFO)
             GdalUtils.consoleOutput = loglines
+        return loglines
+
+    @staticmethod
+    def prepareEnvironment():
+        """Makes the GDAL utilities available in the PATH. This is only
+        done again if the configured GDAL folder changes.
+        """
+        settings = QgsSettings()
+        path = settings.value('/GdalTools/gdalPath', '')
+        if path == GdalUtils.preparedPath:
+            return
+        envval = os.getenv('PATH')
+        # We need to give some extra hints to get things picked up on OS X
+        isDarwin = False
+        try:
+            isDarwin = platform.system() == 'Darwin'
+        except IOError:  # https://travis-ci.org/m-kuhn/QGIS#L1493-L1526
+            pass
+        if isDarwin and os.path.isfile(os.path.join(QgsApplication.prefixPath(), "bin", "gdalinfo")):
+            # Looks like there's a bundled gdal. Let's use it.
+            os.environ['PATH'] = "{}{}{}".format(os.path.join(QgsApplication.prefixPath(), "bin"), os.pathsep, envval)
+            os.environ['DYLD_LIBRARY_PATH'] = os.path.join(QgsApplication.prefixPath(), "lib")
+        else:
+            # Other platforms should use default gdal finder codepath
+            if not path.lower() in envval.lower().split(os.pathsep):
+                envval += '{}{}'.format(os.pathsep, path)
+                os.putenv('PATH', envval)
+        GdalUtils.preparedPath = path
 
     @staticmethod
     def getConsoleOutput():
+        """Returns the console output of the last GDAL command run from
+        any thread. Use the value returned by runGdal instead when
+        algorithms might run at the same time.
+        """
         return GdalUtils.consoleOutput
 
     @staticmethod
@@ -177,6 +204,105 @@ class GdalUtils(object):
                 return name
         return 'GTiff'
 
+    @staticmethod
+    def progressCallback(feedback, start=0, end=100):
+        """Returns a GDAL progress callback reporting to feedback between
+        start and end percent, which stops GDAL when the feedback is
+        canceled.
+        """
+        def callback(complete, message, data):
+            feedback.setProgress(start + (end - start) * complete)
+            return 0 if feedback.isCanceled() else 1
+        return callback
+
+    @staticmethod
+    def isSameCrs(wkt, crs):
+        """Returns True if a dataset projection in WKT is the same as a
+        CRS given as an authority id or any other definition understood
+        by GDAL.
+        """
+        if not wkt:
+            return False
+        datasetCrs = osr.SpatialReference()
+        datasetCrs.ImportFromWkt(wkt)
+        otherCrs = osr.SpatialReference()
+        if otherCrs.SetFromUserInput(crs) != 0:
+            return False
+        return bool(datasetCrs.IsSame(otherCrs))
+
+    @staticmethod
+    def translateRaster(source, destination, crs=None, options=None, feedback=None, start=0, end=100):
+        """Converts a raster file to the format of the destination file
+        extension, in the current process.
+
+        If both files have the same format, the source is renamed
+        instead of copied. VRT destinations reference the source pixels,
+        which are moved next to the VRT file.
+        """
+        if feedback is None:
+            feedback = QgsProcessingFeedback()
+        format = GdalUtils.getFormatShortNameFromFilename(destination)
+        dataset = gdal.Open(source)
+        if dataset is None:
+            raise GeoAlgorithmExecutionException(gdal.GetLastErrorMsg())
+        driver = dataset.GetDriver()
+        sameFormat = driver.ShortName == format
+        sameCrs = not crs or GdalUtils.isSameCrs(dataset.GetProjection(), crs)
+        dataset = None
+
+        if format == 'VRT' and not sameFormat:
+            data = os.path.splitext(destination)[0] + os.path.splitext(source)[1]
+            if not os.path.exists(data) and driver.Rename(data, source) == 0:
+                source = data
+        elif sameFormat and sameCrs and not options:
+            if os.path.exists(destination):
+                driver.Delete(destination)
+            if driver.Rename(destination, source) == 0:
+                feedback.setProgress(end)
+                return
+            # for instance, the files are in different file systems
+
+        translated = gdal.Translate(destination, source,
+                                    format=format,
+                                    outputSRS=crs or None,
+                                    creationOptions=options or [],
+                                    callback=GdalUtils.progressCallback(feedback, start, end))
+        if translated is None:
+            raise GeoAlgorithmExecutionException(gdal.GetLastErrorMsg())
+        # closing the dataset flushes it to disk
+        translated = None
+
+    @staticmethod
+    def translateVector(source, destination, encoding=None, feedback=None, start=0, end=100):
+        """Converts a vector file to the format of the destination file
+        extension, in the current process. Returns False if the GDAL
+        bindings can not do it, so the caller can write the features
+        with a QGIS writer instead.
+        """
+        if not hasattr(gdal, 'VectorTranslate'):
+            # GDAL < 2.1
+            return False
+        if feedback is None:
+            feedback = QgsProcessingFeedback()
+        format = GdalUtils.getVectorDriverFromFileName(destination)
+        driver = gdal.GetDriverByName(format)
+        if driver is None:
+            return False
+        if os.path.exists(destination):
+            driver.Delete(destination)
+        layerOptions = []
+        if format == 'ESRI Shapefile' and encoding and encoding != 'System':
+            layerOptions.append('ENCODING=' + encoding)
+        translated = gdal.VectorTranslate(destination, source,
+                                          format=format,
+                                          layerName=os.path.splitext(os.path.basename(destination))[0],
+                                          layerCreationOptions=layerOptions,
+                                          callback=GdalUtils.progressCallback(feedback, start, end))
+        if translated is None:
+            raise GeoAlgorithmExecutionException(gdal.GetLastErrorMsg())
+        translated = None
+        return True
+
     @staticmethod
     def escapeAndJoin(strList):
         joined = ''
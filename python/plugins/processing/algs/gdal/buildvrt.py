@@ -43,6 +43,9 @@ pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 class buildvrt(GdalAlgorithm):
 
+    # the output is always a VRT
+    virtualRasterOutputs = True
+
     INPUT = 'INPUT'
     OUTPUT = 'OUTPUT'
     RESOLUTION = 'RESOLUTION'
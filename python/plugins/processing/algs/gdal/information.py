@@ -78,10 +78,10 @@ class information(GdalAlgorithm):
         return ['gdalinfo', GdalUtils.escapeAndJoin(arguments)]
 
     def processAlgorithm(self, context, feedback):
-        GdalUtils.runGdal(self.getConsoleCommands(), feedback)
+        consoleOutput = GdalUtils.runGdal(self.getConsoleCommands(), feedback)
         output = self.getOutputValue(information.OUTPUT)
         with open(output, 'w') as f:
             f.write('<pre>')
-            for s in GdalUtils.getConsoleOutput()[1:]:
+            for s in consoleOutput[1:]:
                 f.write(str(s))
             f.write('</pre>')
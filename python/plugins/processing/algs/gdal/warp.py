@@ -46,6 +46,9 @@ pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 class warp(GdalAlgorithm):
 
+    # gdalwarp can write a warped VRT referencing the input
+    virtualRasterOutputs = True
+
     INPUT = 'INPUT'
     OUTPUT = 'OUTPUT'
     SOURCE_SRS = 'SOURCE_SRS'
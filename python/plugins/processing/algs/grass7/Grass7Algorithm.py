@@ -60,7 +60,8 @@ from processing.core.outputs import (getOutputFromString,
                                      OutputFile,
                                      OutputHTML)
 
-from .Grass7Utils import Grass7Utils
+from .Grass7Utils import Grass7Utils, Grass7Session
+from .Grass7Pool import Grass7Pool
 
 from processing.tools import dataobjects, system
 
@@ -79,6 +80,12 @@ class Grass7Algorithm(GeoAlgorithm):
 
     OUTPUT_TYPES = ['auto', 'point', 'line', 'area']
 
+    # modules with random results, which are never reused from the result cache
+    STOCHASTIC_MODULES = ['r.random', 'r.random.cells', 'r.random.raster',
+                          'r.random.surface', 'r.surf.random', 'r.surf.gauss',
+                          'r.surf.fractal', 'r.sim.water', 'r.sim.sediment',
+                          'v.random', 'v.perturb', 'v.kcv', 'v.qcount']
+
     def __init__(self, descriptionfile):
         GeoAlgorithm.__init__(self)
         self._name = ''
@@ -89,6 +96,7 @@ class Grass7Algorithm(GeoAlgorithm):
         self.defineCharacteristicsFromFile()
         self.numExportedLayers = 0
         self.uniqueSuffix = str(uuid.uuid4()).replace('-', '')
+        self.session = None
 
         # Use the ext mechanism
         name = self.name().replace('.', '_')
@@ -100,6 +108,13 @@ class Grass7Algorithm(GeoAlgorithm):
     def getCopy(self):
         return self
 
+    def getIndependentCopy(self):
+        newone = GeoAlgorithm.getIndependentCopy(self)
+        # Copies running in the same session must not overwrite the
+        # outputs of each other
+        newone.uniqueSuffix = str(uuid.uuid4()).replace('-', '')
+        return newone
+
     def name(self):
         return self._name
 
@@ -148,6 +163,7 @@ class Grass7Algorithm(GeoAlgorithm):
         with open(self.descriptionFile) as lines:
             line = lines.readline().strip('\n').strip()
             self.grass7Name = line
+            self.useResultCache = self.grass7Name not in self.STOCHASTIC_MODULES
             line = lines.readline().strip('\n').strip()
             self._name = line
             self._display_name = QCoreApplication.translate("GrassAlgorithm", line)
@@ -262,13 +278,30 @@ class Grass7Algorithm(GeoAlgorithm):
 
         # If GRASS session has been created outside of this algorithm then
         # get the list of layers loaded in GRASS otherwise start a new
-        # session
-        existingSession = Grass7Utils.sessionRunning
-        if existingSession:
-            self.exportedLayers = Grass7Utils.getSessionLayers()
+        # session, or reuse a pooled location and the layers imported
+        # into it by previous executions
+        existingSession = Grass7Utils.session
+        if existingSession is not None:
+            with existingSession.lock:
+                self.session = existingSession
+                self.exportedLayers = Grass7Utils.getSessionLayers()
+                self.runGrass7(feedback)
+                Grass7Utils.addSessionLayers(self.exportedLayers)
+        elif Grass7Pool.canUse(self):
+            with Grass7Pool.session(self) as session:
+                self.session = session
+                self.runGrass7(feedback)
         else:
-            Grass7Utils.startGrass7Session()
-
+            self.session = Grass7Session()
+            Grass7Utils.createTempMapset(self.session)
+            try:
+                self.runGrass7(feedback)
+            finally:
+                self.session.remove()
+        self.session = None
+
+    def runGrass7(self, feedback):
+        """Prepare and run the GRASS commands of the algorithm"""
         # Handle ext functions for inputs/command/outputs
         if self.module:
             if hasattr(self.module, 'processInputs'):
@@ -302,7 +335,7 @@ class Grass7Algorithm(GeoAlgorithm):
         if ProcessingConfig.getSetting(Grass7Utils.GRASS_LOG_COMMANDS):
             QgsMessageLog.logMessage("\n".join(loglines), self.tr('Processing'), QgsMessageLog.INFO)
 
-        Grass7Utils.executeGrass7(self.commands, feedback, self.outputCommands)
+        Grass7Utils.executeGrass7(self.session, self.commands, feedback, self.outputCommands)
 
         for out in self.outputs:
             if isinstance(out, OutputHTML):
@@ -311,13 +344,6 @@ class Grass7Algorithm(GeoAlgorithm):
                 with open(out.value, "w") as f:
                     f.write("<pre>%s</pre>" % rawOutput)
 
-        # If the session has been created outside of this algorithm, add
-        # the new GRASS GIS 7 layers to it otherwise finish the session
-        if existingSession:
-            Grass7Utils.addSessionLayers(self.exportedLayers)
-        else:
-            Grass7Utils.endGrass7Session()
-
     def processInputs(self):
         """Prepare the GRASS import commands"""
         for param in self.parameters:
@@ -332,7 +358,9 @@ class Grass7Algorithm(GeoAlgorithm):
                     continue
                 else:
                     self.setSessionProjectionFromLayer(value, self.commands)
-                    self.commands.append(self.exportRasterLayer(value))
+                    command = self.exportRasterLayer(value)
+                    if command:
+                        self.commands.append(command)
             if isinstance(param, ParameterVector):
                 if param.value is None:
                     continue
@@ -341,7 +369,9 @@ class Grass7Algorithm(GeoAlgorithm):
                     continue
                 else:
                     self.setSessionProjectionFromLayer(value, self.commands)
-                    self.commands.append(self.exportVectorLayer(value))
+                    command = self.exportVectorLayer(value)
+                    if command:
+                        self.commands.append(command)
             if isinstance(param, ParameterTable):
                 pass
             if isinstance(param, ParameterMultipleInput):
@@ -356,7 +386,9 @@ class Grass7Algorithm(GeoAlgorithm):
                             continue
                         else:
                             self.setSessionProjectionFromLayer(layer, self.commands)
-                            self.commands.append(self.exportRasterLayer(layer))
+                            command = self.exportRasterLayer(layer)
+                            if command:
+                                self.commands.append(command)
                 elif param.datatype in [dataobjects.TYPE_VECTOR_ANY,
                                         dataobjects.TYPE_VECTOR_LINE,
                                         dataobjects.TYPE_VECTOR_POLYGON,
@@ -366,7 +398,9 @@ class Grass7Algorithm(GeoAlgorithm):
                             continue
                         else:
                             self.setSessionProjectionFromLayer(layer, self.commands)
-                            self.commands.append(self.exportVectorLayer(layer))
+                            command = self.exportVectorLayer(layer)
+                            if command:
+                                self.commands.append(command)
 
         self.setSessionProjectionFromProject(self.commands)
 
@@ -508,6 +542,16 @@ class Grass7Algorithm(GeoAlgorithm):
                 self.outputCommands.append(command)
 
     def exportVectorLayer(self, orgFilename):
+        min_area = self.getParameterValue(self.GRASS_MIN_AREA_PARAMETER)
+        snap = self.getParameterValue(self.GRASS_SNAP_TOLERANCE_PARAMETER)
+
+        # Skip the import if the layer is already in the pooled location
+        key = Grass7Pool.importKey(self.session, orgFilename, ['v.in.ogr', min_area, snap])
+        cached = Grass7Pool.cachedImport(self.session, key)
+        if cached:
+            self.exportedLayers[orgFilename] = cached
+            return None
+
         context = dataobjects.createContext()
 
         # TODO: improve this. We are now exporting if it is not a shapefile,
@@ -530,10 +574,9 @@ class Grass7Algorithm(GeoAlgorithm):
                 filename = orgFilename
         destFilename = 'a' + os.path.basename(self.getTempFilename())
         self.exportedLayers[orgFilename] = destFilename
+        Grass7Pool.addImport(self.session, key, destFilename, 'vector')
         command = 'v.in.ogr'
-        min_area = self.getParameterValue(self.GRASS_MIN_AREA_PARAMETER)
         command += ' min_area=' + str(min_area)
-        snap = self.getParameterValue(self.GRASS_SNAP_TOLERANCE_PARAMETER)
         command += ' snap=' + str(snap)
         command += ' input="' + os.path.dirname(filename) + '"'
         command += ' layer=' + os.path.basename(filename)[:-4]
@@ -542,17 +585,17 @@ class Grass7Algorithm(GeoAlgorithm):
         return command
 
     def setSessionProjectionFromProject(self, commands):
-        if not Grass7Utils.projectionSet and iface:
+        if not self.session.projectionSet and iface:
             proj4 = iface.mapCanvas().mapSettings().destinationCrs().toProj4()
             command = 'g.proj'
             command += ' -c'
             command += ' proj4="' + proj4 + '"'
             self.commands.append(command)
-            Grass7Utils.projectionSet = True
+            self.session.projectionSet = True
 
     def setSessionProjectionFromLayer(self, layer, commands):
         context = dataobjects.createContext()
-        if not Grass7Utils.projectionSet:
+        if not self.session.projectionSet:
             qGisLayer = QgsProcessingUtils.mapLayerFromString(layer, context)
             if qGisLayer:
                 proj4 = str(qGisLayer.crs().toProj4())
@@ -560,11 +603,18 @@ class Grass7Algorithm(GeoAlgorithm):
                 command += ' -c'
                 command += ' proj4="' + proj4 + '"'
                 self.commands.append(command)
-                Grass7Utils.projectionSet = True
+                self.session.projectionSet = True
 
     def exportRasterLayer(self, layer):
+        key = Grass7Pool.importKey(self.session, layer, ['r.external', 1])
+        cached = Grass7Pool.cachedImport(self.session, key)
+        if cached:
+            self.exportedLayers[layer] = cached
+            return None
+
         destFilename = 'a' + os.path.basename(self.getTempFilename())
         self.exportedLayers[layer] = destFilename
+        Grass7Pool.addImport(self.session, key, destFilename, 'raster')
         command = 'r.external'
         command += ' input="' + layer + '"'
         command += ' band=1'
@@ -70,6 +70,15 @@ class Grass7AlgorithmProvider(QgsProcessingProvider):
             Grass7Utils.GRASS_HELP_PATH,
             self.tr('Location of GRASS docs'),
             Grass7Utils.grassHelpPath()))
+        ProcessingConfig.addSetting(Setting(
+            self.name(),
+            Grass7Utils.GRASS_USE_POOL,
+            self.tr('Keep imported layers between executions'), False))
+        ProcessingConfig.addSetting(Setting(
+            self.name(),
+            Grass7Utils.GRASS_POOL_SIZE,
+            self.tr('Maximum size of kept imported layers (MB)'), 2048,
+            valuetype=Setting.INT))
         ProcessingConfig.readSettings()
         self.refreshAlgorithms()
         return True
@@ -81,6 +90,8 @@ class Grass7AlgorithmProvider(QgsProcessingProvider):
         ProcessingConfig.removeSetting(Grass7Utils.GRASS_LOG_COMMANDS)
         ProcessingConfig.removeSetting(Grass7Utils.GRASS_LOG_CONSOLE)
         ProcessingConfig.removeSetting(Grass7Utils.GRASS_HELP_PATH)
+        ProcessingConfig.removeSetting(Grass7Utils.GRASS_USE_POOL)
+        ProcessingConfig.removeSetting(Grass7Utils.GRASS_POOL_SIZE)
 
     def isActive(self):
         return ProcessingConfig.getSetting('ACTIVATE_GRASS7')
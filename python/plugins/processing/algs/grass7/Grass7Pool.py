@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    Grass7Pool.py
+    ---------------------
+    Date                 : June 2017
+    Copyright            : (C) 2017 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'June 2017'
+__copyright__ = '(C) 2017, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import itertools
+from contextlib import contextmanager
+
+from qgis.core import QgsProcessingUtils, QgsVectorLayer
+from qgis.utils import iface
+
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.core.parameters import (ParameterRaster,
+                                        ParameterVector,
+                                        ParameterMultipleInput)
+from processing.tools import dataobjects
+from processing.tools.system import userFolder, mkdir, relatedFiles, isWindows
+
+from .Grass7Utils import Grass7Utils, Grass7Session
+
+
+class Grass7Pool(object):
+
+    """Keeps GRASS locations alive between executions of GRASS
+    algorithms, so the layers imported by an execution can be used again
+    by the following ones instead of being imported each time.
+
+    Locations are created for each CRS, and are locked by the execution
+    using them with a lock file next to the location folder. When all
+    the locations for a CRS are in use, a new one is added to the pool,
+    so executions running at the same time (in this or in other
+    processes) never share a location.
+
+    Imported layers are identified by a fingerprint of their source
+    (path, size and modification time of its files, subset string,
+    selected features) and the import options. Each location has a
+    manifest with the GRASS maps of the imported layers and the time
+    they were last used, which is used to remove the least recently
+    used ones when the pool grows beyond its size limit. Any other map
+    (the outputs of the algorithms) is removed after each execution.
+    """
+
+    MANIFEST = 'processing_imports.json'
+    RASTER_ELEMENTS = ['cell', 'cellhd', 'cats', 'colr', 'fcell', 'hist',
+                       'cell_misc', 'grid3', 'group']
+
+    # age of the lock of a location after which it is considered left
+    # behind by a crashed process, on platforms where the process that
+    # created it can not be checked
+    STALE_LOCK_AGE = 24 * 3600
+
+    @staticmethod
+    def isEnabled():
+        return bool(ProcessingConfig.getSetting(Grass7Utils.GRASS_USE_POOL))
+
+    @staticmethod
+    def poolFolder():
+        folder = os.path.join(userFolder(), 'grass7_pool')
+        mkdir(folder)
+        return folder
+
+    @staticmethod
+    def maxSize():
+        try:
+            return float(ProcessingConfig.getSetting(Grass7Utils.GRASS_POOL_SIZE)) * 1024 * 1024
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def canUse(alg):
+        """Returns True if an algorithm can run in a pooled location.
+        Algorithms with their own input, command or output handling
+        might modify the imported maps (e.g. r.colors, r.null, v.edit),
+        so they always import their inputs in a new location.
+        """
+        if not Grass7Pool.isEnabled():
+            return False
+        if alg.module is None:
+            return True
+        return not any(hasattr(alg.module, f) for f in
+                       ['processInputs', 'processCommand', 'processOutputs'])
+
+    @staticmethod
+    def inputProj4(alg):
+        """Returns the proj4 definition GRASS will use for the location of
+        an algorithm: the CRS of its first input layer or, if there is
+        none, the CRS of the map canvas.
+        """
+        context = dataobjects.createContext()
+        for param in alg.parameters:
+            if param.value is None:
+                continue
+            if isinstance(param, (ParameterRaster, ParameterVector)):
+                sources = [param.value]
+            elif isinstance(param, ParameterMultipleInput) and param.datatype in [
+                    dataobjects.TYPE_RASTER,
+                    dataobjects.TYPE_VECTOR_ANY,
+                    dataobjects.TYPE_VECTOR_LINE,
+                    dataobjects.TYPE_VECTOR_POLYGON,
+                    dataobjects.TYPE_VECTOR_POINT]:
+                sources = param.value.split(';')
+            else:
+                continue
+            for source in sources:
+                layer = QgsProcessingUtils.mapLayerFromString(source, context)
+                if layer:
+                    return str(layer.crs().toProj4())
+        if iface:
+            return iface.mapCanvas().mapSettings().destinationCrs().toProj4()
+        return ''
+
+    @staticmethod
+    @contextmanager
+    def session(alg):
+        """Returns a context manager with a GRASS session for a free
+        pooled location for the CRS of an algorithm.
+        """
+        proj4 = Grass7Pool.inputProj4(alg)
+        name = 'location_' + hashlib.sha1(proj4.encode('utf-8')).hexdigest()[:16]
+        pool = Grass7Pool.poolFolder()
+        for i in itertools.count():
+            folder = os.path.join(pool, '{}_{}'.format(name, i))
+            if Grass7Pool.lock(folder):
+                break
+
+        session = Grass7Session(folder)
+        try:
+            if not os.path.isdir(os.path.join(folder, 'PERMANENT')):
+                Grass7Utils.createTempMapset(session)
+            # g.proj writes PROJ_INFO when the projection of the location
+            # is set by a previous execution
+            session.projectionSet = os.path.exists(
+                os.path.join(folder, 'PERMANENT', 'PROJ_INFO'))
+            session.manifest = Grass7Pool.readManifest(folder)
+            session.pooled = True
+            yield session
+        finally:
+            try:
+                if session.pooled:
+                    Grass7Pool.release(session)
+            finally:
+                session.close()
+                Grass7Pool.unlock(folder)
+
+    @staticmethod
+    def lock(folder):
+        """Locks a pooled location for an execution. Returns False if it
+        is used by another one.
+        """
+        lockFile = folder + '.lock'
+        try:
+            fd = os.open(lockFile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            if not Grass7Pool.isStale(lockFile):
+                return False
+            try:
+                os.remove(lockFile)
+                fd = os.open(lockFile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError:
+                return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+
+    @staticmethod
+    def unlock(folder):
+        try:
+            os.remove(folder + '.lock')
+        except OSError:
+            pass
+
+    @staticmethod
+    def isStale(lockFile):
+        try:
+            with open(lockFile) as f:
+                pid = int(f.read())
+        except (IOError, OSError, ValueError):
+            # the lock is being created
+            return False
+        if pid == os.getpid():
+            return False
+        if isWindows():
+            try:
+                return time.time() - os.path.getmtime(lockFile) > Grass7Pool.STALE_LOCK_AGE
+            except OSError:
+                return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    @staticmethod
+    def importKey(session, source, options):
+        """Returns the fingerprint of a layer source imported with a list
+        of options, or None if the session is not a pooled one or the
+        source is not a file.
+        """
+        if session is None or not session.pooled:
+            return None
+        path = source.split('|')[0]
+        if not os.path.isfile(path):
+            return None
+
+        values = [source, [str(o) for o in options]]
+        for f in sorted(relatedFiles(path)):
+            stat = os.stat(f)
+            values.append((os.path.basename(f), stat.st_size, stat.st_mtime))
+
+        context = dataobjects.createContext()
+        layer = QgsProcessingUtils.mapLayerFromString(source, context, False)
+        if isinstance(layer, QgsVectorLayer):
+            values.append(layer.subsetString())
+            if ProcessingConfig.getSetting(ProcessingConfig.USE_SELECTED) \
+                    and layer.selectedFeatureCount():
+                values.append(sorted(layer.selectedFeatureIds()))
+
+        return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def cachedImport(session, key):
+        """Returns the GRASS map a layer was imported to by a previous
+        execution, or None.
+        """
+        if key is None or key not in session.manifest:
+            return None
+        entry = session.manifest[key]
+        if not Grass7Pool.mapFiles(session.locationFolder, entry):
+            del session.manifest[key]
+            return None
+        entry['lastUsed'] = time.time()
+        return entry['name']
+
+    @staticmethod
+    def addImport(session, key, name, mapType):
+        """Records the GRASS map a layer is imported to, so it is kept in
+        the location if the import succeeds.
+        """
+        if key is not None:
+            session.pendingImports[key] = {'name': name, 'type': mapType}
+
+    @staticmethod
+    def readManifest(folder):
+        try:
+            with open(os.path.join(folder, Grass7Pool.MANIFEST)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def writeManifest(folder, manifest):
+        with open(os.path.join(folder, Grass7Pool.MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+
+    @staticmethod
+    def mapFiles(folder, entry):
+        """Returns the files and folders of a GRASS map in a location."""
+        mapset = os.path.join(folder, 'PERMANENT')
+        if entry['type'] == 'vector':
+            elements = ['vector']
+        else:
+            elements = Grass7Pool.RASTER_ELEMENTS
+        paths = [os.path.join(mapset, e, entry['name']) for e in elements]
+        return [p for p in paths if os.path.exists(p)]
+
+    @staticmethod
+    def removeMap(folder, entry):
+        for path in Grass7Pool.mapFiles(folder, entry):
+            if os.path.isdir(path):
+                shutil.rmtree(path, True)
+            else:
+                os.remove(path)
+        if entry['type'] != 'vector':
+            return
+
+        # attribute tables of vector maps are named after the map and
+        # its layers
+        database = os.path.join(folder, 'PERMANENT', 'sqlite', 'sqlite.db')
+        if not os.path.isfile(database):
+            return
+        connection = sqlite3.connect(database)
+        try:
+            tables = [r[0] for r in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table'")]
+            for table in tables:
+                if table == entry['name'] or table.startswith(entry['name'] + '_'):
+                    connection.execute('DROP TABLE "{}"'.format(table))
+            connection.commit()
+        except sqlite3.Error:
+            pass
+        finally:
+            connection.close()
+
+    @staticmethod
+    def release(session):
+        """Adds the layers imported by an execution to the manifest of
+        its location, removes any other map and evicts the least
+        recently used imports if the pool is too large.
+        """
+        folder = session.locationFolder
+        manifest = session.manifest
+        now = time.time()
+        for key, entry in session.pendingImports.items():
+            if Grass7Pool.mapFiles(folder, entry):
+                entry['lastUsed'] = now
+                manifest[key] = entry
+
+        kept = set(e['name'] for e in manifest.values())
+        mapset = os.path.join(folder, 'PERMANENT')
+        for mapType, elements in [('vector', ['vector']),
+                                  ('raster', Grass7Pool.RASTER_ELEMENTS)]:
+            names = set()
+            for element in elements:
+                if os.path.isdir(os.path.join(mapset, element)):
+                    names.update(os.listdir(os.path.join(mapset, element)))
+            for name in names - kept:
+                Grass7Pool.removeMap(folder, {'name': name, 'type': mapType})
+
+        Grass7Pool.writeManifest(folder, manifest)
+        Grass7Pool.evict(folder)
+
+    @staticmethod
+    def evict(current):
+        """Removes the least recently used imported layers of the pooled
+        locations not used by other executions, until the pool fits in
+        its maximum size. Locations left without imported layers are
+        removed, except the current one.
+        """
+        pool = Grass7Pool.poolFolder()
+        locked = []
+        manifests = {}
+        entries = []
+        total = 0
+        try:
+            for name in os.listdir(pool):
+                folder = os.path.join(pool, name)
+                if not os.path.isdir(os.path.join(folder, 'PERMANENT')):
+                    continue
+                if folder != current:
+                    if not Grass7Pool.lock(folder):
+                        continue
+                    locked.append(folder)
+                manifests[folder] = Grass7Pool.readManifest(folder)
+                for key, entry in manifests[folder].items():
+                    size = 0
+                    for path in Grass7Pool.mapFiles(folder, entry):
+                        if os.path.isdir(path):
+                            for root, dirs, files in os.walk(path):
+                                size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+                        else:
+                            size += os.path.getsize(path)
+                    entries.append((entry.get('lastUsed', 0), size, folder, key))
+                    total += size
+
+            maxSize = Grass7Pool.maxSize()
+            changed = set()
+            for lastUsed, size, folder, key in sorted(entries):
+                if total <= maxSize:
+                    break
+                Grass7Pool.removeMap(folder, manifests[folder].pop(key))
+                changed.add(folder)
+                total -= size
+
+            for folder in changed:
+                Grass7Pool.writeManifest(folder, manifests[folder])
+            for folder in locked:
+                if not manifests[folder]:
+                    shutil.rmtree(folder, True)
+        finally:
+            for folder in locked:
+                Grass7Pool.unlock(folder)
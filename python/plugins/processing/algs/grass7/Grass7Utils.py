@@ -28,7 +28,9 @@ __copyright__ = '(C) 2014-2015, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import stat
+import uuid
 import shutil
+import threading
 import subprocess
 import os
 
@@ -37,7 +39,7 @@ from qgis.core import (QgsApplication,
                        QgsMessageLog)
 from qgis.PyQt.QtCore import QCoreApplication
 from processing.core.ProcessingConfig import ProcessingConfig
-from processing.tools.system import userFolder, isWindows, isMac, tempFolder, mkdir
+from processing.tools.system import isWindows, isMac, tempFolder, mkdir, getTempDirInTempFolder
 from processing.tests.TestData import points
 
 
@@ -52,10 +54,12 @@ class Grass7Utils(object):
     GRASS_LOG_COMMANDS = 'GRASS7_LOG_COMMANDS'
     GRASS_LOG_CONSOLE = 'GRASS7_LOG_CONSOLE'
     GRASS_HELP_PATH = 'GRASS_HELP_PATH'
+    GRASS_USE_POOL = 'GRASS7_USE_POOL'
+    GRASS_POOL_SIZE = 'GRASS7_POOL_SIZE'
 
-    sessionRunning = False
-    sessionLayers = {}
-    projectionSet = False
+    # session started with startGrass7Session, shared by the following
+    # executions until endGrass7Session is called
+    session = None
 
     isGrass7Installed = False
 
@@ -64,23 +68,27 @@ class Grass7Utils(object):
     command = None
 
     @staticmethod
-    def grassBatchJobFilename():
+    def grassBatchJobFilename(session):
         '''This is used in Linux. This is the batch job that we assign to
         GRASS_BATCH_JOB and then call GRASS and let it do the work
         '''
         filename = 'grass7_batch_job.sh'
-        batchfile = os.path.join(userFolder(), filename)
+        batchfile = os.path.join(session.jobFolder, filename)
         return batchfile
 
     @staticmethod
-    def grassScriptFilename():
+    def grassScriptFilename(session):
         '''This is used in windows. We create a script that initializes
         GRASS and then uses grass commands
         '''
         filename = 'grass7_script.bat'
-        filename = os.path.join(userFolder(), filename)
+        filename = os.path.join(session.jobFolder, filename)
         return filename
 
+    @staticmethod
+    def grassGisrcFilename(session):
+        return os.path.join(session.jobFolder, 'processing.gisrc7')
+
     @staticmethod
     def installedVersion(run=False):
         if Grass7Utils.isGrass7Installed and not run:
@@ -144,16 +152,15 @@ class Grass7Utils(object):
         return os.path.join(os.path.dirname(__file__), 'description')
 
     @staticmethod
-    def createGrass7Script(commands):
+    def createGrass7Script(commands, session):
         folder = Grass7Utils.grassPath()
 
-        script = Grass7Utils.grassScriptFilename()
-        gisrc = os.path.join(userFolder(), 'processing.gisrc7')  # FIXME: use temporary file
+        script = Grass7Utils.grassScriptFilename(session)
+        gisrc = Grass7Utils.grassGisrcFilename(session)
 
         # Temporary gisrc file
         with open(gisrc, 'w') as output:
-            location = 'temp_location'
-            gisdbase = Grass7Utils.grassDataFolder()
+            gisdbase, location = os.path.split(Grass7Utils.grassMapsetFolder(session))
 
             output.write('GISDBASE: ' + gisdbase + '\n')
             output.write('LOCATION_NAME: ' + location + '\n')
@@ -191,15 +198,15 @@ class Grass7Utils(object):
             output.write('exit\n')
 
     @staticmethod
-    def createGrass7BatchJobFileFromGrass7Commands(commands):
-        with open(Grass7Utils.grassBatchJobFilename(), 'w') as fout:
+    def createGrass7BatchJobFileFromGrass7Commands(commands, session):
+        with open(Grass7Utils.grassBatchJobFilename(session), 'w') as fout:
             for command in commands:
                 Grass7Utils.writeCommand(fout, command)
             fout.write('exit')
 
     @staticmethod
-    def grassMapsetFolder():
-        folder = os.path.join(Grass7Utils.grassDataFolder(), 'temp_location')
+    def grassMapsetFolder(session):
+        folder = session.locationFolder
         mkdir(folder)
         return folder
 
@@ -210,7 +217,7 @@ class Grass7Utils(object):
         return tempfolder
 
     @staticmethod
-    def createTempMapset():
+    def createTempMapset(session):
         '''Creates a temporary location and mapset(s) for GRASS data
         processing. A minimal set of folders and files is created in the
         system's default temporary directory. The settings files are
@@ -219,7 +226,7 @@ class Grass7Utils(object):
         input image or vector
         '''
 
-        folder = Grass7Utils.grassMapsetFolder()
+        folder = Grass7Utils.grassMapsetFolder(session)
         mkdir(os.path.join(folder, 'PERMANENT'))
         mkdir(os.path.join(folder, 'PERMANENT', '.tmp'))
         Grass7Utils.writeGrass7Window(os.path.join(folder, 'PERMANENT', 'DEFAULT_WIND'))
@@ -256,35 +263,34 @@ class Grass7Utils(object):
             out.write('t-b resol:  1\n')
 
     @staticmethod
-    def prepareGrass7Execution(commands):
+    def prepareGrass7Execution(commands, session):
         env = os.environ.copy()
 
         if isWindows():
-            Grass7Utils.createGrass7Script(commands)
-            command = ['cmd.exe', '/C ', Grass7Utils.grassScriptFilename()]
+            Grass7Utils.createGrass7Script(commands, session)
+            command = ['cmd.exe', '/C ', Grass7Utils.grassScriptFilename(session)]
         else:
-            gisrc = os.path.join(userFolder(), 'processing.gisrc7')
-            env['GISRC'] = gisrc
+            env['GISRC'] = Grass7Utils.grassGisrcFilename(session)
             env['GRASS_MESSAGE_FORMAT'] = 'plain'
-            env['GRASS_BATCH_JOB'] = Grass7Utils.grassBatchJobFilename()
+            env['GRASS_BATCH_JOB'] = Grass7Utils.grassBatchJobFilename(session)
             if 'GISBASE' in env:
                 del env['GISBASE']
-            Grass7Utils.createGrass7BatchJobFileFromGrass7Commands(commands)
-            os.chmod(Grass7Utils.grassBatchJobFilename(), stat.S_IEXEC | stat.S_IREAD | stat.S_IWRITE)
+            Grass7Utils.createGrass7BatchJobFileFromGrass7Commands(commands, session)
+            os.chmod(Grass7Utils.grassBatchJobFilename(session), stat.S_IEXEC | stat.S_IREAD | stat.S_IWRITE)
             if isMac() and os.path.exists(os.path.join(Grass7Utils.grassPath(), 'grass.sh')):
                 command = os.path.join(Grass7Utils.grassPath(), 'grass.sh') + ' ' \
-                    + os.path.join(Grass7Utils.grassMapsetFolder(), 'PERMANENT')
+                    + os.path.join(Grass7Utils.grassMapsetFolder(session), 'PERMANENT')
             else:
-                command = Grass7Utils.command + ' ' + os.path.join(Grass7Utils.grassMapsetFolder(), 'PERMANENT')
+                command = Grass7Utils.command + ' ' + os.path.join(Grass7Utils.grassMapsetFolder(session), 'PERMANENT')
 
         return command, env
 
     @staticmethod
-    def executeGrass7(commands, feedback, outputCommands=None):
+    def executeGrass7(session, commands, feedback, outputCommands=None):
         loglines = []
         loglines.append(Grass7Utils.tr('GRASS GIS 7 execution console output'))
         grassOutDone = False
-        command, grassenv = Grass7Utils.prepareGrass7Execution(commands)
+        command, grassenv = Grass7Utils.prepareGrass7Execution(commands, session)
         with subprocess.Popen(
             command,
             shell=True,
@@ -313,7 +319,7 @@ class Grass7Utils(object):
         # commands again.
 
         if not grassOutDone and outputCommands:
-            command, grassenv = Grass7Utils.prepareGrass7Execution(outputCommands)
+            command, grassenv = Grass7Utils.prepareGrass7Execution(outputCommands, session)
             with subprocess.Popen(
                 command,
                 shell=True,
@@ -345,28 +351,29 @@ class Grass7Utils(object):
     # structure
     @staticmethod
     def startGrass7Session():
-        if not Grass7Utils.sessionRunning:
-            Grass7Utils.createTempMapset()
-            Grass7Utils.sessionRunning = True
+        if Grass7Utils.session is None:
+            session = Grass7Session()
+            Grass7Utils.createTempMapset(session)
+            Grass7Utils.session = session
 
     # End session by removing the temporary GRASS mapset and all
     # the layers.
     @staticmethod
     def endGrass7Session():
-        shutil.rmtree(Grass7Utils.grassMapsetFolder(), True)
-        Grass7Utils.sessionRunning = False
-        Grass7Utils.sessionLayers = {}
-        Grass7Utils.projectionSet = False
+        if Grass7Utils.session is not None:
+            Grass7Utils.session.remove()
+            Grass7Utils.session = None
 
     @staticmethod
     def getSessionLayers():
-        return Grass7Utils.sessionLayers
+        if Grass7Utils.session is None:
+            return {}
+        return Grass7Utils.session.layers
 
     @staticmethod
     def addSessionLayers(exportedLayers):
-        Grass7Utils.sessionLayers = dict(
-            list(Grass7Utils.sessionLayers.items()) +
-            list(exportedLayers.items()))
+        if Grass7Utils.session is not None:
+            Grass7Utils.session.layers.update(exportedLayers)
 
     @staticmethod
     def checkGrass7IsInstalled(ignorePreviousState=False):
@@ -456,3 +463,41 @@ class Grass7Utils(object):
         else:
             # grass not available!
             return 'http://grass.osgeo.org/72/manuals/'
+
+
+class Grass7Session(object):
+
+    """State of the GRASS location an algorithm is executed in: its
+    folder, whether its projection has been set, the layers already
+    available in it and the folder with the job files (batch job,
+    script and gisrc) of the executions. Each execution has its own
+    session, unless a shared one has been started with
+    Grass7Utils.startGrass7Session, so several algorithms can run at
+    the same time.
+    """
+
+    def __init__(self, locationFolder=None):
+        if locationFolder is None:
+            locationFolder = os.path.join(Grass7Utils.grassDataFolder(),
+                                          'temp_location_' + uuid.uuid4().hex)
+        self.locationFolder = locationFolder
+        self.jobFolder = getTempDirInTempFolder()
+        self.projectionSet = False
+        self.layers = {}
+
+        # executions sharing the session are run one at a time
+        self.lock = threading.Lock()
+
+        # imported layers of a pooled location (see Grass7Pool)
+        self.pooled = False
+        self.manifest = {}
+        self.pendingImports = {}
+
+    def close(self):
+        """Removes the job files, keeping the location"""
+        shutil.rmtree(self.jobFolder, True)
+
+    def remove(self):
+        """Removes the job files and the location"""
+        self.close()
+        shutil.rmtree(self.locationFolder, True)
@@ -139,7 +139,7 @@ def regroupRasters(alg, field, groupField, subgroupField=None, extFile=None):
             extFileName = alg.getParameterValue(ext)
             if extFileName:
                 shortFileName = path.basename(extFileName)
-                destPath = path.join(Grass7Utils.grassMapsetFolder(),
+                destPath = path.join(Grass7Utils.grassMapsetFolder(alg.session),
                                      'PERMANENT',
                                      'group', group.value,
                                      'subgroup', subgroup.value,
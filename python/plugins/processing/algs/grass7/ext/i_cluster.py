@@ -54,6 +54,6 @@ def processCommand(alg):
     alg.addOutput(reportFile)
 
     # Find Grass directory
-    interSig = path.join(Grass7Utils.grassMapsetFolder(), 'PERMANENT', 'group', group, 'subgroup', subgroup, 'sig', shortSigFile)
+    interSig = path.join(Grass7Utils.grassMapsetFolder(alg.session), 'PERMANENT', 'group', group, 'subgroup', subgroup, 'sig', shortSigFile)
     moveFile(alg, interSig, origSigFile)
     alg.setOutputValue('signaturefile', origSigFile)
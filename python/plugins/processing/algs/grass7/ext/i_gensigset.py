@@ -47,6 +47,6 @@ def processCommand(alg):
     alg.addOutput(signatureFile)
 
     # Find Grass directory
-    interSig = path.join(Grass7Utils.grassMapsetFolder(), 'PERMANENT', 'group', group, 'subgroup', subgroup, 'sigset', shortSigFile)
+    interSig = path.join(Grass7Utils.grassMapsetFolder(alg.session), 'PERMANENT', 'group', group, 'subgroup', subgroup, 'sigset', shortSigFile)
     moveFile(alg, interSig, origSigFile)
     alg.setOutputValue('signaturefile', origSigFile)
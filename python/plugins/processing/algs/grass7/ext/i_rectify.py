@@ -63,7 +63,7 @@ def processCommand(alg):
     # Handle POINT File
     gcp = alg.getParameterFromName('gcp')
     extFileName = gcp.value
-    destPath = path.join(Grass7Utils.grassMapsetFolder(),
+    destPath = path.join(Grass7Utils.grassMapsetFolder(alg.session),
                          'PERMANENT',
                          'group', group.value,
                          'POINTS')
@@ -41,7 +41,7 @@ from processing.core.parameters import ParameterMultipleInput
 from processing.core.parameters import ParameterExtent
 from processing.core.parameters import ParameterNumber
 from processing.core.parameters import ParameterRaster
-from .Grass7Utils import Grass7Utils
+from .Grass7Utils import Grass7Utils, Grass7Session
 from processing.tools.system import getNumExportedLayers
 from processing.tools import dataobjects
 
@@ -139,8 +139,12 @@ class nviz7(GeoAlgorithm):
         if elevation is None and vector is None:
             command += ' -q'
         commands.append(command)
-        Grass7Utils.createTempMapset()
-        Grass7Utils.executeGrass7(commands, feedback)
+        session = Grass7Session()
+        Grass7Utils.createTempMapset(session)
+        try:
+            Grass7Utils.executeGrass7(session, commands, feedback)
+        finally:
+            session.remove()
 
     def getTempFilename(self):
         filename = 'tmp' + str(time.time()).replace('.', '') \
@@ -27,6 +27,19 @@ __revision__ = '$Format:%H$'
 
 from qgis.core import QgsFeature, QgsGeometry, QgsProcessingUtils
 
+from processing.tools import parallel
+
+
+def bufferFeature(geometry, attributes, distance, field, useField, segments,
+                  endCapStyle, joinStyle, mitreLimit):
+    if useField:
+        value = attributes[field]
+    else:
+        value = distance
+    if geometry is not None:
+        geometry = geometry.buffer(float(value), segments, endCapStyle, joinStyle, mitreLimit)
+    return [(geometry, attributes)]
+
 
 def buffering(feedback, context, writer, distance, field, useField, layer, dissolve, segments, endCapStyle=1,
               joinStyle=1, mitreLimit=2):
@@ -62,20 +75,9 @@ def buffering(feedback, context, writer, distance, field, useField, layer, disso
         outFeat.setAttributes(attrs)
         writer.addFeature(outFeat)
     else:
-        # Without dissolve
-        for inFeat in features:
-            attrs = inFeat.attributes()
-            if useField:
-                value = attrs[field]
-            else:
-                value = distance
-            inGeom = inFeat.geometry()
-            outFeat = QgsFeature()
-            outGeom = inGeom.buffer(float(value), segments, endCapStyle, joinStyle, mitreLimit)
-            outFeat.setGeometry(outGeom)
-            outFeat.setAttributes(attrs)
-            writer.addFeature(outFeat)
-            current += 1
-            feedback.setProgress(int(current * total))
+        # Without dissolve every feature is buffered on its own, which
+        # can be spread over worker processes
+        parallel.mapFeatures(layer, context, feedback, writer, bufferFeature,
+                             (distance, field, useField, segments, endCapStyle, joinStyle, mitreLimit))
 
     del writer
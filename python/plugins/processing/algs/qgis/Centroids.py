@@ -30,17 +30,26 @@ import os
 from qgis.PyQt.QtGui import QIcon
 
 from qgis.core import (QgsWkbTypes,
-                       QgsProcessingUtils,
-                       QgsMessageLog)
+                       QgsProcessingUtils)
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.outputs import OutputVector
-from processing.tools import dataobjects
+from processing.tools import dataobjects, parallel
 
 pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 
+def centroid(geometry, attributes):
+    if geometry is not None:
+        output_geometry = geometry.centroid()
+        if not output_geometry:
+            # logged with the feature id by parallel.mapFeatures
+            return [(output_geometry, attributes, 'Error calculating centroid for feature {}')]
+        geometry = output_geometry
+    return [(geometry, attributes)]
+
+
 class Centroids(GeoAlgorithm):
 
     INPUT_LAYER = 'INPUT_LAYER'
@@ -70,17 +79,6 @@ class Centroids(GeoAlgorithm):
         writer = self.getOutputFromName(
             self.OUTPUT_LAYER).getVectorWriter(layer.fields(), QgsWkbTypes.Point, layer.crs(), context)
 
-        features = QgsProcessingUtils.getFeatures(layer, context)
-        total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
-        for current, input_feature in enumerate(features):
-            output_feature = input_feature
-            if input_feature.geometry():
-                output_geometry = input_feature.geometry().centroid()
-                if not output_geometry:
-                    QgsMessageLog.logMessage('Error calculating centroid for feature {}'.format(input_feature.id()), self.tr('Processing'), QgsMessageLog.WARNING)
-                output_feature.setGeometry(output_geometry)
-
-            writer.addFeature(output_feature)
-            feedback.setProgress(int(current * total))
+        parallel.mapFeatures(layer, context, feedback, writer, centroid)
 
         del writer
@@ -39,7 +39,7 @@ from qgis.core import (QgsFeature,
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.outputs import OutputVector
-from processing.tools import dataobjects
+from processing.tools import dataobjects, vector
 
 pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
@@ -94,11 +94,13 @@ class Clip(GeoAlgorithm):
         engine = QgsGeometry.createGeometryEngine(combined_clip_geom.geometry())
         engine.prepareGeometry()
 
+        # read the input features within the clip extent once
+        cache = vector.FeatureCache(source_layer, context, extent=combined_clip_geom.boundingBox())
+
         tested_feature_ids = set()
 
         for i, clip_geom in enumerate(clip_geoms):
-            input_features = [f for f in QgsProcessingUtils.getFeatures(source_layer, context,
-                                                                        QgsFeatureRequest().setFilterRect(clip_geom.boundingBox()))]
+            input_features = cache.candidates(clip_geom.boundingBox())
 
             if not input_features:
                 continue
@@ -108,34 +110,30 @@ class Clip(GeoAlgorithm):
             else:
                 total = 0
 
-            for current, in_feat in enumerate(input_features):
-                if not in_feat.geometry():
-                    continue
-
-                if in_feat.id() in tested_feature_ids:
+            for current, (fid, cur_geom, attributes) in enumerate(input_features):
+                if fid in tested_feature_ids:
                     # don't retest a feature we have already checked
                     continue
 
-                tested_feature_ids.add(in_feat.id())
+                tested_feature_ids.add(fid)
 
-                if not engine.intersects(in_feat.geometry().geometry()):
+                if not engine.intersects(cur_geom.geometry()):
                     continue
 
-                if not engine.contains(in_feat.geometry().geometry()):
-                    cur_geom = in_feat.geometry()
+                if not engine.contains(cur_geom.geometry()):
                     new_geom = combined_clip_geom.intersection(cur_geom)
                     if new_geom.wkbType() == QgsWkbTypes.Unknown or QgsWkbTypes.flatType(new_geom.geometry().wkbType()) == QgsWkbTypes.GeometryCollection:
-                        int_com = in_feat.geometry().combine(new_geom)
-                        int_sym = in_feat.geometry().symDifference(new_geom)
+                        int_com = cur_geom.combine(new_geom)
+                        int_sym = cur_geom.symDifference(new_geom)
                         new_geom = int_com.difference(int_sym)
                 else:
                     # clip geometry totally contains feature geometry, so no need to perform intersection
-                    new_geom = in_feat.geometry()
+                    new_geom = cur_geom
 
                 try:
                     out_feat = QgsFeature()
                     out_feat.setGeometry(new_geom)
-                    out_feat.setAttributes(in_feat.attributes())
+                    out_feat.setAttributes(attributes)
                     writer.addFeature(out_feat)
                 except:
                     QgsMessageLog.logMessage(self.tr('Feature geometry error: One or more '
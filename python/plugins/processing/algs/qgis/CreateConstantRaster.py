@@ -87,7 +87,8 @@ class CreateConstantRaster(GeoAlgorithm):
                          cellsize,
                          1,
                          layer.crs(),
-                         geoTransform
+                         geoTransform,
+                         streaming=True
                          )
-        w.matrix.fill(value)
+        w.fill(value)
         w.close()
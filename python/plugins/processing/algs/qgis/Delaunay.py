@@ -16,7 +16,6 @@
 *                                                                         *
 ***************************************************************************
 """
-from builtins import next
 
 __author__ = 'Victor Olaya'
 __date__ = 'August 2012'
@@ -32,7 +31,6 @@ from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtCore import QVariant
 
 from qgis.core import (QgsField,
-                       QgsFeatureRequest,
                        QgsFeature,
                        QgsGeometry,
                        QgsPoint,
@@ -41,6 +39,7 @@ from qgis.core import (QgsField,
                        QgsFields)
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.ProcessingConfig import ProcessingConfig
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.core.parameters import ParameterVector
 from processing.core.outputs import OutputVector
@@ -87,9 +86,8 @@ class Delaunay(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fields, QgsWkbTypes.Polygon, layer.crs(), context)
 
         pts = []
-        ptDict = {}
-        ptNdx = -1
-        c = voronoi.Context()
+        # index of the first occurrence of each coordinate pair
+        firstIndex = {}
         features = QgsProcessingUtils.getFeatures(layer, context)
         total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
         for current, inFeat in enumerate(features):
@@ -100,12 +98,10 @@ class Delaunay(GeoAlgorithm):
                 points = geom.asMultiPoint()
             else:
                 points = [geom.asPoint()]
-            for n, point in enumerate(points):
-                x = point.x()
-                y = point.y()
-                pts.append((x, y))
-                ptNdx += 1
-                ptDict[ptNdx] = (inFeat.id(), n)
+            for point in points:
+                pt = (point.x(), point.y())
+                firstIndex.setdefault(pt, len(pts))
+                pts.append(pt)
             feedback.setProgress(int(current * total))
 
         if len(pts) < 3:
@@ -113,38 +109,46 @@ class Delaunay(GeoAlgorithm):
                 self.tr('Input file should contain at least 3 points. Choose '
                         'another file and try again.'))
 
-        uniqueSet = set(item for item in pts)
-        ids = [pts.index(item) for item in uniqueSet]
-        sl = voronoi.SiteList([voronoi.Site(*i) for i in uniqueSet])
-        c.triangulate = True
-        voronoi.voronoi(sl, c)
-        triangles = c.triangles
+        if ProcessingConfig.getSetting(ProcessingConfig.USE_GEOS_TRIANGULATION):
+            triangles = self.geosTriangles(firstIndex)
+        else:
+            triangles = self.fortuneTriangles(pts, firstIndex)
         feat = QgsFeature()
 
-        total = 100.0 / len(triangles)
+        total = 100.0 / len(triangles) if triangles else 0
         for current, triangle in enumerate(triangles):
             indices = list(triangle)
             indices.append(indices[0])
-            polygon = []
-            attrs = []
-            step = 0
-            for index in indices:
-                fid, n = ptDict[ids[index]]
-                request = QgsFeatureRequest().setFilterFid(fid)
-                inFeat = next(layer.getFeatures(request))
-                geom = QgsGeometry(inFeat.geometry())
-                if geom.isMultipart():
-                    point = QgsPoint(geom.asMultiPoint()[n])
-                else:
-                    point = QgsPoint(geom.asPoint())
-                polygon.append(point)
-                if step <= 3:
-                    attrs.append(ids[index])
-                step += 1
-            feat.setAttributes(attrs)
+            polygon = [QgsPoint(*pts[index]) for index in indices]
+            feat.setAttributes(list(triangle))
             geometry = QgsGeometry().fromPolygon([polygon])
             feat.setGeometry(geometry)
             writer.addFeature(feat)
             feedback.setProgress(int(current * total))
 
         del writer
+
+    def fortuneTriangles(self, pts, firstIndex):
+        """Returns the triangles computed with the Fortune sweep in
+        voronoi.py, as tuples with the indices of their vertices in pts.
+        """
+        uniqueSet = set(item for item in pts)
+        ids = [firstIndex[item] for item in uniqueSet]
+        sl = voronoi.SiteList([voronoi.Site(*i) for i in uniqueSet])
+        c = voronoi.Context()
+        c.triangulate = True
+        voronoi.voronoi(sl, c)
+        return [tuple(ids[index] for index in triangle) for triangle in c.triangles]
+
+    def geosTriangles(self, firstIndex):
+        """Returns the triangles computed by GEOS, as tuples with the
+        indices of their vertices in pts. GEOS keeps the input
+        coordinates, so vertices are mapped back with firstIndex.
+        """
+        points = QgsGeometry.fromMultiPoint([QgsPoint(x, y) for (x, y) in firstIndex])
+        triangulation = points.delaunayTriangulation()
+        triangles = []
+        for part in triangulation.asGeometryCollection():
+            ring = part.asPolygon()[0]
+            triangles.append(tuple(firstIndex[(p.x(), p.y())] for p in ring[:3]))
+        return triangles
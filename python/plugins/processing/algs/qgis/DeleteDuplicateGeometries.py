@@ -31,6 +31,7 @@ from qgis.core import (QgsFeatureRequest,
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.outputs import OutputVector
+from processing.tools import vector
 
 
 class DeleteDuplicateGeometries(GeoAlgorithm):
@@ -68,22 +69,16 @@ class DeleteDuplicateGeometries(GeoAlgorithm):
         features = QgsProcessingUtils.getFeatures(layer, context)
 
         total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
-        geoms = dict()
+        finder = vector.DuplicateGeometryFinder()
         for current, f in enumerate(features):
-            geoms[f.id()] = f.geometry()
+            finder.addFeature(f)
             feedback.setProgress(int(current * total))
 
-        cleaned = dict(geoms)
-
-        for i, g in list(geoms.items()):
-            for j in list(cleaned.keys()):
-                if i == j or i not in cleaned:
-                    continue
-                if g.isGeosEqual(cleaned[j]):
-                    del cleaned[j]
+        # keep the first feature of each group of equal geometries
+        cleaned = [fids[0] for fids in finder.groups]
 
         total = 100.0 / len(cleaned)
-        request = QgsFeatureRequest().setFilterFids(list(cleaned.keys()))
+        request = QgsFeatureRequest().setFilterFids(cleaned)
         for current, f in enumerate(layer.getFeatures(request)):
             writer.addFeature(f)
             feedback.setProgress(int(current * total))
@@ -36,11 +36,17 @@ from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterNumber
 from processing.core.outputs import OutputVector
-from processing.tools import dataobjects
+from processing.tools import dataobjects, parallel
 
 pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 
+def densify(geometry, attributes, vertices):
+    if geometry is not None:
+        geometry = geometry.densifyByCount(vertices)
+    return [(geometry, attributes)]
+
+
 class DensifyGeometries(GeoAlgorithm):
 
     INPUT = 'INPUT'
@@ -84,14 +90,6 @@ class DensifyGeometries(GeoAlgorithm):
         writer = self.getOutputFromName(
             self.OUTPUT).getVectorWriter(layer.fields(), layer.wkbType(), layer.crs(), context)
 
-        features = QgsProcessingUtils.getFeatures(layer, context)
-        total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
-        for current, f in enumerate(features):
-            feature = f
-            if feature.hasGeometry():
-                new_geometry = feature.geometry().densifyByCount(int(vertices))
-                feature.setGeometry(new_geometry)
-            writer.addFeature(feature)
-            feedback.setProgress(int(current * total))
+        parallel.mapFeatures(layer, context, feedback, writer, densify, (int(vertices),))
 
         del writer
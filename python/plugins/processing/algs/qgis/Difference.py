@@ -29,8 +29,7 @@ import os
 
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.core import (QgsFeatureRequest,
-                       QgsFeature,
+from qgis.core import (QgsFeature,
                        QgsGeometry,
                        QgsWkbTypes,
                        QgsMessageLog,
@@ -38,6 +37,7 @@ from qgis.core import (QgsFeatureRequest,
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.outputs import OutputVector
+from processing.tools import vector
 
 pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
@@ -77,18 +77,14 @@ class Difference(GeoAlgorithm):
             Difference.OUTPUT).getVectorWriter(layerA.fields(), geomType, layerA.crs(), context)
 
         outFeat = QgsFeature()
-        index = QgsProcessingUtils.createSpatialIndex(layerB, context)
+        cacheB = vector.FeatureCache(layerB, context, attributes=False)
         selectionA = QgsProcessingUtils.getFeatures(layerA, context)
         total = 100.0 / QgsProcessingUtils.featureCount(layerA, context)
         for current, inFeatA in enumerate(selectionA):
             geom = inFeatA.geometry()
             diff_geom = QgsGeometry(geom)
             attrs = inFeatA.attributes()
-            intersections = index.intersects(geom.boundingBox())
-
-            request = QgsFeatureRequest().setFilterFids(intersections).setSubsetOfAttributes([])
-            for inFeatB in layerB.getFeatures(request):
-                tmpGeom = inFeatB.geometry()
+            for fid, tmpGeom, atMapB in cacheB.candidates(geom.boundingBox()):
                 if diff_geom.intersects(tmpGeom):
                     diff_geom = QgsGeometry(diff_geom.difference(tmpGeom))
 
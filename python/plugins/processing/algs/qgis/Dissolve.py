@@ -26,22 +26,22 @@ __copyright__ = '(C) 2012, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import os
-from collections import defaultdict
+import math
 
 from qgis.PyQt.QtGui import QIcon
 
 from qgis.core import (QgsFeature,
-                       QgsGeometry,
                        QgsMessageLog,
                        QgsProcessingUtils)
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.ProcessingConfig import ProcessingConfig
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterBoolean
 from processing.core.parameters import ParameterTableField
 from processing.core.outputs import OutputVector
-from processing.tools import dataobjects
+from processing.tools import dataobjects, parallel
 
 pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
@@ -53,6 +53,9 @@ class Dissolve(GeoAlgorithm):
     FIELD = 'FIELD'
     DISSOLVE_ALL = 'DISSOLVE_ALL'
 
+    # features in each tile when dissolving all features
+    TILE_FEATURES = 10000
+
     def icon(self):
         return QIcon(os.path.join(pluginPath, 'images', 'ftools', 'dissolve.png'))
 
@@ -75,6 +78,33 @@ class Dissolve(GeoAlgorithm):
                                               self.tr('Unique ID fields'), Dissolve.INPUT, optional=True, multiple=True))
         self.addOutput(OutputVector(Dissolve.OUTPUT, self.tr('Dissolved')))
 
+    def tileKey(self, x, y, extent, tiles):
+        """Returns the Z-order number of the tile containing a point,
+        in a grid of tiles x tiles tiles covering an extent.
+        """
+        col = 0
+        row = 0
+        if extent.width() > 0:
+            col = min(tiles - 1, max(0, int((x - extent.xMinimum()) / extent.width() * tiles)))
+        if extent.height() > 0:
+            row = min(tiles - 1, max(0, int((y - extent.yMinimum()) / extent.height() * tiles)))
+        key = 0
+        bit = 0
+        while col or row:
+            key |= (col & 1) << (2 * bit) | (row & 1) << (2 * bit + 1)
+            col >>= 1
+            row >>= 1
+            bit += 1
+        return key
+
+    def logInvalid(self, errors):
+        for error in errors:
+            QgsMessageLog.logMessage(self.tr('ValidateGeometry() '
+                                             'error: One or more input '
+                                             'features have invalid '
+                                             'geometry: ') +
+                                     error, self.tr('Processing'), QgsMessageLog.CRITICAL)
+
     def processAlgorithm(self, context, feedback):
         useField = not self.getParameterValue(Dissolve.DISSOLVE_ALL)
         field_names = self.getParameterValue(Dissolve.FIELD)
@@ -83,95 +113,90 @@ class Dissolve(GeoAlgorithm):
         writer = self.getOutputFromName(
             Dissolve.OUTPUT).getVectorWriter(vlayerA.fields(), vlayerA.wkbType(), vlayerA.crs(), context)
 
+        try:
+            maxSize = float(ProcessingConfig.getSetting(ProcessingConfig.DISSOLVE_MEMORY)) * 1024 * 1024
+        except (TypeError, ValueError):
+            maxSize = 1024 * 1024 * 1024
+        buckets = parallel.GeometryBuckets(maxSize)
+
         outFeat = QgsFeature()
         features = QgsProcessingUtils.getFeatures(vlayerA, context)
-        total = 100.0 / QgsProcessingUtils.featureCount(vlayerA, context)
-
-        if not useField:
-            first = True
-            # we dissolve geometries in blocks using unaryUnion
-            geom_queue = []
-            for current, inFeat in enumerate(features):
-                feedback.setProgress(int(current * total))
-                if first:
-                    outFeat.setAttributes(inFeat.attributes())
-                    first = False
-
-                tmpInGeom = inFeat.geometry()
-                if tmpInGeom.isNull() or tmpInGeom.isEmpty():
-                    continue
-
-                errors = tmpInGeom.validateGeometry()
-                if len(errors) != 0:
-                    for error in errors:
-                        QgsMessageLog.logMessage(self.tr('ValidateGeometry()'
-                                                         'error: One or more '
-                                                         'input features have '
-                                                         'invalid geometry: ') +
-                                                 error.what(), self.tr('Processing'), QgsMessageLog.CRITICAL)
-                    continue
-
-                geom_queue.append(tmpInGeom)
-
-                if len(geom_queue) > 10000:
-                    # queue too long, combine it
-                    try:
-                        temp_output_geometry = QgsGeometry.unaryUnion(geom_queue)
-                        geom_queue = [temp_output_geometry]
-                    except:
-                        raise GeoAlgorithmExecutionException(
-                            self.tr('Geometry exception while dissolving'))
-
-            try:
-                outFeat.setGeometry(QgsGeometry.unaryUnion(geom_queue))
-            except:
-                raise GeoAlgorithmExecutionException(
-                    self.tr('Geometry exception while dissolving'))
-
-            writer.addFeature(outFeat)
-        else:
-            field_indexes = [vlayerA.fields().lookupField(f) for f in field_names.split(';')]
-
-            attribute_dict = {}
-            geometry_dict = defaultdict(lambda: [])
-
-            for inFeat in features:
-                attrs = inFeat.attributes()
-
-                index_attrs = tuple([attrs[i] for i in field_indexes])
-
-                tmpInGeom = QgsGeometry(inFeat.geometry())
-                if tmpInGeom and tmpInGeom.isEmpty():
-                    continue
-                errors = tmpInGeom.validateGeometry()
-                if len(errors) != 0:
-                    for error in errors:
-                        QgsMessageLog.logMessage(self.tr('ValidateGeometry() '
-                                                         'error: One or more input'
-                                                         'features have invalid '
-                                                         'geometry: ') +
-                                                 error.what(), self.tr('Processing'), QgsMessageLog.CRITICAL)
-
-                if index_attrs not in attribute_dict:
-                    # keep attributes of first feature
-                    attribute_dict[index_attrs] = attrs
-
-                geometry_dict[index_attrs].append(tmpInGeom)
-
-            nFeat = len(attribute_dict)
-
-            nElement = 0
-            for key, value in list(geometry_dict.items()):
-                outFeat = QgsFeature()
-                nElement += 1
-                feedback.setProgress(int(nElement * 100 / nFeat))
+        count = QgsProcessingUtils.featureCount(vlayerA, context)
+        total = 50.0 / count if count else 0
+
+        try:
+            if not useField:
+                # features are partitioned in square tiles, which are
+                # unioned separately and then merged with neighbouring
+                # tiles. The tiles are numbered in Z-order, so
+                # consecutive tiles are close to each other.
+                extent = vlayerA.extent()
+                tiles = max(1, int(math.ceil(math.sqrt(count / float(self.TILE_FEATURES)))))
+                first = True
+                for current, inFeat in enumerate(features):
+                    feedback.setProgress(int(current * total))
+                    if first:
+                        outFeat.setAttributes(inFeat.attributes())
+                        first = False
+
+                    tmpInGeom = inFeat.geometry()
+                    if tmpInGeom.isNull() or tmpInGeom.isEmpty():
+                        continue
+
+                    center = tmpInGeom.boundingBox().center()
+                    buckets.add(self.tileKey(center.x(), center.y(), extent, tiles), tmpInGeom)
+
+                tileGeoms = []
+                nTiles = len(buckets)
+                keys = sorted(buckets.keys())
+                for nElement, (key, geometry, errors) in enumerate(
+                        parallel.unionBuckets(buckets, keys, feedback, parallel.SKIP_INVALID)):
+                    self.logInvalid(errors)
+                    if geometry is not None:
+                        tileGeoms.append(geometry)
+                    feedback.setProgress(50 + int(nElement * 50 / nTiles))
+
                 try:
-                    tmpOutGeom = QgsGeometry.unaryUnion(value)
+                    outFeat.setGeometry(parallel.reduceGeometries(tileGeoms, feedback))
+                except GeoAlgorithmExecutionException:
+                    raise
                 except:
                     raise GeoAlgorithmExecutionException(
                         self.tr('Geometry exception while dissolving'))
-                outFeat.setGeometry(tmpOutGeom)
-                outFeat.setAttributes(attribute_dict[key])
+
                 writer.addFeature(outFeat)
+            else:
+                field_indexes = [vlayerA.fields().lookupField(f) for f in field_names.split(';')]
+
+                attribute_dict = {}
+
+                for current, inFeat in enumerate(features):
+                    feedback.setProgress(int(current * total))
+                    attrs = inFeat.attributes()
+
+                    index_attrs = tuple([attrs[i] for i in field_indexes])
+
+                    tmpInGeom = inFeat.geometry()
+                    if tmpInGeom.isEmpty():
+                        continue
+
+                    if index_attrs not in attribute_dict:
+                        # keep attributes of first feature
+                        attribute_dict[index_attrs] = attrs
+
+                    buckets.add(index_attrs, tmpInGeom)
+
+                nFeat = len(attribute_dict)
+                for nElement, (key, geometry, errors) in enumerate(
+                        parallel.unionBuckets(buckets, buckets.keys(), feedback, parallel.LOG_INVALID)):
+                    self.logInvalid(errors)
+                    outFeat = QgsFeature()
+                    if geometry is not None:
+                        outFeat.setGeometry(geometry)
+                    outFeat.setAttributes(attribute_dict[key])
+                    writer.addFeature(outFeat)
+                    feedback.setProgress(50 + int((nElement + 1) * 50 / nFeat))
+        finally:
+            buckets.close()
 
         del writer
@@ -25,8 +25,7 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
-from qgis.core import (QgsFeatureRequest,
-                       QgsApplication,
+from qgis.core import (QgsApplication,
                        QgsProcessingUtils)
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
@@ -94,45 +93,33 @@ class ExtractByLocation(GeoAlgorithm):
         predicates = self.getParameterValue(self.PREDICATE)
         precision = self.getParameterValue(self.PRECISION)
 
-        index = QgsProcessingUtils.createSpatialIndex(layer, context)
+        # only input features in the extent of the selection layer can
+        # match, other than disjoint ones
+        extent = selectLayer.extent()
+        extent.grow(0.51 * precision)
+        index = vector.SpatialPredicateIndex(layer, context, precision, extent=extent)
 
         output = self.getOutputFromName(self.OUTPUT)
         writer = output.getVectorWriter(layer.fields(), layer.wkbType(), layer.crs(), context)
 
-        if 'disjoint' in predicates:
-            disjoinSet = []
-            for feat in QgsProcessingUtils.getFeatures(layer, context):
-                disjoinSet.append(feat.id())
+        disjoint = 'disjoint' in predicates
+        predicates = [p for p in predicates if p != 'disjoint']
 
-        selectedSet = []
+        selectedSet = set()
+        intersectingSet = set()
         features = QgsProcessingUtils.getFeatures(selectLayer, context)
         total = 100.0 / QgsProcessingUtils.featureCount(selectLayer, context)
         for current, f in enumerate(features):
-            geom = vector.snapToPrecision(f.geometry(), precision)
-            bbox = geom.boundingBox()
-            bbox.grow(0.51 * precision)
-            intersects = index.intersects(bbox)
-            request = QgsFeatureRequest().setFilterFids(intersects).setSubsetOfAttributes([])
-            for feat in layer.getFeatures(request):
-                tmpGeom = vector.snapToPrecision(feat.geometry(), precision)
-                res = False
-                for predicate in predicates:
-                    if predicate == 'disjoint':
-                        if tmpGeom.intersects(geom):
-                            try:
-                                disjoinSet.remove(feat.id())
-                            except:
-                                pass  # already removed
-                    else:
-                        res = getattr(tmpGeom, predicate)(geom)
-                        if res:
-                            selectedSet.append(feat.id())
-                            break
+            # predicates are evaluated on the input features
+            if predicates:
+                selectedSet.update(index.matches(f.geometry(), predicates, True))
+            if disjoint:
+                intersectingSet.update(index.matches(f.geometry(), ['intersects'], True))
 
             feedback.setProgress(int(current * total))
 
-        if 'disjoint' in predicates:
-            selectedSet = selectedSet + disjoinSet
+        if disjoint:
+            selectedSet.update(index.allFids() - intersectingSet)
 
         features = QgsProcessingUtils.getFeatures(layer, context)
         total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
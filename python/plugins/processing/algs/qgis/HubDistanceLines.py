@@ -16,7 +16,6 @@
 *                                                                         *
 ***************************************************************************
 """
-from builtins import next
 
 __author__ = 'Michael Minn'
 __date__ = 'May 2010'
@@ -31,7 +30,7 @@ from qgis.core import (QgsField,
                        QgsGeometry,
                        QgsDistanceArea,
                        QgsFeature,
-                       QgsFeatureRequest,
+                       QgsPoint,
                        QgsWkbTypes,
                        QgsApplication,
                        QgsProject,
@@ -43,9 +42,7 @@ from processing.core.parameters import ParameterTableField
 from processing.core.parameters import ParameterSelection
 from processing.core.outputs import OutputVector
 
-from processing.tools import dataobjects
-
-from math import sqrt
+from processing.tools import dataobjects, vector
 
 
 class HubDistanceLines(GeoAlgorithm):
@@ -113,7 +110,11 @@ class HubDistanceLines(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fields, QgsWkbTypes.LineString, layerPoints.crs(),
                                                                      context)
 
-        index = QgsProcessingUtils.createSpatialIndex(layerHubs, context)
+        finder = vector.NearestNeighbourFinder(layerHubs, context, [fieldName])
+        if len(finder) == 0:
+            raise GeoAlgorithmExecutionException(
+                self.tr('The hubs layer has no features with a geometry'))
+        hubIdx = layerHubs.fields().lookupField(fieldName)
 
         distance = QgsDistanceArea()
         distance.setSourceCrs(layerPoints.crs())
@@ -122,16 +123,14 @@ class HubDistanceLines(GeoAlgorithm):
         # Scan source points, find nearest hub, and write to output file
         features = QgsProcessingUtils.getFeatures(layerPoints, context)
         total = 100.0 / QgsProcessingUtils.featureCount(layerPoints, context)
-        for current, f in enumerate(features):
+        for current, (f, ids, distances, rows) in enumerate(finder.queryFeatures(features, 1)):
             src = f.geometry().boundingBox().center()
 
-            neighbors = index.nearestNeighbor(src, 1)
-            ft = next(layerHubs.getFeatures(QgsFeatureRequest().setFilterFid(neighbors[0]).setSubsetOfAttributes([fieldName], layerHubs.fields())))
-            closest = ft.geometry().boundingBox().center()
+            closest = QgsPoint(*finder.coords[rows[0]])
             hubDist = distance.measureLine(src, closest)
 
             attributes = f.attributes()
-            attributes.append(ft[fieldName])
+            attributes.append(finder.attributes[rows[0]][hubIdx])
             if units == 'Feet':
                 attributes.append(hubDist * 3.2808399)
             elif units == 'Miles':
@@ -139,9 +138,7 @@ class HubDistanceLines(GeoAlgorithm):
             elif units == 'Kilometers':
                 attributes.append(hubDist / 1000.0)
             elif units != 'Meters':
-                attributes.append(sqrt(
-                    pow(src.x() - closest.x(), 2.0) +
-                    pow(src.y() - closest.y(), 2.0)))
+                attributes.append(float(distances[0]))
             else:
                 attributes.append(hubDist)
 
@@ -27,6 +27,7 @@ __copyright__ = '(C) 2010, Michael Minn'
 __revision__ = '$Format:%H$'
 
 from qgis.core import (QgsFeature,
+                       QgsFeatureRequest,
                        QgsGeometry,
                        QgsPoint,
                        QgsWkbTypes,
@@ -89,30 +90,26 @@ class HubLines(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(layerSpoke.fields(), QgsWkbTypes.LineString,
                                                                      layerSpoke.crs(), context)
 
+        # hub locations by id, read in a single pass. The first hub
+        # with a given id is used, as before
+        hubs = {}
+        request = QgsFeatureRequest().setSubsetOfAttributes([fieldHub], layerHub.fields())
+        for hubpoint in QgsProcessingUtils.getFeatures(layerHub, context, request):
+            if hubpoint.hasGeometry():
+                hubs.setdefault(str(hubpoint[fieldHub]), hubpoint.geometry().boundingBox().center())
+
         spokes = QgsProcessingUtils.getFeatures(layerSpoke, context)
-        hubs = QgsProcessingUtils.getFeatures(layerHub, context)
         total = 100.0 / QgsProcessingUtils.featureCount(layerSpoke, context)
 
         for current, spokepoint in enumerate(spokes):
-            p = spokepoint.geometry().boundingBox().center()
-            spokeX = p.x()
-            spokeY = p.y()
-            spokeId = str(spokepoint[fieldSpoke])
-
-            for hubpoint in hubs:
-                hubId = str(hubpoint[fieldHub])
-                if hubId == spokeId:
-                    p = hubpoint.geometry().boundingBox().center()
-                    hubX = p.x()
-                    hubY = p.y()
-
-                    f = QgsFeature()
-                    f.setAttributes(spokepoint.attributes())
-                    f.setGeometry(QgsGeometry.fromPolyline(
-                        [QgsPoint(spokeX, spokeY), QgsPoint(hubX, hubY)]))
-                    writer.addFeature(f)
-
-                    break
+            hub = hubs.get(str(spokepoint[fieldSpoke]))
+            if hub is not None:
+                p = spokepoint.geometry().boundingBox().center()
+                f = QgsFeature()
+                f.setAttributes(spokepoint.attributes())
+                f.setGeometry(QgsGeometry.fromPolyline(
+                    [QgsPoint(p.x(), p.y()), QgsPoint(hub.x(), hub.y())]))
+                writer.addFeature(f)
 
             feedback.setProgress(int(current * total))
 
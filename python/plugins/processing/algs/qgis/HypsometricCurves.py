@@ -93,7 +93,6 @@ class HypsometricCurves(GeoAlgorithm):
         rasterDS = gdal.Open(rasterPath, gdal.GA_ReadOnly)
         geoTransform = rasterDS.GetGeoTransform()
         rasterBand = rasterDS.GetRasterBand(1)
-        noData = rasterBand.GetNoDataValue()
 
         cellXSize = abs(geoTransform[1])
         cellYSize = abs(geoTransform[5])
@@ -142,7 +141,6 @@ class HypsometricCurves(GeoAlgorithm):
             height = endRow - startRow
 
             srcOffset = (startColumn, startRow, width, height)
-            srcArray = rasterBand.ReadAsArray(*srcOffset)
 
             if srcOffset[2] == 0 or srcOffset[3] == 0:
                 feedback.pushInfo(
@@ -150,6 +148,8 @@ class HypsometricCurves(GeoAlgorithm):
                             'cell size').format(f.id()))
                 continue
 
+            srcArray = raster.readBlock(rasterBand, *srcOffset)
+
             newGeoTransform = (
                 geoTransform[0] + srcOffset[0] * geoTransform[1],
                 geoTransform[1],
@@ -173,9 +173,8 @@ class HypsometricCurves(GeoAlgorithm):
             gdal.RasterizeLayer(rasterizedDS, [1], memLayer, burn_values=[1])
             rasterizedArray = rasterizedDS.ReadAsArray()
 
-            srcArray = numpy.nan_to_num(srcArray)
             masked = numpy.ma.MaskedArray(srcArray,
-                                          mask=numpy.logical_or(srcArray == noData,
+                                          mask=numpy.logical_or(numpy.ma.getmaskarray(srcArray),
                                                                 numpy.logical_not(rasterizedArray)))
 
             self.calculateHypsometry(f.id(), fName, feedback, masked,
@@ -199,12 +198,15 @@ class HypsometricCurves(GeoAlgorithm):
 
         minValue = d.min()
         maxValue = d.max()
-        startValue = minValue
-        tmpValue = minValue + step
-        while startValue < maxValue:
-            out[tmpValue] = ((startValue <= d) & (d < tmpValue)).sum()
-            startValue = tmpValue
-            tmpValue += step
+        edges = [minValue]
+        while edges[-1] < maxValue:
+            edges.append(edges[-1] + step)
+
+        # count values in [edge, next edge) for all steps with one sort
+        d = numpy.sort(d)
+        below = numpy.searchsorted(d, edges, side='left')
+        for tmpValue, v in zip(edges[1:], numpy.diff(below)):
+            out[tmpValue] = v
 
         if percentage:
             multiplier = 100.0 / len(d.flat)
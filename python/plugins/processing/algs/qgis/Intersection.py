@@ -29,8 +29,7 @@ import os
 
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.core import (QgsFeatureRequest,
-                       QgsFeature,
+from qgis.core import (QgsFeature,
                        QgsGeometry,
                        QgsWkbTypes,
                        QgsMessageLog,
@@ -87,26 +86,23 @@ class Intersection(GeoAlgorithm):
         fields = vector.combineVectorFields(vlayerA, vlayerB)
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fields, geomType, vlayerA.crs(), context)
         outFeat = QgsFeature()
-        index = QgsProcessingUtils.createSpatialIndex(vlayerB, context)
+        cacheB = vector.FeatureCache(vlayerB, context)
         selectionA = QgsProcessingUtils.getFeatures(vlayerA, context)
         total = 100.0 / QgsProcessingUtils.featureCount(vlayerA, context)
         for current, inFeatA in enumerate(selectionA):
             feedback.setProgress(int(current * total))
             geom = inFeatA.geometry()
             atMapA = inFeatA.attributes()
-            intersects = index.intersects(geom.boundingBox())
-            request = QgsFeatureRequest().setFilterFids(intersects)
+            candidates = cacheB.candidates(geom.boundingBox())
 
             engine = None
-            if len(intersects) > 0:
+            if len(candidates) > 0:
                 # use prepared geometries for faster intersection tests
                 engine = QgsGeometry.createGeometryEngine(geom.geometry())
                 engine.prepareGeometry()
 
-            for inFeatB in vlayerB.getFeatures(request):
-                tmpGeom = inFeatB.geometry()
+            for fid, tmpGeom, atMapB in candidates:
                 if engine.intersects(tmpGeom.geometry()):
-                    atMapB = inFeatB.attributes()
                     int_geom = QgsGeometry(geom.intersection(tmpGeom))
                     if int_geom.wkbType() == QgsWkbTypes.Unknown or QgsWkbTypes.flatType(int_geom.geometry().wkbType()) == QgsWkbTypes.GeometryCollection:
                         int_com = geom.combine(tmpGeom)
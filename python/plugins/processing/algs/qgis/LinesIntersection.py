@@ -34,6 +34,7 @@ from qgis.core import (QgsFeatureRequest, QgsFeature, QgsGeometry,
                        QgsProcessingUtils)
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.SpatialIndexCache import SpatialIndexCache
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterTableField
 from processing.core.outputs import OutputVector
@@ -109,7 +110,7 @@ class LinesIntersection(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fieldListA, QgsWkbTypes.Point, layerA.crs(),
                                                                      context)
 
-        spatialIndex = QgsProcessingUtils.createSpatialIndex(layerB, context)
+        spatialIndex = SpatialIndexCache.index(layerB, context, feedback)
 
         outFeat = QgsFeature()
         features = QgsProcessingUtils.getFeatures(layerA, context)
@@ -16,7 +16,6 @@
 *                                                                         *
 ***************************************************************************
 """
-from builtins import next
 from builtins import str
 
 __author__ = 'Victor Olaya'
@@ -33,13 +32,13 @@ import codecs
 
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.core import QgsFeatureRequest, QgsFeature, QgsDistanceArea, QgsProcessingUtils
+from qgis.core import QgsFeatureRequest, QgsProcessingUtils
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.outputs import OutputHTML
 from processing.core.outputs import OutputNumber
-from processing.tools import dataobjects
+from processing.tools import dataobjects, vector
 
 pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
@@ -86,25 +85,19 @@ class NearestNeighbourAnalysis(GeoAlgorithm):
         layer = QgsProcessingUtils.mapLayerFromString(self.getParameterValue(self.POINTS), context)
         output = self.getOutputValue(self.OUTPUT)
 
-        spatialIndex = QgsProcessingUtils.createSpatialIndex(layer, context)
-
-        neighbour = QgsFeature()
-        distance = QgsDistanceArea()
+        finder = vector.NearestNeighbourFinder(layer, context, [])
 
         sumDist = 0.00
         A = layer.extent()
         A = float(A.width() * A.height())
 
-        features = QgsProcessingUtils.getFeatures(layer, context)
+        features = QgsProcessingUtils.getFeatures(layer, context, QgsFeatureRequest().setSubsetOfAttributes([]))
         count = QgsProcessingUtils.featureCount(layer, context)
         total = 100.0 / count
-        for current, feat in enumerate(features):
-            neighbourID = spatialIndex.nearestNeighbor(
-                feat.geometry().asPoint(), 2)[1]
-            request = QgsFeatureRequest().setFilterFid(neighbourID).setSubsetOfAttributes([])
-            neighbour = next(layer.getFeatures(request))
-            sumDist += distance.measureLine(neighbour.geometry().asPoint(),
-                                            feat.geometry().asPoint())
+        for current, (feat, ids, distances, rows) in enumerate(finder.queryFeatures(features, 2)):
+            # the nearest feature is usually the point itself
+            neighbour = 1 if ids[0] == feat.id() else 0
+            sumDist += float(distances[neighbour])
 
             feedback.setProgress(int(current * total))
 
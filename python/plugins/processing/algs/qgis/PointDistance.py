@@ -16,7 +16,6 @@
 *                                                                         *
 ***************************************************************************
 """
-from builtins import next
 from builtins import str
 from builtins import range
 
@@ -29,11 +28,12 @@ __copyright__ = '(C) 2012, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import os
-import math
+
+import numpy
 
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.core import QgsFeatureRequest, QgsDistanceArea, QgsProcessingUtils
+from qgis.core import QgsProcessingUtils
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterNumber
@@ -41,7 +41,7 @@ from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterSelection
 from processing.core.parameters import ParameterTableField
 from processing.core.outputs import OutputTable
-from processing.tools import dataobjects
+from processing.tools import dataobjects, vector
 
 pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
@@ -118,6 +118,8 @@ class PointDistance(GeoAlgorithm):
             self.linearMatrix(context, inLayer, inField, targetLayer, targetField,
                               matType, nPoints, feedback)
 
+        self.writer.close()
+
     def linearMatrix(self, context, inLayer, inField, targetLayer, targetField,
                      matType, nPoints, feedback):
         if matType == 0:
@@ -125,73 +127,47 @@ class PointDistance(GeoAlgorithm):
         else:
             self.writer.addRecord(['InputID', 'MEAN', 'STDDEV', 'MIN', 'MAX'])
 
-        index = QgsProcessingUtils.createSpatialIndex(targetLayer, context)
+        finder = vector.NearestNeighbourFinder(targetLayer, context, [targetField])
 
         inIdx = inLayer.fields().lookupField(inField)
         outIdx = targetLayer.fields().lookupField(targetField)
 
-        distArea = QgsDistanceArea()
-
         features = QgsProcessingUtils.getFeatures(inLayer, context)
         total = 100.0 / QgsProcessingUtils.featureCount(inLayer, context)
-        for current, inFeat in enumerate(features):
-            inGeom = inFeat.geometry()
+        for current, (inFeat, ids, distances, rows) in enumerate(finder.queryFeatures(features, nPoints)):
             inID = str(inFeat.attributes()[inIdx])
-            featList = index.nearestNeighbor(inGeom.asPoint(), nPoints)
-            distList = []
-            vari = 0.0
-            request = QgsFeatureRequest().setFilterFids(featList).setSubsetOfAttributes([outIdx])
-            for outFeat in targetLayer.getFeatures(request):
-                outID = outFeat.attributes()[outIdx]
-                outGeom = outFeat.geometry()
-                dist = distArea.measureLine(inGeom.asPoint(),
-                                            outGeom.asPoint())
-                if matType == 0:
-                    self.writer.addRecord([inID, str(outID), str(dist)])
-                else:
-                    distList.append(float(dist))
-
-            if matType != 0:
-                mean = sum(distList) / len(distList)
-                for i in distList:
-                    vari += (i - mean) * (i - mean)
-                vari = math.sqrt(vari / len(distList))
-                self.writer.addRecord([inID, str(mean),
-                                       str(vari), str(min(distList)),
-                                       str(max(distList))])
+            if matType == 0:
+                # targets are listed in the order they are read from the layer
+                for i in numpy.argsort(ids, kind='mergesort'):
+                    outID = finder.attributes[rows[i]][outIdx]
+                    self.writer.addRecord([inID, str(outID), str(float(distances[i]))])
+            else:
+                self.writer.addRecord([inID, str(float(distances.mean())),
+                                       str(float(distances.std())), str(float(distances.min())),
+                                       str(float(distances.max()))])
 
             feedback.setProgress(int(current * total))
 
     def regularMatrix(self, context, inLayer, inField, targetLayer, targetField,
                       nPoints, feedback):
-        index = QgsProcessingUtils.createSpatialIndex(targetLayer, context)
+        finder = vector.NearestNeighbourFinder(targetLayer, context, [])
 
         inIdx = inLayer.fields().lookupField(inField)
 
-        distArea = QgsDistanceArea()
-
         first = True
         features = QgsProcessingUtils.getFeatures(inLayer, context)
         total = 100.0 / QgsProcessingUtils.featureCount(inLayer, context)
-        for current, inFeat in enumerate(features):
-            inGeom = inFeat.geometry()
+        for current, (inFeat, ids, distances, rows) in enumerate(finder.queryFeatures(features, nPoints)):
             inID = str(inFeat.attributes()[inIdx])
-            featList = index.nearestNeighbor(inGeom.asPoint(), nPoints)
             if first:
                 first = False
                 data = ['ID']
-                for i in range(len(featList)):
+                for i in range(len(ids)):
                     data.append('DIST_{0}'.format(i + 1))
                 self.writer.addRecord(data)
 
             data = [inID]
-            for i in featList:
-                request = QgsFeatureRequest().setFilterFid(i)
-                outFeat = next(targetLayer.getFeatures(request))
-                outGeom = outFeat.geometry()
-                dist = distArea.measureLine(inGeom.asPoint(),
-                                            outGeom.asPoint())
-                data.append(str(float(dist)))
+            data.extend(str(float(dist)) for dist in distances)
             self.writer.addRecord(data)
 
             feedback.setProgress(int(current * total))
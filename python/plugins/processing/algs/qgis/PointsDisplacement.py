@@ -33,7 +33,7 @@ from qgis.core import (QgsApplication,
                        QgsGeometry,
                        QgsPoint,
                        QgsProcessingUtils)
-from processing.tools import dataobjects
+from processing.tools import dataobjects, vector
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterNumber
@@ -86,23 +86,18 @@ class PointsDisplacement(GeoAlgorithm):
 
         total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
 
-        duplicates = dict()
+        duplicates = vector.DuplicateGeometryFinder()
         for current, f in enumerate(features):
-            wkt = f.geometry().exportToWkt()
-            if wkt not in duplicates:
-                duplicates[wkt] = [f.id()]
-            else:
-                duplicates[wkt].extend([f.id()])
-
+            duplicates.addFeature(f)
             feedback.setProgress(int(current * total))
 
         current = 0
-        total = 100.0 / len(duplicates)
+        total = 100.0 / len(duplicates.groups)
         feedback.setProgress(0)
 
         fullPerimeter = 2 * math.pi
 
-        for (geom, fids) in list(duplicates.items()):
+        for (geom, fids) in zip(duplicates.geometries, duplicates.groups):
             count = len(fids)
             if count == 1:
                 f = next(layer.getFeatures(QgsFeatureRequest().setFilterFid(fids[0])))
@@ -114,7 +109,7 @@ class PointsDisplacement(GeoAlgorithm):
                 else:
                     currentAngle = 0
 
-                old_point = QgsGeometry.fromWkt(geom).asPoint()
+                old_point = geom.asPoint()
 
                 request = QgsFeatureRequest().setFilterFids(fids).setFlags(QgsFeatureRequest.NoGeometry)
                 for f in layer.getFeatures(request):
@@ -30,7 +30,7 @@ import os
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtCore import QVariant
 
-from qgis.core import QgsGeometry, QgsFeatureRequest, QgsFeature, QgsField, QgsProcessingUtils
+from qgis.core import QgsFeature, QgsField, QgsProcessingUtils
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
@@ -83,34 +83,13 @@ class PointsInPolygon(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fields, polyLayer.wkbType(),
                                                                      polyLayer.crs(), context)
 
-        spatialIndex = QgsProcessingUtils.createSpatialIndex(pointLayer, context)
+        counter = vector.PointsInPolygonCounter(polyLayer, pointLayer, context,
+                                                vector.PointsInPolygonCounter.COUNT)
 
-        ftPoly = QgsFeature()
-        ftPoint = QgsFeature()
         outFeat = QgsFeature()
-        geom = QgsGeometry()
-
-        features = QgsProcessingUtils.getFeatures(polyLayer, context)
-        total = 100.0 / QgsProcessingUtils.featureCount(polyLayer, context)
-        for current, ftPoly in enumerate(features):
-            geom = ftPoly.geometry()
-            engine = QgsGeometry.createGeometryEngine(geom.geometry())
-            engine.prepareGeometry()
-
+        for ftPoly, count in counter.values(feedback):
             attrs = ftPoly.attributes()
-
-            count = 0
-            points = spatialIndex.intersects(geom.boundingBox())
-            if len(points) > 0:
-                request = QgsFeatureRequest().setFilterFids(points).setSubsetOfAttributes([])
-                fit = pointLayer.getFeatures(request)
-                ftPoint = QgsFeature()
-                while fit.nextFeature(ftPoint):
-                    tmpGeom = ftPoint.geometry()
-                    if engine.contains(tmpGeom.geometry()):
-                        count += 1
-
-            outFeat.setGeometry(geom)
+            outFeat.setGeometry(ftPoly.geometry())
             if idxCount == len(attrs):
                 attrs.append(count)
             else:
@@ -118,6 +97,4 @@ class PointsInPolygon(GeoAlgorithm):
             outFeat.setAttributes(attrs)
             writer.addFeature(outFeat)
 
-            feedback.setProgress(int(current * total))
-
         del writer
@@ -28,9 +28,7 @@ __revision__ = '$Format:%H$'
 from qgis.PyQt.QtCore import QVariant
 from qgis.core import (QgsApplication,
                        QgsField,
-                       QgsFeatureRequest,
                        QgsFeature,
-                       QgsGeometry,
                        QgsProcessingUtils)
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
@@ -90,42 +88,18 @@ class PointsInPolygonUnique(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fields, polyLayer.wkbType(),
                                                                      polyLayer.crs(), context)
 
-        spatialIndex = QgsProcessingUtils.createSpatialIndex(pointLayer, context)
+        counter = vector.PointsInPolygonCounter(polyLayer, pointLayer, context,
+                                                vector.PointsInPolygonCounter.UNIQUE, classFieldIndex)
 
-        ftPoint = QgsFeature()
         outFeat = QgsFeature()
-        geom = QgsGeometry()
-
-        features = QgsProcessingUtils.getFeatures(polyLayer, context)
-        total = 100.0 / QgsProcessingUtils.featureCount(polyLayer, context)
-        for current, ftPoly in enumerate(features):
-            geom = ftPoly.geometry()
-            engine = QgsGeometry.createGeometryEngine(geom.geometry())
-            engine.prepareGeometry()
-
+        for ftPoly, count in counter.values(feedback):
             attrs = ftPoly.attributes()
-
-            classes = set()
-            points = spatialIndex.intersects(geom.boundingBox())
-            if len(points) > 0:
-                request = QgsFeatureRequest().setFilterFids(points).setSubsetOfAttributes([classFieldIndex])
-                fit = pointLayer.getFeatures(request)
-                ftPoint = QgsFeature()
-                while fit.nextFeature(ftPoint):
-                    tmpGeom = QgsGeometry(ftPoint.geometry())
-                    if engine.contains(tmpGeom.geometry()):
-                        clazz = ftPoint.attributes()[classFieldIndex]
-                        if clazz not in classes:
-                            classes.add(clazz)
-
-            outFeat.setGeometry(geom)
+            outFeat.setGeometry(ftPoly.geometry())
             if idxCount == len(attrs):
-                attrs.append(len(classes))
+                attrs.append(count)
             else:
-                attrs[idxCount] = len(classes)
+                attrs[idxCount] = count
             outFeat.setAttributes(attrs)
             writer.addFeature(outFeat)
 
-            feedback.setProgress(int(current * total))
-
         del writer
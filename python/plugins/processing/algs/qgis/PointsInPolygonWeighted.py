@@ -16,7 +16,6 @@
 *                                                                         *
 ***************************************************************************
 """
-from builtins import str
 
 __author__ = 'Victor Olaya'
 __date__ = 'August 2012'
@@ -29,9 +28,7 @@ __revision__ = '$Format:%H$'
 from qgis.PyQt.QtCore import QVariant
 from qgis.core import (QgsApplication,
                        QgsField,
-                       QgsFeatureRequest,
                        QgsFeature,
-                       QgsGeometry,
                        QgsProcessingUtils)
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
@@ -96,39 +93,13 @@ class PointsInPolygonWeighted(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fields, polyLayer.wkbType(),
                                                                      polyLayer.crs(), context)
 
-        spatialIndex = QgsProcessingUtils.createSpatialIndex(pointLayer, context)
+        counter = vector.PointsInPolygonCounter(polyLayer, pointLayer, context,
+                                                vector.PointsInPolygonCounter.SUM, fieldIdx)
 
-        ftPoint = QgsFeature()
         outFeat = QgsFeature()
-        geom = QgsGeometry()
-
-        features = QgsProcessingUtils.getFeatures(polyLayer, context)
-        total = 100.0 / QgsProcessingUtils.featureCount(polyLayer, context)
-        for current, ftPoly in enumerate(features):
-            geom = ftPoly.geometry()
-            engine = QgsGeometry.createGeometryEngine(geom.geometry())
-            engine.prepareGeometry()
-
+        for ftPoly, count in counter.values(feedback):
             attrs = ftPoly.attributes()
-
-            count = 0
-            points = spatialIndex.intersects(geom.boundingBox())
-            if len(points) > 0:
-                feedback.setProgressText(str(len(points)))
-                request = QgsFeatureRequest().setFilterFids(points).setSubsetOfAttributes([fieldIdx])
-                fit = pointLayer.getFeatures(request)
-                ftPoint = QgsFeature()
-                while fit.nextFeature(ftPoint):
-                    tmpGeom = QgsGeometry(ftPoint.geometry())
-                    if engine.contains(tmpGeom.geometry()):
-                        weight = str(ftPoint.attributes()[fieldIdx])
-                        try:
-                            count += float(weight)
-                        except:
-                            # Ignore fields with non-numeric values
-                            pass
-
-            outFeat.setGeometry(geom)
+            outFeat.setGeometry(ftPoly.geometry())
             if idxCount == len(attrs):
                 attrs.append(count)
             else:
@@ -136,6 +107,4 @@ class PointsInPolygonWeighted(GeoAlgorithm):
             outFeat.setAttributes(attrs)
             writer.addFeature(outFeat)
 
-            feedback.setProgress(int(current * total))
-
         del writer
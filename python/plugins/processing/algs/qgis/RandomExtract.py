@@ -40,6 +40,9 @@ from processing.core.outputs import OutputVector
 
 class RandomExtract(GeoAlgorithm):
 
+    # results depend on a random seed
+    useResultCache = False
+
     INPUT = 'INPUT'
     OUTPUT = 'OUTPUT'
     METHOD = 'METHOD'
@@ -42,6 +42,9 @@ from processing.core.outputs import OutputVector
 
 class RandomExtractWithinSubsets(GeoAlgorithm):
 
+    # results depend on a random seed
+    useResultCache = False
+
     INPUT = 'INPUT'
     METHOD = 'METHOD'
     NUMBER = 'NUMBER'
@@ -51,6 +51,9 @@ from processing.tools import dataobjects, vector
 
 class RandomPointsAlongLines(GeoAlgorithm):
 
+    # results depend on a random seed
+    useResultCache = False
+
     VECTOR = 'VECTOR'
     POINT_NUMBER = 'POINT_NUMBER'
     MIN_DISTANCE = 'MIN_DISTANCE'
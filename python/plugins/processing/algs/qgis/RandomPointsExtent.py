@@ -49,6 +49,9 @@ pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 class RandomPointsExtent(GeoAlgorithm):
 
+    # results depend on a random seed
+    useResultCache = False
+
     EXTENT = 'EXTENT'
     POINT_NUMBER = 'POINT_NUMBER'
     MIN_DISTANCE = 'MIN_DISTANCE'
@@ -36,6 +36,7 @@ from qgis.core import (QgsGeometry, QgsFields, QgsField, QgsSpatialIndex, QgsWkb
                        QgsProcessingUtils)
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.SpatialIndexCache import SpatialIndexCache
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterNumber
 from processing.core.outputs import OutputVector
@@ -46,6 +47,9 @@ pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 class RandomPointsLayer(GeoAlgorithm):
 
+    # results depend on a random seed
+    useResultCache = False
+
     VECTOR = 'VECTOR'
     POINT_NUMBER = 'POINT_NUMBER'
     MIN_DISTANCE = 'MIN_DISTANCE'
@@ -78,7 +82,7 @@ class RandomPointsLayer(GeoAlgorithm):
         minDistance = float(self.getParameterValue(self.MIN_DISTANCE))
 
         bbox = layer.extent()
-        idxLayer = QgsProcessingUtils.createSpatialIndex(layer, context)
+        idxLayer = SpatialIndexCache.index(layer, context, feedback)
 
         fields = QgsFields()
         fields.append(QgsField('id', QVariant.Int, '', 10, 0))
@@ -47,6 +47,9 @@ pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 class RandomPointsPolygonsFixed(GeoAlgorithm):
 
+    # results depend on a random seed
+    useResultCache = False
+
     VECTOR = 'VECTOR'
     VALUE = 'VALUE'
     MIN_DISTANCE = 'MIN_DISTANCE'
@@ -48,6 +48,9 @@ pluginPath = os.path.split(os.path.split(os.path.dirname(__file__))[0])[0]
 
 class RandomPointsPolygonsVariable(GeoAlgorithm):
 
+    # results depend on a random seed
+    useResultCache = False
+
     VECTOR = 'VECTOR'
     FIELD = 'FIELD'
     MIN_DISTANCE = 'MIN_DISTANCE'
@@ -25,6 +25,7 @@ __copyright__ = '(C) 2013, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
+import numpy
 import plotly as plt
 import plotly.graph_objs as go
 
@@ -72,14 +73,19 @@ class RasterLayerHistogram(GeoAlgorithm):
 
         output = self.getOutputValue(self.PLOT)
 
-        # ALERT: this is potentially blocking if the layer is too big
-        values = raster.scanraster(layer, feedback)
-
-        valueslist = []
-        for v in values:
-            if v is not None:
-                valueslist.append(v)
-
-        data = [go.Histogram(x=valueslist,
-                             nbinsx=nbins)]
+        # the range is computed by GDAL, so the band is only read once
+        # from Python to fill the bins
+        counts = numpy.zeros(nbins, dtype=numpy.int64)
+        edges = numpy.linspace(0, 1, nbins + 1)
+        valueRange = raster.bandRange(layer)
+        if valueRange is not None:
+            for xOff, yOff, block in raster.scanRasterBlocks(layer, feedback):
+                blockCounts, edges = numpy.histogram(block.compressed(), bins=nbins,
+                                                     range=valueRange)
+                counts += blockCounts
+
+        centers = (edges[:-1] + edges[1:]) / 2.0
+        data = [go.Bar(x=centers.tolist(),
+                       y=counts.tolist(),
+                       width=(edges[1] - edges[0]))]
         plt.offline.plot(data, filename=output, auto_open=False)
@@ -82,7 +82,6 @@ class RasterLayerStatistics(GeoAlgorithm):
         outputFile = self.getOutputValue(self.OUTPUT_HTML_FILE)
         uri = self.getParameterValue(self.INPUT)
         layer = QgsProcessingUtils.mapLayerFromString(uri, context)
-        values = raster.scanraster(layer, feedback)
 
         n = 0
         nodata = 0
@@ -92,23 +91,34 @@ class RasterLayerStatistics(GeoAlgorithm):
         minvalue = None
         maxvalue = None
 
-        for v in values:
-            if v is not None:
-                sum += v
-                n = n + 1
-                delta = v - mean
-                mean = mean + delta / n
-                M2 = M2 + delta * (v - mean)
-                if minvalue is None:
-                    minvalue = v
-                    maxvalue = v
-                else:
-                    minvalue = min(v, minvalue)
-                    maxvalue = max(v, maxvalue)
+        for xOff, yOff, block in raster.scanRasterBlocks(layer, feedback):
+            values = block.compressed()
+            nodata += block.size - values.size
+            if values.size == 0:
+                continue
+
+            # combine block moments with the running ones (Chan et al.)
+            blockCount = values.size
+            blockMean = values.mean()
+            blockM2 = ((values - blockMean) ** 2).sum()
+            delta = blockMean - mean
+            total = n + blockCount
+            mean = mean + delta * blockCount / total
+            M2 = M2 + blockM2 + delta * delta * n * blockCount / total
+            n = total
+
+            sum += float(values.sum())
+            blockMin = float(values.min())
+            blockMax = float(values.max())
+            if minvalue is None:
+                minvalue = blockMin
+                maxvalue = blockMax
             else:
-                nodata += 1
+                minvalue = min(blockMin, minvalue)
+                maxvalue = max(blockMax, maxvalue)
 
-        variance = M2 / (n - 1)
+        mean = float(mean)
+        variance = float(M2) / (n - 1)
         stddev = math.sqrt(variance)
 
         data = []
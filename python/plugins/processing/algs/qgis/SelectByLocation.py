@@ -29,7 +29,7 @@ import os
 
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.core import QgsGeometry, QgsFeatureRequest, QgsProcessingUtils
+from qgis.core import QgsProcessingUtils
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterSelection
@@ -104,50 +104,36 @@ class SelectByLocation(GeoAlgorithm):
 
         oldSelection = set(inputLayer.selectedFeatureIds())
         inputLayer.removeSelection()
-        index = QgsProcessingUtils.createSpatialIndex(inputLayer, context)
 
-        if 'disjoint' in predicates:
-            disjoinSet = []
-            for feat in QgsProcessingUtils.getFeatures(inputLayer, context):
-                disjoinSet.append(feat.id())
+        # only input features in the extent of the selection layer can
+        # match, other than disjoint ones
+        extent = selectLayer.extent()
+        extent.grow(0.51 * precision)
+        index = vector.SpatialPredicateIndex(inputLayer, context, precision, extent=extent)
 
-        geom = QgsGeometry()
-        selectedSet = []
+        disjoint = 'disjoint' in predicates
+        predicates = [p for p in predicates if p != 'disjoint']
+
+        selectedSet = set()
+        intersectingSet = set()
         features = QgsProcessingUtils.getFeatures(selectLayer, context)
         total = 100.0 / QgsProcessingUtils.featureCount(selectLayer, context)
         for current, f in enumerate(features):
-            geom = vector.snapToPrecision(f.geometry(), precision)
-            bbox = geom.boundingBox()
-            bbox.grow(0.51 * precision)
-            intersects = index.intersects(bbox)
-
-            request = QgsFeatureRequest().setFilterFids(intersects).setSubsetOfAttributes([])
-            for feat in inputLayer.getFeatures(request):
-                tmpGeom = vector.snapToPrecision(feat.geometry(), precision)
-
-                res = False
-                for predicate in predicates:
-                    if predicate == 'disjoint':
-                        if tmpGeom.intersects(geom):
-                            try:
-                                disjoinSet.remove(feat.id())
-                            except:
-                                pass  # already removed
-                    else:
-                        res = getattr(tmpGeom, predicate)(geom)
-                        if res:
-                            selectedSet.append(feat.id())
-                            break
+            # predicates are evaluated on the input features
+            if predicates:
+                selectedSet.update(index.matches(f.geometry(), predicates, True))
+            if disjoint:
+                intersectingSet.update(index.matches(f.geometry(), ['intersects'], True))
 
             feedback.setProgress(int(current * total))
 
-        if 'disjoint' in predicates:
-            selectedSet = selectedSet + disjoinSet
+        if disjoint:
+            selectedSet.update(index.allFids() - intersectingSet)
 
         if method == 1:
             selectedSet = list(oldSelection.union(selectedSet))
         elif method == 2:
             selectedSet = list(oldSelection.difference(selectedSet))
 
-        inputLayer.selectByIds(selectedSet)
+        inputLayer.selectByIds(list(selectedSet))
         self.setOutputValue(self.OUTPUT, filename)
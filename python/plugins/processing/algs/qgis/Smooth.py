@@ -25,13 +25,23 @@ __copyright__ = '(C) 2015, Nyall Dawson'
 
 __revision__ = '$Format:%H$'
 
+from qgis.PyQt.QtCore import QCoreApplication
 from qgis.core import (QgsApplication,
                        QgsProcessingUtils)
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.core.parameters import ParameterVector, ParameterNumber
 from processing.core.outputs import OutputVector
-from processing.tools import dataobjects
+from processing.tools import dataobjects, parallel
+
+
+def smooth(geometry, attributes, iterations, offset, max_angle):
+    if geometry is not None:
+        geometry = geometry.smooth(iterations, offset, -1, max_angle)
+        if not geometry:
+            raise GeoAlgorithmExecutionException(
+                QCoreApplication.translate('Smooth', 'Error smoothing geometry'))
+    return [(geometry, attributes)]
 
 
 class Smooth(GeoAlgorithm):
@@ -77,20 +87,6 @@ class Smooth(GeoAlgorithm):
         writer = self.getOutputFromName(
             self.OUTPUT_LAYER).getVectorWriter(layer.fields(), layer.wkbType(), layer.crs(), context)
 
-        features = QgsProcessingUtils.getFeatures(layer, context)
-        total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
-
-        for current, input_feature in enumerate(features):
-            output_feature = input_feature
-            if input_feature.geometry():
-                output_geometry = input_feature.geometry().smooth(iterations, offset, -1, max_angle)
-                if not output_geometry:
-                    raise GeoAlgorithmExecutionException(
-                        self.tr('Error smoothing geometry'))
-
-                output_feature.setGeometry(output_geometry)
-
-            writer.addFeature(output_feature)
-            feedback.setProgress(int(current * total))
+        parallel.mapFeatures(layer, context, feedback, writer, smooth, (iterations, offset, max_angle))
 
         del writer
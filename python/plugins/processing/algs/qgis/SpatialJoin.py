@@ -33,7 +33,7 @@ import os
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtCore import QVariant
 
-from qgis.core import QgsFields, QgsField, QgsFeature, QgsGeometry, NULL, QgsWkbTypes, QgsProcessingUtils
+from qgis.core import QgsFields, QgsField, QgsFeature, NULL, QgsProcessingUtils
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
@@ -151,55 +151,34 @@ class SpatialJoin(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fields, target.wkbType(), target.crs(), context)
 
         outFeat = QgsFeature()
-        inFeatB = QgsFeature()
-        inGeom = QgsGeometry()
 
-        index = QgsProcessingUtils.createSpatialIndex(join, context)
-
-        mapP2 = dict()
-        features = QgsProcessingUtils.getFeatures(join, context)
-        for f in features:
-            mapP2[f.id()] = QgsFeature(f)
+        # only join features in the extent of the target layer can match
+        extent = target.extent()
+        extent.grow(0.51 * precision)
+        joinIndex = vector.SpatialPredicateIndex(join, context, precision,
+                                                 [field.name() for field in join.fields()], extent)
 
         features = QgsProcessingUtils.getFeatures(target, context)
         total = 100.0 / QgsProcessingUtils.featureCount(target, context)
         for c, f in enumerate(features):
             atMap1 = f.attributes()
             outFeat.setGeometry(f.geometry())
-            inGeom = vector.snapToPrecision(f.geometry(), precision)
             none = True
-            joinList = []
-            if inGeom.type() == QgsWkbTypes.PointGeometry:
-                bbox = inGeom.buffer(10, 2).boundingBox()
-            else:
-                bbox = inGeom.boundingBox()
-            bbox.grow(0.51 * precision)
-            joinList = index.intersects(bbox)
+            joinList = joinIndex.matches(f.geometry(), predicates)
             if len(joinList) > 0:
                 count = 0
                 for i in joinList:
-                    inFeatB = mapP2[i]
-                    inGeomB = vector.snapToPrecision(inFeatB.geometry(), precision)
-
-                    res = False
-                    for predicate in predicates:
-                        res = getattr(inGeom, predicate)(inGeomB)
-                        if res:
-                            break
-
-                    if res:
-                        count = count + 1
-                        none = False
-                        atMap2 = inFeatB.attributes()
-                        if not summary:
-                            atMap = atMap1
-                            atMap2 = atMap2
-                            atMap.extend(atMap2)
-                            atMap = dict(list(zip(seq, atMap)))
-                            break
-                        else:
-                            for j in list(numFields.keys()):
-                                numFields[j].append(atMap2[j])
+                    count = count + 1
+                    none = False
+                    atMap2 = joinIndex.attributes[i]
+                    if not summary:
+                        atMap = atMap1
+                        atMap.extend(atMap2)
+                        atMap = dict(list(zip(seq, atMap)))
+                        break
+                    else:
+                        for j in list(numFields.keys()):
+                            numFields[j].append(atMap2[j])
 
                 if summary and not none:
                     atMap = atMap1
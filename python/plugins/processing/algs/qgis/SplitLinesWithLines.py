@@ -36,6 +36,7 @@ from qgis.core import (QgsProcessingAlgorithm,
                        QgsMessageLog,
                        QgsProcessingUtils)
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.SpatialIndexCache import SpatialIndexCache
 from processing.core.parameters import ParameterVector
 from processing.core.outputs import OutputVector
 from processing.tools import dataobjects
@@ -85,7 +86,7 @@ class SplitLinesWithLines(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fieldList, QgsWkbTypes.LineString, layerA.crs(),
                                                                      context)
 
-        spatialIndex = QgsProcessingUtils.createSpatialIndex(layerB, context)
+        spatialIndex = SpatialIndexCache.index(layerB, context, feedback)
 
         outFeat = QgsFeature()
         features = QgsProcessingUtils.getFeatures(layerA, context)
@@ -103,3 +103,4 @@ class StatisticsByCategories(GeoAlgorithm):
             stat.calculate(v)
             record = [cat, stat.min(), stat.max(), stat.mean(), stat.sampleStDev(), stat.sum(), stat.count()]
             writer.addRecord(record)
+        writer.close()
@@ -32,6 +32,7 @@ from qgis.PyQt.QtGui import QIcon
 from qgis.core import QgsFeature, QgsGeometry, QgsFeatureRequest, QgsDistanceArea, QgsProcessingUtils
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.SpatialIndexCache import SpatialIndexCache
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterString
 from processing.core.outputs import OutputVector
@@ -86,7 +87,7 @@ class SumLines(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fieldList, polyLayer.wkbType(),
                                                                      polyLayer.crs(), context)
 
-        spatialIndex = QgsProcessingUtils.createSpatialIndex(lineLayer, context)
+        spatialIndex = SpatialIndexCache.index(lineLayer, context, feedback)
 
         ftLine = QgsFeature()
         ftPoly = QgsFeature()
@@ -31,7 +31,6 @@ from qgis.PyQt.QtGui import QIcon
 
 from qgis.core import (QgsFeature,
                        QgsGeometry,
-                       QgsFeatureRequest,
                        NULL,
                        QgsWkbTypes,
                        QgsMessageLog,
@@ -78,11 +77,10 @@ class SymmetricalDifference(GeoAlgorithm):
         fields = vector.combineVectorFields(layerA, layerB)
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fields, geomType, layerA.crs(), context)
 
-        featB = QgsFeature()
         outFeat = QgsFeature()
 
-        indexA = QgsProcessingUtils.createSpatialIndex(layerB, context)
-        indexB = QgsProcessingUtils.createSpatialIndex(layerA, context)
+        cacheB = vector.FeatureCache(layerB, context, attributes=False)
+        cacheA = vector.FeatureCache(layerA, context, attributes=False)
 
         featuresA = QgsProcessingUtils.getFeatures(layerA, context)
         featuresB = QgsProcessingUtils.getFeatures(layerB, context)
@@ -94,10 +92,7 @@ class SymmetricalDifference(GeoAlgorithm):
             geom = featA.geometry()
             diffGeom = QgsGeometry(geom)
             attrs = featA.attributes()
-            intersects = indexA.intersects(geom.boundingBox())
-            request = QgsFeatureRequest().setFilterFids(intersects).setSubsetOfAttributes([])
-            for featB in layerB.getFeatures(request):
-                tmpGeom = featB.geometry()
+            for fid, tmpGeom, attrsB in cacheB.candidates(geom.boundingBox()):
                 if diffGeom.intersects(tmpGeom):
                     diffGeom = QgsGeometry(diffGeom.difference(tmpGeom))
 
@@ -120,10 +115,7 @@ class SymmetricalDifference(GeoAlgorithm):
             diffGeom = QgsGeometry(geom)
             attrs = featA.attributes()
             attrs = [NULL] * length + attrs
-            intersects = indexB.intersects(geom.boundingBox())
-            request = QgsFeatureRequest().setFilterFids(intersects).setSubsetOfAttributes([])
-            for featB in layerA.getFeatures(request):
-                tmpGeom = featB.geometry()
+            for fid, tmpGeom, attrsA in cacheA.candidates(geom.boundingBox()):
                 if diffGeom.intersects(tmpGeom):
                     diffGeom = QgsGeometry(diffGeom.difference(tmpGeom))
 
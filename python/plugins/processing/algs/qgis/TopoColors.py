@@ -26,16 +26,16 @@ __copyright__ = '(C) 2017, Nyall Dawson'
 __revision__ = '$Format:%H$'
 
 import os
-import operator
 import sys
+from array import array
 
-from collections import defaultdict
+import numpy
 
 from qgis.core import (QgsApplication,
                        QgsField,
+                       QgsFeatureRequest,
                        QgsGeometry,
                        QgsSpatialIndex,
-                       QgsPointV2,
                        NULL,
                        QgsProcessingUtils)
 
@@ -105,52 +105,62 @@ class TopoColor(GeoAlgorithm):
         writer = self.getOutputFromName(
             self.OUTPUT_LAYER).getVectorWriter(fields, layer.wkbType(), layer.crs(), context)
 
-        features = {f.id(): f for f in QgsProcessingUtils.getFeatures(layer, context)}
-
-        topology, id_graph = self.compute_graph(features, feedback, min_distance=min_distance)
-        feature_colors = ColoringAlgorithm.balanced(features,
+        topology = self.compute_graph(layer, context, feedback, min_distance=min_distance)
+        feature_colors = ColoringAlgorithm.balanced(topology,
                                                     balance=balance_by,
-                                                    graph=topology,
                                                     feedback=feedback,
                                                     min_colors=min_colors)
 
-        max_colors = max(feature_colors.values())
+        max_colors = int(feature_colors.max())
         feedback.pushInfo(self.tr('{} colors required').format(max_colors))
 
-        total = 20.0 / len(features)
-        current = 0
-        for feature_id, input_feature in features.items():
-            output_feature = input_feature
-            attributes = input_feature.attributes()
-            if feature_id in feature_colors:
-                attributes.append(feature_colors[feature_id])
+        # features are read again, so only the colors are kept in memory
+        total = 20.0 / QgsProcessingUtils.featureCount(layer, context)
+        for current, output_feature in enumerate(QgsProcessingUtils.getFeatures(layer, context)):
+            attributes = output_feature.attributes()
+            node = topology.node(output_feature.id()) if output_feature.hasGeometry() else None
+            if node is not None:
+                attributes.append(int(feature_colors[node]))
             else:
                 attributes.append(NULL)
             output_feature.setAttributes(attributes)
 
             writer.addFeature(output_feature)
-            current += 1
             feedback.setProgress(80 + int(current * total))
 
         del writer
 
     @staticmethod
-    def compute_graph(features, feedback, create_id_graph=False, min_distance=0):
-        """ compute topology from a layer/field """
-        s = Graph(sort_graph=False)
-        id_graph = None
-        if create_id_graph:
-            id_graph = Graph(sort_graph=True)
-
+    def compute_graph(layer, context, feedback, min_distance=0):
+        """ compute topology from a layer """
         # skip features without geometry
-        features_with_geometry = {f_id: f for (f_id, f) in features.items() if f.hasGeometry()}
+        request = QgsFeatureRequest().setSubsetOfAttributes([])
+        fids = []
+        geometries = []
+        for f in QgsProcessingUtils.getFeatures(layer, context, request):
+            if f.hasGeometry():
+                fids.append(f.id())
+                geometries.append(f.geometry())
+
+        graph = Graph(fids)
+        if not geometries:
+            return graph
+
+        # bulk loading is much faster than inserting features one by one
+        index = QgsSpatialIndex(QgsProcessingUtils.getFeatures(layer, context, request))
+
+        # each pair of features is tested once, from the feature coming
+        # last in the layer
+        sources = array('q')
+        targets = array('q')
+        areas = numpy.empty(len(geometries))
+        centroids = numpy.empty((len(geometries), 2))
+        total = 70.0 / len(geometries)
+        for i, g in enumerate(geometries):
+            areas[i] = g.area()
+            centroid = g.centroid().geometry()
+            centroids[i] = (centroid.x(), centroid.y())
 
-        total = 70.0 / len(features_with_geometry)
-        index = QgsSpatialIndex()
-
-        i = 0
-        for feature_id, f in features_with_geometry.items():
-            g = f.geometry()
             if min_distance > 0:
                 g = g.buffer(min_distance, 5)
 
@@ -160,127 +170,137 @@ class TopoColor(GeoAlgorithm):
             feature_bounds = g.boundingBox()
             # grow bounds a little so we get touching features
             feature_bounds.grow(feature_bounds.width() * 0.01)
-            intersections = index.intersects(feature_bounds)
-            for l2 in intersections:
-                f2 = features_with_geometry[l2]
-                if engine.intersects(f2.geometry().geometry()):
-                    s.add_edge(f.id(), f2.id())
-                    s.add_edge(f2.id(), f.id())
-                    if id_graph:
-                        id_graph.add_edge(f.id(), f2.id())
-
-            index.insertFeature(f)
-            i += 1
-            feedback.setProgress(int(i * total))
+            candidates = graph.nodes(index.intersects(feature_bounds))
+            for j in numpy.sort(candidates[candidates < i]):
+                if engine.intersects(geometries[j].geometry()):
+                    sources.append(i)
+                    targets.append(int(j))
 
-        for feature_id, f in features_with_geometry.items():
-            if feature_id not in s.node_edge:
-                s.add_edge(feature_id, None)
+            feedback.setProgress(int((i + 1) * total))
 
-        return s, id_graph
+        # geometries are not needed anymore
+        del geometries
+        graph.set_edges(numpy.array(sources, dtype=numpy.int64),
+                        numpy.array(targets, dtype=numpy.int64))
+        graph.areas = areas
+        graph.centroids = centroids
+        return graph
 
 
 class ColoringAlgorithm:
 
     @staticmethod
-    def balanced(features, graph, feedback, balance=0, min_colors=4):
-        feature_colors = {}
-        # start with minimum number of colors in pool
-        color_pool = set(range(1, min_colors + 1))
-
-        # calculate count of neighbours
-        neighbour_count = defaultdict(int)
-        for feature_id, neighbours in graph.node_edge.items():
-            neighbour_count[feature_id] += len(neighbours)
-
+    def balanced(graph, feedback, balance=0, min_colors=4):
+        """Returns an array with the color assigned to each node of the
+        graph, starting from 1.
+        """
         # sort features by neighbour count - we want to handle those with more neighbours first
-        sorted_by_count = [feature_id for feature_id in sorted(neighbour_count.items(),
-                                                               key=operator.itemgetter(1),
-                                                               reverse=True)]
-        # counts for each color already assigned
-        color_counts = defaultdict(int)
-        color_areas = defaultdict(float)
-        for c in color_pool:
-            color_counts[c] = 0
-            color_areas[c] = 0
-
-        total = 10.0 / len(sorted_by_count)
-        i = 0
-
-        for (feature_id, n) in sorted_by_count:
-            # first work out which already assigned colors are adjacent to this feature
-            adjacent_colors = set()
-            for neighbour in graph.node_edge[feature_id]:
-                if neighbour in feature_colors:
-                    adjacent_colors.add(feature_colors[neighbour])
-
-            # from the existing colors, work out which are available (ie non-adjacent)
-            available_colors = color_pool.difference(adjacent_colors)
-
-            feature_color = -1
-            if len(available_colors) == 0:
-                # no existing colors available for this feature, so add new color to pool and repeat
-                min_colors += 1
-                return ColoringAlgorithm.balanced(features, graph, feedback, balance, min_colors)
-            else:
+        degrees = graph.degrees()
+        sorted_by_count = graph.order[numpy.argsort(-degrees[graph.order], kind='mergesort')]
+
+        total = 10.0 / len(sorted_by_count) if len(sorted_by_count) else 0
+        while True:
+            feature_colors = numpy.zeros(len(graph), dtype=numpy.int32)
+            # start with minimum number of colors in pool
+            color_pool = list(range(1, min_colors + 1))
+            # counts for each color already assigned
+            color_counts = [0] * (min_colors + 1)
+            color_areas = [0.0] * (min_colors + 1)
+
+            for i, feature_id in enumerate(sorted_by_count):
+                # first work out which already assigned colors are adjacent to this feature
+                adjacent_colors = set(feature_colors[graph.neighbours(feature_id)].tolist())
+
+                # from the existing colors, work out which are available (ie non-adjacent)
+                available_colors = [c for c in color_pool if c not in adjacent_colors]
+
+                if len(available_colors) == 0:
+                    # no existing colors available for this feature, so add new color to pool and repeat
+                    min_colors += 1
+                    break
+
                 if balance == 0:
                     # choose least used available color
-                    counts = [(c, v) for c, v in color_counts.items() if c in available_colors]
-                    feature_color = sorted(counts, key=operator.itemgetter(1))[0][0]
+                    feature_color = min(available_colors, key=color_counts.__getitem__)
                     color_counts[feature_color] += 1
                 elif balance == 1:
-                    areas = [(c, v) for c, v in color_areas.items() if c in available_colors]
-                    feature_color = sorted(areas, key=operator.itemgetter(1))[0][0]
-                    color_areas[feature_color] += features[feature_id].geometry().area()
-                elif balance == 2:
+                    feature_color = min(available_colors, key=color_areas.__getitem__)
+                    color_areas[feature_color] += graph.areas[feature_id]
+                else:
+                    # calculate the minimum distance from this feature to the nearest
+                    # feature with each available color
                     min_distances = {c: sys.float_info.max for c in available_colors}
-                    this_feature_centroid = QgsPointV2(features[feature_id].geometry().centroid().geometry())
-
-                    # find features for all available colors
-                    other_features = {f_id: c for (f_id, c) in feature_colors.items() if c in available_colors}
-
-                    # loop through these, and calculate the minimum distance from this feature to the nearest
-                    # feature with each assigned color
-                    for other_feature_id, c in other_features.items():
-                        other_geometry = features[other_feature_id].geometry()
-                        other_centroid = QgsPointV2(other_geometry.centroid().geometry())
-
-                        distance = this_feature_centroid.distanceSquared(other_centroid)
-                        if distance < min_distances[c]:
-                            min_distances[c] = distance
+                    for c in available_colors:
+                        same_color = feature_colors == c
+                        if same_color.any():
+                            delta = graph.centroids[same_color] - graph.centroids[feature_id]
+                            min_distances[c] = (delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1]).min()
 
                     # choose color such that minimum distance is maximised! ie we want MAXIMAL separation between
                     # features with the same color
-                    feature_color = sorted(min_distances, key=min_distances.__getitem__, reverse=True)[0]
+                    feature_color = max(available_colors, key=min_distances.__getitem__)
 
-            feature_colors[feature_id] = feature_color
-
-            i += 1
-            feedback.setProgress(70 + int(i * total))
-
-        return feature_colors
+                feature_colors[feature_id] = feature_color
+                feedback.setProgress(70 + int((i + 1) * total))
+            else:
+                return feature_colors
 
 
 class Graph:
 
-    def __init__(self, sort_graph=True):
-        self.sort_graph = sort_graph
-        self.node_edge = {}
-
-    def add_edge(self, i, j):
-        ij = [i, j]
-        if self.sort_graph:
-            ij.sort()
-        (i, j) = ij
-        if i in self.node_edge:
-            self.node_edge[i].add(j)
-        else:
-            self.node_edge[i] = {j}
-
-    def make_full(self):
-        g = Graph(sort_graph=False)
-        for k in self.node_edge.keys():
-            for v in self.node_edge[k]:
-                g.add_edge(v, k)
-                g.add_edge(k, v)
-        return g
+    """Adjacency graph of the features of a layer, in compressed sparse
+    row form.
+
+    Nodes are numbered in the order of the layer: fids[i] is the id of
+    the feature of node i, and its neighbours are the nodes in
+    indices[indptr[i]:indptr[i + 1]]. order lists the nodes in the
+    order their first edge was found, followed by the isolated nodes.
+    """
+
+    def __init__(self, fids):
+        self.fids = numpy.array(fids, dtype=numpy.int64)
+        self.sorter = numpy.argsort(self.fids, kind='mergesort')
+        self.set_edges(numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64))
+        self.areas = numpy.zeros(len(fids))
+        self.centroids = numpy.zeros((len(fids), 2))
+
+    def __len__(self):
+        return len(self.fids)
+
+    def nodes(self, fids):
+        """Returns an array with the nodes of a list of feature ids,
+        which must all be in the graph.
+        """
+        fids = numpy.array(fids, dtype=numpy.int64)
+        return self.sorter[numpy.searchsorted(self.fids, fids, sorter=self.sorter)]
+
+    def node(self, fid):
+        """Returns the node of a feature id, or None if it is not in the graph."""
+        if not len(self.fids):
+            return None
+        i = numpy.searchsorted(self.fids, fid, sorter=self.sorter)
+        if i < len(self.fids) and self.fids[self.sorter[i]] == fid:
+            return int(self.sorter[i])
+        return None
+
+    def set_edges(self, sources, targets):
+        """Sets the edges of the graph from two arrays of nodes, in the
+        order the edges were found.
+        """
+        n = len(self.fids)
+        rows = numpy.concatenate((sources, targets))
+        cols = numpy.concatenate((targets, sources))
+        self.indices = cols[numpy.argsort(rows, kind='mergesort')]
+        self.indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+        self.indptr[1:] = numpy.cumsum(numpy.bincount(rows, minlength=n))
+
+        found, first = numpy.unique(numpy.column_stack((sources, targets)).ravel(), return_index=True)
+        connected = found[numpy.argsort(first, kind='mergesort')]
+        isolated = numpy.nonzero(self.degrees() == 0)[0]
+        self.order = numpy.concatenate((connected, isolated)).astype(numpy.int64)
+
+    def degrees(self):
+        return numpy.diff(self.indptr)
+
+    def neighbours(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
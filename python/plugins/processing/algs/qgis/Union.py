@@ -29,8 +29,7 @@ import os
 
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.core import (QgsFeatureRequest,
-                       QgsFeature,
+from qgis.core import (QgsFeature,
                        QgsGeometry,
                        QgsWkbTypes,
                        QgsMessageLog,
@@ -86,10 +85,9 @@ class Union(GeoAlgorithm):
         fields = vector.combineVectorFields(vlayerA, vlayerB)
         writer = self.getOutputFromName(Union.OUTPUT).getVectorWriter(fields, geomType, vlayerA.crs(), context)
         inFeatA = QgsFeature()
-        inFeatB = QgsFeature()
         outFeat = QgsFeature()
-        indexA = QgsProcessingUtils.createSpatialIndex(vlayerB, context)
-        indexB = QgsProcessingUtils.createSpatialIndex(vlayerA, context)
+        cacheB = vector.FeatureCache(vlayerB, context)
+        cacheA = vector.FeatureCache(vlayerA, context, attributes=False)
 
         count = 0
         nElement = 0
@@ -101,8 +99,8 @@ class Union(GeoAlgorithm):
             lstIntersectingB = []
             geom = inFeatA.geometry()
             atMapA = inFeatA.attributes()
-            intersects = indexA.intersects(geom.boundingBox())
-            if len(intersects) < 1:
+            candidates = cacheB.candidates(geom.boundingBox())
+            if len(candidates) < 1:
                 try:
                     outFeat.setGeometry(geom)
                     outFeat.setAttributes(atMapA)
@@ -113,17 +111,12 @@ class Union(GeoAlgorithm):
                     QgsMessageLog.logMessage(self.tr('Feature geometry error: One or more output features ignored due to invalid geometry.'),
                                              self.tr('Processing'), QgsMessageLog.INFO)
             else:
-                request = QgsFeatureRequest().setFilterFids(intersects)
-
                 engine = QgsGeometry.createGeometryEngine(geom.geometry())
                 engine.prepareGeometry()
 
-                for inFeatB in vlayerB.getFeatures(request):
+                for fid, tmpGeom, atMapB in candidates:
                     count += 1
 
-                    atMapB = inFeatB.attributes()
-                    tmpGeom = inFeatB.geometry()
-
                     if engine.intersects(tmpGeom.geometry()):
                         int_geom = geom.intersection(tmpGeom)
                         lstIntersectingB.append(tmpGeom)
@@ -195,9 +188,9 @@ class Union(GeoAlgorithm):
             diff_geom = QgsGeometry(geom)
             atMap = [None] * length
             atMap.extend(inFeatA.attributes())
-            intersects = indexB.intersects(geom.boundingBox())
+            candidates = cacheA.candidates(geom.boundingBox())
 
-            if len(intersects) < 1:
+            if len(candidates) < 1:
                 try:
                     outFeat.setGeometry(geom)
                     outFeat.setAttributes(atMap)
@@ -206,16 +199,11 @@ class Union(GeoAlgorithm):
                     QgsMessageLog.logMessage(self.tr('Feature geometry error: One or more output features ignored due to invalid geometry.'),
                                              self.tr('Processing'), QgsMessageLog.INFO)
             else:
-                request = QgsFeatureRequest().setFilterFids(intersects)
-
                 # use prepared geometries for faster intersection tests
                 engine = QgsGeometry.createGeometryEngine(diff_geom.geometry())
                 engine.prepareGeometry()
 
-                for inFeatB in vlayerA.getFeatures(request):
-                    atMapB = inFeatB.attributes()
-                    tmpGeom = inFeatB.geometry()
-
+                for fid, tmpGeom, atMapB in candidates:
                     if engine.intersects(tmpGeom.geometry()):
                         add = True
                         diff_geom = QgsGeometry(diff_geom.difference(tmpGeom))
@@ -73,23 +73,18 @@ class VectorSplit(GeoAlgorithm):
 
         mkdir(directory)
 
-        fieldIndex = layer.fields().lookupField(fieldName)
-        uniqueValues = QgsProcessingUtils.uniqueValues(layer, fieldIndex, context)
         baseName = os.path.join(directory, '{0}_{1}'.format(layer.name(), fieldName))
 
-        fields = layer.fields()
-        crs = layer.crs()
-        geomType = layer.wkbType()
+        def destination(value):
+            return u'{0}_{1}.shp'.format(baseName, value)
 
-        total = 100.0 / len(uniqueValues)
-
-        for current, i in enumerate(uniqueValues):
-            fName = u'{0}_{1}.shp'.format(baseName, str(i).strip())
-
-            writer, dest = QgsProcessingUtils.createFeatureSink(fName, None, fields, geomType, crs, context)
-            for f in QgsProcessingUtils.getFeatures(layer, context):
-                if f[fieldName] == i:
-                    writer.addFeature(f)
-            del writer
+        sink = vector.PartitionedFeatureSink(destination, layer.fields(), layer.wkbType(),
+                                             layer.crs(), context)
 
+        features = QgsProcessingUtils.getFeatures(layer, context)
+        total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
+        for current, f in enumerate(features):
+            sink.addFeature(str(f[fieldName]).strip(), f)
             feedback.setProgress(int(current * total))
+
+        sink.close()
@@ -16,7 +16,6 @@
 *                                                                         *
 ***************************************************************************
 """
-from builtins import next
 
 __author__ = 'Victor Olaya'
 __date__ = 'August 2012'
@@ -30,9 +29,16 @@ import os
 
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.core import QgsFeatureRequest, QgsFeature, QgsGeometry, QgsPoint, QgsWkbTypes, QgsProcessingUtils
+from qgis.core import (QgsFeature,
+                       QgsGeometry,
+                       QgsPoint,
+                       QgsRectangle,
+                       QgsSpatialIndex,
+                       QgsWkbTypes,
+                       QgsProcessingUtils)
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.ProcessingConfig import ProcessingConfig
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterNumber
@@ -86,8 +92,10 @@ class VoronoiPolygons(GeoAlgorithm):
         width = extent.width()
         c = voronoi.Context()
         pts = []
-        ptDict = {}
-        ptNdx = -1
+        # index of the first occurrence of each coordinate pair, and the
+        # attributes of the feature it belongs to
+        firstIndex = {}
+        attributes = {}
 
         features = QgsProcessingUtils.getFeatures(layer, context)
         total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
@@ -96,9 +104,10 @@ class VoronoiPolygons(GeoAlgorithm):
             point = geom.asPoint()
             x = point.x() - extent.xMinimum()
             y = point.y() - extent.yMinimum()
+            if (x, y) not in firstIndex:
+                firstIndex[(x, y)] = len(pts)
+                attributes[len(pts)] = inFeat.attributes()
             pts.append((x, y))
-            ptNdx += 1
-            ptDict[ptNdx] = inFeat.id()
             feedback.setProgress(int(current * total))
 
         if len(pts) < 3:
@@ -106,12 +115,16 @@ class VoronoiPolygons(GeoAlgorithm):
                 self.tr('Input file should contain at least 3 points. Choose '
                         'another file and try again.'))
 
+        if ProcessingConfig.getSetting(ProcessingConfig.USE_GEOS_TRIANGULATION):
+            self.writeGeosPolygons(writer, firstIndex, attributes, extent, extraX, extraY, feedback)
+            del writer
+            return
+
         uniqueSet = set(item for item in pts)
-        ids = [pts.index(item) for item in uniqueSet]
+        ids = [firstIndex[item] for item in uniqueSet]
         sl = voronoi.SiteList([voronoi.Site(i[0], i[1], sitenum=j) for (j,
                                                                         i) in enumerate(uniqueSet)])
         voronoi.voronoi(sl, c)
-        inFeat = QgsFeature()
 
         current = 0
         if len(c.polygons) == 0:
@@ -121,14 +134,12 @@ class VoronoiPolygons(GeoAlgorithm):
         total = 100.0 / len(c.polygons)
 
         for (site, edges) in list(c.polygons.items()):
-            request = QgsFeatureRequest().setFilterFid(ptDict[ids[site]])
-            inFeat = next(layer.getFeatures(request))
             lines = self.clip_voronoi(edges, c, width, height, extent, extraX, extraY)
 
             geom = QgsGeometry.fromMultiPoint(lines)
             geom = QgsGeometry(geom.convexHull())
             outFeat.setGeometry(geom)
-            outFeat.setAttributes(inFeat.attributes())
+            outFeat.setAttributes(attributes[ids[site]])
             writer.addFeature(outFeat)
 
             current += 1
@@ -136,6 +147,40 @@ class VoronoiPolygons(GeoAlgorithm):
 
         del writer
 
+    def writeGeosPolygons(self, writer, firstIndex, attributes, extent, extraX, extraY, feedback):
+        """Writes the Voronoi polygons computed by GEOS, clipped to the
+        buffered extent. Every point in a cell is closer to its site than
+        to any other one, so cells are matched to their sites with a
+        nearest neighbour query.
+        """
+        index = QgsSpatialIndex()
+        sites = []
+        for (x, y), i in firstIndex.items():
+            f = QgsFeature(i)
+            point = QgsPoint(x + extent.xMinimum(), y + extent.yMinimum())
+            f.setGeometry(QgsGeometry.fromPoint(point))
+            index.insertFeature(f)
+            sites.append(point)
+
+        clip = QgsGeometry.fromRect(QgsRectangle(extent.xMinimum() - extraX, extent.yMinimum() - extraY,
+                                                 extent.xMaximum() + extraX, extent.yMaximum() + extraY))
+        diagram = QgsGeometry.fromMultiPoint(sites).voronoiDiagram(clip)
+        cells = diagram.asGeometryCollection()
+        if len(cells) == 0:
+            raise GeoAlgorithmExecutionException(
+                self.tr('There were no polygons created.'))
+
+        outFeat = QgsFeature()
+        total = 100.0 / len(cells)
+        for current, cell in enumerate(cells):
+            site = index.nearestNeighbor(cell.pointOnSurface().asPoint(), 1)[0]
+            geom = cell.intersection(clip)
+            if not geom.isEmpty():
+                outFeat.setGeometry(geom)
+                outFeat.setAttributes(attributes[site])
+                writer.addFeature(outFeat)
+            feedback.setProgress(int(current * total))
+
     def clip_voronoi(self, edges, c, width, height, extent, exX, exY):
         """Clip voronoi function based on code written for Inkscape.
         Copyright (C) 2010 Alvin Penner, penner@vaxxine.com
@@ -28,13 +28,15 @@ __revision__ = '$Format:%H$'
 
 import numpy
 
+# the mode column is only added when SciPy is available, as it used
+# to be computed with scipy.stats.mstats.mode
 try:
-    from scipy.stats.mstats import mode
+    import scipy  # NOQA
     hasSciPy = True
 except:
     hasSciPy = False
 
-from osgeo import gdal, ogr, osr
+from osgeo import gdal
 from qgis.core import (QgsApplication,
                        QgsRectangle,
                        QgsGeometry,
@@ -48,7 +50,7 @@ from processing.core.parameters import ParameterString
 from processing.core.parameters import ParameterNumber
 from processing.core.parameters import ParameterBoolean
 from processing.core.outputs import OutputVector
-from processing.tools.raster import mapToPixel
+from processing.tools.raster import mapToPixel, ZonalStatisticsEngine
 from processing.tools import dataobjects, vector
 
 
@@ -105,8 +107,6 @@ class ZonalStatistics(GeoAlgorithm):
 
         rasterDS = gdal.Open(rasterPath, gdal.GA_ReadOnly)
         geoTransform = rasterDS.GetGeoTransform()
-        rasterBand = rasterDS.GetRasterBand(bandNumber)
-        noData = rasterBand.GetNoDataValue()
 
         cellXSize = abs(geoTransform[1])
         cellYSize = abs(geoTransform[5])
@@ -119,37 +119,13 @@ class ZonalStatistics(GeoAlgorithm):
                                   geoTransform[3])
 
         rasterGeom = QgsGeometry.fromRect(rasterBBox)
+        rasterDS = None
 
-        crs = osr.SpatialReference()
-        crs.ImportFromProj4(str(layer.crs().toProj4()))
-
-        if useGlobalExtent:
-            xMin = rasterBBox.xMinimum()
-            xMax = rasterBBox.xMaximum()
-            yMin = rasterBBox.yMinimum()
-            yMax = rasterBBox.yMaximum()
-
-            (startColumn, startRow) = mapToPixel(xMin, yMax, geoTransform)
-            (endColumn, endRow) = mapToPixel(xMax, yMin, geoTransform)
-
-            width = endColumn - startColumn
-            height = endRow - startRow
-
-            srcOffset = (startColumn, startRow, width, height)
-            srcArray = rasterBand.ReadAsArray(*srcOffset)
-            srcArray = srcArray * rasterBand.GetScale() + rasterBand.GetOffset()
-
-            newGeoTransform = (
-                geoTransform[0] + srcOffset[0] * geoTransform[1],
-                geoTransform[1],
-                0.0,
-                geoTransform[3] + srcOffset[1] * geoTransform[5],
-                0.0,
-                geoTransform[5],
-            )
-
-        memVectorDriver = ogr.GetDriverByName('Memory')
-        memRasterDriver = gdal.GetDriverByName('MEM')
+        # zones are rasterized together block by block, reading every
+        # pixel once; the whole raster is a single block when loading it
+        # in memory is requested
+        engine = ZonalStatisticsEngine(rasterPath, bandNumber,
+                                       None if useGlobalExtent else 2048)
 
         fields = layer.fields()
         (idxMin, fields) = vector.findOrCreateField(layer, fields,
@@ -179,29 +155,19 @@ class ZonalStatistics(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT_LAYER).getVectorWriter(fields, layer.wkbType(),
                                                                            layer.crs(), context)
 
-        outFeat = QgsFeature()
-
-        outFeat.initAttributes(len(fields))
-        outFeat.setFields(fields)
-
+        # first pass: register zones
+        feedback.setProgressText(self.tr('Collecting zones'))
+        zones = {}
         features = QgsProcessingUtils.getFeatures(layer, context)
-        total = 100.0 / QgsProcessingUtils.featureCount(layer, context)
-        for current, f in enumerate(features):
-            geom = f.geometry()
-
-            intersectedGeom = rasterGeom.intersection(geom)
-            ogrGeom = ogr.CreateGeometryFromWkt(intersectedGeom.exportToWkt())
+        for f in features:
+            intersectedGeom = rasterGeom.intersection(f.geometry())
 
+            window = None
             if not useGlobalExtent:
                 bbox = intersectedGeom.boundingBox()
 
-                xMin = bbox.xMinimum()
-                xMax = bbox.xMaximum()
-                yMin = bbox.yMinimum()
-                yMax = bbox.yMaximum()
-
-                (startColumn, startRow) = mapToPixel(xMin, yMax, geoTransform)
-                (endColumn, endRow) = mapToPixel(xMax, yMin, geoTransform)
+                (startColumn, startRow) = mapToPixel(bbox.xMinimum(), bbox.yMaximum(), geoTransform)
+                (endColumn, endRow) = mapToPixel(bbox.xMaximum(), bbox.yMinimum(), geoTransform)
 
                 width = endColumn - startColumn
                 height = endRow - startRow
@@ -209,72 +175,46 @@ class ZonalStatistics(GeoAlgorithm):
                 if width == 0 or height == 0:
                     continue
 
-                srcOffset = (startColumn, startRow, width, height)
-                srcArray = rasterBand.ReadAsArray(*srcOffset)
-                srcArray = srcArray * rasterBand.GetScale() + rasterBand.GetOffset()
-
-                newGeoTransform = (
-                    geoTransform[0] + srcOffset[0] * geoTransform[1],
-                    geoTransform[1],
-                    0.0,
-                    geoTransform[3] + srcOffset[1] * geoTransform[5],
-                    0.0,
-                    geoTransform[5],
-                )
-
-            # Create a temporary vector layer in memory
-            memVDS = memVectorDriver.CreateDataSource('out')
-            memLayer = memVDS.CreateLayer('poly', crs, ogr.wkbPolygon)
-
-            ft = ogr.Feature(memLayer.GetLayerDefn())
-            ft.SetGeometry(ogrGeom)
-            memLayer.CreateFeature(ft)
-            ft.Destroy()
-
-            # Rasterize it
-            rasterizedDS = memRasterDriver.Create('', srcOffset[2],
-                                                  srcOffset[3], 1, gdal.GDT_Byte)
-            rasterizedDS.SetGeoTransform(newGeoTransform)
-            gdal.RasterizeLayer(rasterizedDS, [1], memLayer, burn_values=[1])
-            rasterizedArray = rasterizedDS.ReadAsArray()
-
-            srcArray = numpy.nan_to_num(srcArray)
-            masked = numpy.ma.MaskedArray(srcArray,
-                                          mask=numpy.logical_or(srcArray == noData,
-                                                                numpy.logical_not(rasterizedArray)))
-
-            outFeat.setGeometry(geom)
+                window = (startColumn, startRow, width, height)
+
+            zones[f.id()] = engine.addZone(intersectedGeom, window)
+
+        feedback.setProgressText(self.tr('Calculating statistics'))
+        stats = engine.compute(feedback)
+        engine.close()
+
+        def value(name, zone):
+            v = float(stats[name][zone])
+            return None if numpy.isnan(v) else v
+
+        # second pass: write zones with their statistics
+        outFeat = QgsFeature()
+        outFeat.initAttributes(len(fields))
+        outFeat.setFields(fields)
+
+        features = QgsProcessingUtils.getFeatures(layer, context)
+        for f in features:
+            if f.id() not in zones:
+                continue
+
+            zone = zones[f.id()]
+            outFeat.setGeometry(f.geometry())
 
             attrs = f.attributes()
-            v = float(masked.min())
-            attrs.insert(idxMin, None if numpy.isnan(v) else v)
-            v = float(masked.max())
-            attrs.insert(idxMax, None if numpy.isnan(v) else v)
-            v = float(masked.sum())
-            attrs.insert(idxSum, None if numpy.isnan(v) else v)
-            attrs.insert(idxCount, int(masked.count()))
-            v = float(masked.mean())
-            attrs.insert(idxMean, None if numpy.isnan(v) else v)
-            v = float(masked.std())
-            attrs.insert(idxStd, None if numpy.isnan(v) else v)
-            attrs.insert(idxUnique, numpy.unique(masked.compressed()).size)
-            v = float(masked.max()) - float(masked.min())
-            attrs.insert(idxRange, None if numpy.isnan(v) else v)
-            v = float(masked.var())
-            attrs.insert(idxVar, None if numpy.isnan(v) else v)
-            v = float(numpy.ma.median(masked))
-            attrs.insert(idxMedian, None if numpy.isnan(v) else v)
+            attrs.insert(idxMin, value('min', zone))
+            attrs.insert(idxMax, value('max', zone))
+            attrs.insert(idxSum, value('sum', zone))
+            attrs.insert(idxCount, int(stats['count'][zone]))
+            attrs.insert(idxMean, value('mean', zone))
+            attrs.insert(idxStd, value('std', zone))
+            attrs.insert(idxUnique, int(stats['unique'][zone]))
+            attrs.insert(idxRange, value('range', zone))
+            attrs.insert(idxVar, value('var', zone))
+            attrs.insert(idxMedian, value('median', zone))
             if hasSciPy:
-                attrs.insert(idxMode, float(mode(masked, axis=None)[0][0]))
+                attrs.insert(idxMode, value('mode', zone))
 
             outFeat.setAttributes(attrs)
             writer.addFeature(outFeat)
 
-            memVDS = None
-            rasterizedDS = None
-
-            feedback.setProgress(int(current * total))
-
-        rasterDS = None
-
         del writer
@@ -28,6 +28,7 @@ __revision__ = '$Format:%H$'
 
 import os
 import re
+import time
 
 from qgis.PyQt import uic
 from qgis.PyQt.QtCore import Qt
@@ -223,10 +224,12 @@ class FieldsCalculatorDialog(BASE, WIDGET):
         try:
             if self.setParamValues():
                 QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
-                ProcessingLog.addToLog(self.alg.getAsCommand())
+                entryId = ProcessingLog.addToLog(self.alg.getAsCommand())
 
                 context = dataobjects.createContext()
+                start = time.time()
                 self.executed = execute(self.alg, context, self.feedback)
+                ProcessingLog.finishLogEntry(entryId, self.alg, context, time.time() - start, self.executed)
                 if self.executed:
                     handleAlgorithmResults(self.alg,
                                            context,
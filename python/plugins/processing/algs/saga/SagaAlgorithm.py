@@ -32,6 +32,7 @@ __revision__ = '$Format:%H$'
 
 import os
 import importlib
+import threading
 from qgis.PyQt.QtCore import QCoreApplication
 from qgis.PyQt.QtGui import QIcon
 from qgis.core import (QgsProcessingUtils,
@@ -61,12 +62,19 @@ pluginPath = os.path.normpath(os.path.join(
     os.path.split(os.path.dirname(__file__))[0], os.pardir))
 
 sessionExportedLayers = {}
+# guards sessionExportedLayers, as algorithms can run at the same time
+sessionLock = threading.Lock()
 
 
 class SagaAlgorithm(GeoAlgorithm):
 
     OUTPUT_EXTENT = 'OUTPUT_EXTENT'
 
+    # algorithms with random results, which are never reused from the result cache
+    STOCHASTIC_ALGORITHMS = ['Grid Values to Points (randomly)', 'Random Field',
+                             'Random Terrain Generation', 'Simulation',
+                             'Split Shapes Layer Randomly']
+
     def __init__(self, descriptionfile):
         GeoAlgorithm.__init__(self)
         self.hardcodedStrings = []
@@ -108,6 +116,7 @@ class SagaAlgorithm(GeoAlgorithm):
             else:
                 self.cmdname = self._name
                 self._display_name = QCoreApplication.translate("SAGAAlgorithm", str(self._name))
+            self.useResultCache = self._name not in self.STOCHASTIC_ALGORITHMS
             self._name = decoratedAlgorithmName(self._name)
             self._display_name = QCoreApplication.translate("SAGAAlgorithm", str(self._name))
 
@@ -139,6 +148,7 @@ class SagaAlgorithm(GeoAlgorithm):
     def processAlgorithm(self, context, feedback):
         commands = list()
         self.exportedLayers = {}
+        self.exportedRasters = {}
 
         self.preProcessInputs()
 
@@ -267,7 +277,7 @@ class SagaAlgorithm(GeoAlgorithm):
 
         # 3: Run SAGA
         commands = self.editCommands(commands)
-        SagaUtils.createSagaBatchJobFileFromSagaCommands(commands)
+        batchfile = SagaUtils.createSagaBatchJobFileFromSagaCommands(commands)
         loglines = []
         loglines.append(self.tr('SAGA execution commands'))
         for line in commands:
@@ -275,7 +285,14 @@ class SagaAlgorithm(GeoAlgorithm):
             loglines.append(line)
         if ProcessingConfig.getSetting(SagaUtils.SAGA_LOG_COMMANDS):
             QgsMessageLog.logMessage('\n'.join(loglines), self.tr('Processing'), QgsMessageLog.INFO)
-        SagaUtils.executeSaga(feedback)
+        SagaUtils.executeSaga(batchfile, feedback)
+
+        # Only make the exported rasters available to other algorithms
+        # once they have been written
+        with sessionLock:
+            for source, filename in self.exportedRasters.items():
+                if os.path.exists(filename):
+                    sessionExportedLayers[source] = filename
 
         if self.crs is not None:
             for out in self.outputs:
@@ -318,15 +335,15 @@ class SagaAlgorithm(GeoAlgorithm):
         return cellsize
 
     def exportRasterLayer(self, source):
-        global sessionExportedLayers
         context = dataobjects.createContext()
-        if source in sessionExportedLayers:
-            exportedLayer = sessionExportedLayers[source]
-            if os.path.exists(exportedLayer):
-                self.exportedLayers[source] = exportedLayer
-                return None
-            else:
-                del sessionExportedLayers[source]
+        with sessionLock:
+            if source in sessionExportedLayers:
+                exportedLayer = sessionExportedLayers[source]
+                if os.path.exists(exportedLayer):
+                    self.exportedLayers[source] = exportedLayer
+                    return None
+                else:
+                    del sessionExportedLayers[source]
         layer = QgsProcessingUtils.mapLayerFromString(source, context, False)
         if layer:
             filename = str(layer.name())
@@ -338,7 +355,7 @@ class SagaAlgorithm(GeoAlgorithm):
             filename = 'layer'
         destFilename = getTempFilenameInTempFolder(filename + '.sgrd')
         self.exportedLayers[source] = destFilename
-        sessionExportedLayers[source] = destFilename
+        self.exportedRasters[source] = destFilename
         return 'io_gdal 0 -TRANSFORM 1 -RESAMPLING 0 -GRIDS "' + destFilename + '" -FILES "' + source + '"'
 
     def checkParameterValuesBeforeExecuting(self):
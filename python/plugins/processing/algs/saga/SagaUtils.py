@@ -27,6 +27,7 @@ __revision__ = '$Format:%H$'
 
 import os
 import stat
+import shutil
 import subprocess
 import time
 
@@ -35,7 +36,7 @@ from qgis.core import (QgsApplication,
                        QgsProcessingUtils,
                        QgsMessageLog)
 from processing.core.ProcessingConfig import ProcessingConfig
-from processing.tools.system import isWindows, isMac, userFolder
+from processing.tools.system import isWindows, isMac, getTempDirInTempFolder
 
 SAGA_LOG_COMMANDS = 'SAGA_LOG_COMMANDS'
 SAGA_LOG_CONSOLE = 'SAGA_LOG_CONSOLE'
@@ -45,13 +46,13 @@ _installedVersion = None
 _installedVersionFound = False
 
 
-def sagaBatchJobFilename():
+def sagaBatchJobFilename(jobFolder):
     if isWindows():
         filename = 'saga_batch_job.bat'
     else:
         filename = 'saga_batch_job.sh'
 
-    batchfile = os.path.join(userFolder(), filename)
+    batchfile = os.path.join(jobFolder, filename)
 
     return batchfile
 
@@ -94,8 +95,12 @@ def sagaDescriptionPath():
 
 
 def createSagaBatchJobFileFromSagaCommands(commands):
-
-    with open(sagaBatchJobFilename(), 'w') as fout:
+    """Writes the batch job for a list of SAGA commands in a new job
+    folder, so several algorithms can be executed at the same time, and
+    returns its filename.
+    """
+    batchfile = sagaBatchJobFilename(getTempDirInTempFolder())
+    with open(batchfile, 'w') as fout:
         if isWindows():
             fout.write('set SAGA=' + sagaPath() + '\n')
             fout.write('set SAGA_MLB=' + os.path.join(sagaPath(), 'modules') + '\n')
@@ -115,6 +120,8 @@ def createSagaBatchJobFileFromSagaCommands(commands):
 
         fout.write('exit')
 
+    return batchfile
+
 
 def getInstalledVersion(runSaga=False):
     global _installedVersion
@@ -161,13 +168,13 @@ def getInstalledVersion(runSaga=False):
     return _installedVersion
 
 
-def executeSaga(feedback):
+def executeSaga(batchfile, feedback):
     if isWindows():
-        command = ['cmd.exe', '/C ', sagaBatchJobFilename()]
+        command = ['cmd.exe', '/C ', batchfile]
     else:
-        os.chmod(sagaBatchJobFilename(), stat.S_IEXEC |
+        os.chmod(batchfile, stat.S_IEXEC |
                  stat.S_IREAD | stat.S_IWRITE)
-        command = [sagaBatchJobFilename()]
+        command = [batchfile]
     loglines = []
     loglines.append(QCoreApplication.translate('SagaUtils', 'SAGA execution console output'))
     with subprocess.Popen(
@@ -194,5 +201,7 @@ def executeSaga(feedback):
         except:
             pass
 
+    shutil.rmtree(os.path.dirname(batchfile), True)
+
     if ProcessingConfig.getSetting(SAGA_LOG_CONSOLE):
         QgsMessageLog.logMessage('\n'.join(loglines), 'Processing', QgsMessageLog.INFO)
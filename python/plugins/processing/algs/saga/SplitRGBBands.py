@@ -94,5 +94,5 @@ class SplitRGBBands(GeoAlgorithm):
         commands.append('%sio_gdal 1 -GRIDS "%s_%s3.sgrd" -FORMAT 1 -TYPE 0 -FILE "%s"' % (lib, temp, trailing, b)
                         )
 
-        SagaUtils.createSagaBatchJobFileFromSagaCommands(commands)
-        SagaUtils.executeSaga(feedback)
+        batchfile = SagaUtils.createSagaBatchJobFileFromSagaCommands(commands)
+        SagaUtils.executeSaga(batchfile, feedback)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    ExportCache.py
+    ---------------------
+    Date                 : June 2017
+    Copyright            : (C) 2017 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'June 2017'
+__copyright__ = '(C) 2017, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.tools.system import tempFolder, mkdir, relatedFiles
+
+
+class ExportCache(object):
+
+    """Keeps the files vector layers are exported to for external
+    applications (SAGA, GRASS, GDAL), keyed by a hash of the layer
+    source, its subset string, the selected features, the target format
+    and the encoding, so layers used by several executions are exported
+    only once.
+
+    Only layers read from files are cached, as changes in other sources
+    (databases, memory layers) can not be detected. Entries are evicted
+    like in ResultCache, least recently used first, when the cache grows
+    beyond its size limit. Entries returned to an execution are pinned
+    until the algorithm finishes (see GeoAlgorithm.execute), so they are
+    never evicted while in use by another thread.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    _lock = threading.Lock()
+
+    # number of executions using each entry, and entries pinned by the
+    # executions of each thread
+    _pinned = {}
+    _local = threading.local()
+
+    @staticmethod
+    def isEnabled():
+        return bool(ProcessingConfig.getSetting(ProcessingConfig.USE_EXPORT_CACHE))
+
+    @staticmethod
+    def cacheFolder():
+        folder = os.path.join(tempFolder(), 'export_cache')
+        mkdir(folder)
+        return folder
+
+    @staticmethod
+    def maxSize():
+        try:
+            return float(ProcessingConfig.getSetting(ProcessingConfig.EXPORT_CACHE_SIZE)) * 1024 * 1024
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def key(layer, extension, encoding, useSelection):
+        """Returns the cache key for exporting a vector layer to a format,
+        or None if the export can not be cached.
+        """
+        if not ExportCache.isEnabled():
+            return None
+        source = layer.source()
+        path = source.split('|')[0]
+        if layer.providerType() != 'ogr' or not os.path.isfile(path):
+            return None
+
+        values = [source, layer.subsetString(), extension, encoding]
+        if useSelection:
+            ids = ','.join(str(i) for i in sorted(layer.selectedFeatureIds()))
+            values.append(hashlib.sha1(ids.encode('utf-8')).hexdigest())
+        for f in sorted(relatedFiles(path)):
+            stat = os.stat(f)
+            values.append((os.path.basename(f), stat.st_size, stat.st_mtime))
+
+        return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get(key):
+        """Returns the exported file for a key, or None if there is no
+        cache entry for it.
+        """
+        entry = os.path.join(ExportCache.cacheFolder(), key)
+        manifestFile = os.path.join(entry, ExportCache.MANIFEST)
+        with ExportCache._lock:
+            try:
+                with open(manifestFile) as f:
+                    manifest = json.load(f)
+                # touch the manifest, so the entry is the most recently used
+                os.utime(manifestFile, None)
+            except (IOError, OSError, ValueError):
+                return None
+            filename = os.path.join(entry, manifest['file'])
+            if not os.path.isfile(filename):
+                return None
+            ExportCache._pin(key)
+        return filename
+
+    @staticmethod
+    def store(key, filename):
+        """Moves an exported file (and its sidecar files) to a new cache
+        entry for a key, and returns its new path. If another execution
+        has stored the same export in the meantime, that one is returned.
+        """
+        folder = ExportCache.cacheFolder()
+        tmp = os.path.join(folder, 'tmp_' + uuid.uuid4().hex)
+        try:
+            mkdir(tmp)
+            for f in relatedFiles(filename):
+                shutil.move(f, os.path.join(tmp, os.path.basename(f)))
+            with open(os.path.join(tmp, ExportCache.MANIFEST), 'w') as f:
+                json.dump({'file': os.path.basename(filename)}, f)
+        except (IOError, OSError):
+            # an export that can not be cached should never make the
+            # algorithm fail
+            shutil.rmtree(tmp, True)
+            return filename
+
+        entry = os.path.join(folder, key)
+        with ExportCache._lock:
+            ExportCache._pin(key)
+            if os.path.exists(entry):
+                shutil.rmtree(tmp, True)
+            else:
+                os.rename(tmp, entry)
+                ExportCache.evict(entry)
+        return os.path.join(entry, os.path.basename(filename))
+
+    @staticmethod
+    def _pin(key):
+        ExportCache._pinned[key] = ExportCache._pinned.get(key, 0) + 1
+        if not hasattr(ExportCache._local, 'keys'):
+            ExportCache._local.keys = []
+        ExportCache._local.keys.append(key)
+
+    @staticmethod
+    def pinCount():
+        """Returns the number of entries pinned by the current thread"""
+        return len(getattr(ExportCache._local, 'keys', []))
+
+    @staticmethod
+    def unpin(count=0):
+        """Unpins the entries pinned by the current thread after the
+        first count ones, so they can be evicted again.
+        """
+        keys = getattr(ExportCache._local, 'keys', [])
+        with ExportCache._lock:
+            for key in keys[count:]:
+                ExportCache._pinned[key] -= 1
+                if not ExportCache._pinned[key]:
+                    del ExportCache._pinned[key]
+            del keys[count:]
+
+    @staticmethod
+    def evict(current):
+        """Removes the least recently used entries until the cache fits
+        in its maximum size. The current entry and the pinned ones are
+        always kept.
+        """
+        folder = ExportCache.cacheFolder()
+        entries = []
+        total = 0
+        for name in os.listdir(folder):
+            entry = os.path.join(folder, name)
+            manifestFile = os.path.join(entry, ExportCache.MANIFEST)
+            if name.startswith('tmp_') or not os.path.isfile(manifestFile):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(manifestFile), size, entry))
+            total += size
+
+        maxSize = ExportCache.maxSize()
+        for lastUsed, size, entry in sorted(entries):
+            if total <= maxSize:
+                break
+            if entry == current or os.path.basename(entry) in ExportCache._pinned:
+                continue
+            shutil.rmtree(entry, True)
+            total -= size
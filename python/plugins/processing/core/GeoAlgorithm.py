@@ -27,13 +27,11 @@ __revision__ = '$Format:%H$'
 
 import os.path
 import traceback
-import subprocess
 import copy
 
 from qgis.PyQt.QtCore import QCoreApplication
 
 from qgis.core import (QgsProcessingFeedback,
-                       QgsSettings,
                        QgsProcessingAlgorithm,
                        QgsProject,
                        QgsProcessingUtils,
@@ -44,6 +42,8 @@ from builtins import object
 from processing.gui.ParametersPanel import ParametersPanel
 from processing.core.ProcessingConfig import ProcessingConfig
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
+from processing.core.ResultCache import ResultCache
+from processing.core.ExportCache import ExportCache
 from processing.core.parameters import ParameterRaster, ParameterVector, ParameterMultipleInput, ParameterTable, Parameter
 from processing.core.outputs import OutputVector, OutputRaster, OutputTable, OutputHTML, Output
 from processing.algs.gdal.GdalUtils import GdalUtils
@@ -53,6 +53,15 @@ from processing.algs.help import shortHelp
 
 class GeoAlgorithm(QgsProcessingAlgorithm):
 
+    # Set to False in algorithms that might produce a different result
+    # every time they are run with the same inputs
+    useResultCache = True
+
+    # Set to True in algorithms that can write their raster outputs as
+    # virtual rasters (VRT) referencing their inputs, so intermediate
+    # outputs of models do not need to be written to disk
+    virtualRasterOutputs = False
+
     def __init__(self):
         super().__init__()
 
@@ -83,6 +92,19 @@ class GeoAlgorithm(QgsProcessingAlgorithm):
         newone.outputs = copy.deepcopy(self.outputs)
         return newone
 
+    def getIndependentCopy(self):
+        """Returns a new instance of this algorithm that does not share
+        parameter or output values with it, so both can be executed
+        at the same time from different threads.
+        """
+        newone = self.__class__.__new__(self.__class__)
+        QgsProcessingAlgorithm.__init__(newone)
+        newone.__dict__.update(self.__dict__)
+        newone.parameters = copy.deepcopy(self.parameters)
+        newone.outputs = copy.deepcopy(self.outputs)
+        newone.setProvider(self.provider())
+        return newone
+
     # methods to overwrite when creating a custom geoalgorithm
 
     def _formatHelp(self, text):
@@ -190,14 +212,21 @@ class GeoAlgorithm(QgsProcessingAlgorithm):
             context = dataobjects.createContext()
 
         self.model = model
+        pinnedExports = ExportCache.pinCount()
         try:
             self.setOutputCRS()
             self.resolveOutputs()
             self.evaluateParameterValues()
             self.runPreExecutionScript(feedback)
-            self.processAlgorithm(context, feedback)
-            feedback.setProgress(100)
-            self.convertUnsupportedFormats(context, feedback)
+            cacheKey = ResultCache.key(self) if ResultCache.isEnabled() else None
+            if cacheKey is not None and ResultCache.restore(self, cacheKey, feedback):
+                feedback.setProgress(100)
+            else:
+                self.processAlgorithm(context, feedback)
+                feedback.setProgress(100)
+                self.convertUnsupportedFormats(context, feedback)
+                if cacheKey is not None:
+                    ResultCache.store(self, cacheKey)
             self.runPostExecutionScript(feedback)
         except GeoAlgorithmExecutionException as gaee:
             lines = [self.tr('Error while executing algorithm')]
@@ -211,6 +240,9 @@ class GeoAlgorithm(QgsProcessingAlgorithm):
             lines.append(traceback.format_exc())
             QgsMessageLog.logMessage('\n'.join(lines), self.tr('Processing'), QgsMessageLog.CRITICAL)
             raise GeoAlgorithmExecutionException(str(e) + self.tr('\nSee log for more details'), lines, e)
+        finally:
+            # the layers exported for the algorithm can be evicted again
+            ExportCache.unpin(pinnedExports)
 
     def _checkParameterValuesBeforeExecuting(self, context=None):
         if context is None:
@@ -259,11 +291,21 @@ class GeoAlgorithm(QgsProcessingAlgorithm):
             pass
 
     def convertUnsupportedFormats(self, context, feedback):
-        i = 0
+        """Converts the outputs written by the algorithm to a temporary
+        file in a supported format to the format requested by the user.
+
+        Vector and raster files are converted in the current process
+        with the GDAL bindings, streaming the data to the destination.
+        """
         feedback.setProgressText(self.tr('Converting outputs'))
-        for out in self.outputs:
+        step = 100.0 / len(self.outputs) if self.outputs else 0
+        for i, out in enumerate(self.outputs):
+            start = i * step
             if isinstance(out, OutputVector):
                 if out.compatible is not None:
+                    if os.path.isabs(out.value) and GdalUtils.translateVector(
+                            out.compatible, out.value, out.encoding, feedback, start, start + step):
+                        continue
                     layer = QgsProcessingUtils.mapLayerFromString(out.compatible, context)
                     if layer is None:
                         # For the case of memory layer, if the
@@ -276,31 +318,11 @@ class GeoAlgorithm(QgsProcessingAlgorithm):
             elif isinstance(out, OutputRaster):
                 if out.compatible is not None:
                     layer = QgsProcessingUtils.mapLayerFromString(out.compatible, context)
-                    format = self.getFormatShortNameFromFilename(out.value)
-                    orgFile = out.compatible
-                    destFile = out.value
-                    crsid = layer.crs().authid()
-                    settings = QgsSettings()
-                    path = str(settings.value('/GdalTools/gdalPath', ''))
-                    envval = str(os.getenv('PATH'))
-                    if not path.lower() in envval.lower().split(os.pathsep):
-                        envval += '%s%s' % (os.pathsep, path)
-                        os.putenv('PATH', envval)
-                    command = 'gdal_translate -of %s -a_srs %s %s %s' % (format, crsid, orgFile, destFile)
-                    if os.name == 'nt':
-                        command = command.split(" ")
-                    else:
-                        command = [command]
-                    proc = subprocess.Popen(
-                        command,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stdin=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        universal_newlines=False,
-                    )
-                    proc.communicate()
-
+                    crsid = layer.crs().authid() if layer is not None else None
+                    options = ProcessingConfig.getSetting(ProcessingConfig.RASTER_CREATION_OPTIONS)
+                    GdalUtils.translateRaster(out.compatible, out.value, crsid,
+                                              options.split() if options else None,
+                                              feedback, start, start + step)
             elif isinstance(out, OutputTable):
                 if out.compatible is not None:
                     layer = QgsProcessingUtils.mapLayerFromString(out.compatible, context)
@@ -308,7 +330,8 @@ class GeoAlgorithm(QgsProcessingAlgorithm):
                     features = QgsProcessingUtils.getFeatures(layer, context)
                     for feature in features:
                         writer.addRecord(feature)
-            feedback.setProgress(100 * i / float(len(self.outputs)))
+                    writer.close()
+            feedback.setProgress(start + step)
 
     def getFormatShortNameFromFilename(self, filename):
         ext = filename[filename.rfind('.') + 1:]
@@ -68,6 +68,23 @@ class ProcessingConfig(object):
     DEFAULT_OUTPUT_VECTOR_LAYER_EXT = 'DEFAULT_OUTPUT_VECTOR_LAYER_EXT'
     SHOW_PROVIDERS_TOOLTIP = 'SHOW_PROVIDERS_TOOLTIP'
     MODELS_SCRIPTS_REPO = 'MODELS_SCRIPTS_REPO'
+    PARALLEL_WORKERS = 'PARALLEL_WORKERS'
+    BATCH_WORKERS = 'BATCH_WORKERS'
+    MODELER_WORKERS = 'MODELER_WORKERS'
+    USE_RESULT_CACHE = 'USE_RESULT_CACHE'
+    RESULT_CACHE_FOLDER = 'RESULT_CACHE_FOLDER'
+    RESULT_CACHE_SIZE = 'RESULT_CACHE_SIZE'
+    OVERLAY_CACHE_SIZE = 'OVERLAY_CACHE_SIZE'
+    DISSOLVE_MEMORY = 'DISSOLVE_MEMORY'
+    USE_SPATIAL_INDEX_CACHE = 'USE_SPATIAL_INDEX_CACHE'
+    PERSIST_SPATIAL_INDEXES = 'PERSIST_SPATIAL_INDEXES'
+    HISTORY_MAX_ENTRIES = 'HISTORY_MAX_ENTRIES'
+    HISTORY_MAX_AGE = 'HISTORY_MAX_AGE'
+    RASTER_CREATION_OPTIONS = 'RASTER_CREATION_OPTIONS'
+    VIRTUAL_INTERMEDIATE_RASTERS = 'VIRTUAL_INTERMEDIATE_RASTERS'
+    USE_EXPORT_CACHE = 'USE_EXPORT_CACHE'
+    EXPORT_CACHE_SIZE = 'EXPORT_CACHE_SIZE'
+    USE_GEOS_TRIANGULATION = 'USE_GEOS_TRIANGULATION'
 
     settings = {}
     settingIcons = {}
@@ -156,6 +173,84 @@ class ProcessingConfig(object):
             ProcessingConfig.MODELS_SCRIPTS_REPO,
             ProcessingConfig.tr('Scripts and models repository'),
             'https://raw.githubusercontent.com/qgis/QGIS-Processing/master'))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.PARALLEL_WORKERS,
+            ProcessingConfig.tr('Worker processes for feature-wise algorithms (0 to use all cores)'), 1,
+            valuetype=Setting.INT))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.BATCH_WORKERS,
+            ProcessingConfig.tr('Concurrent rows in batch processing (0 to use all cores)'), 1,
+            valuetype=Setting.INT))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.MODELER_WORKERS,
+            ProcessingConfig.tr('Concurrent algorithms in models (0 to use all cores)'), 1,
+            valuetype=Setting.INT))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.USE_RESULT_CACHE,
+            ProcessingConfig.tr('Reuse results of previous executions with the same inputs'), False))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.RESULT_CACHE_FOLDER,
+            ProcessingConfig.tr('Results cache folder'), '',
+            valuetype=Setting.FOLDER))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.RESULT_CACHE_SIZE,
+            ProcessingConfig.tr('Maximum size of the results cache (MB)'), 1024,
+            valuetype=Setting.INT))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.OVERLAY_CACHE_SIZE,
+            ProcessingConfig.tr('Memory used to cache features in overlay algorithms (MB)'), 256,
+            valuetype=Setting.INT))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.DISSOLVE_MEMORY,
+            ProcessingConfig.tr('Memory used to collect geometries when dissolving (MB)'), 1024,
+            valuetype=Setting.INT))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.USE_SPATIAL_INDEX_CACHE,
+            ProcessingConfig.tr('Reuse spatial indexes of unchanged layers'), True))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.PERSIST_SPATIAL_INDEXES,
+            ProcessingConfig.tr('Save spatial indexes next to the layer files'), False))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.HISTORY_MAX_ENTRIES,
+            ProcessingConfig.tr('Maximum number of entries in the history (0 for no limit)'), 10000,
+            valuetype=Setting.INT))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.HISTORY_MAX_AGE,
+            ProcessingConfig.tr('Remove history entries older than (days, 0 for no limit)'), 0,
+            valuetype=Setting.INT))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.RASTER_CREATION_OPTIONS,
+            ProcessingConfig.tr('Creation options for converted raster outputs (e.g. COMPRESS=DEFLATE TILED=YES)'), ''))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.VIRTUAL_INTERMEDIATE_RASTERS,
+            ProcessingConfig.tr('Write intermediate rasters of models as virtual rasters (VRT) when possible'), True))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.USE_EXPORT_CACHE,
+            ProcessingConfig.tr('Reuse layers exported for external applications while unchanged'), True))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.EXPORT_CACHE_SIZE,
+            ProcessingConfig.tr('Maximum size of the exported layers cache (MB)'), 2048,
+            valuetype=Setting.INT))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.USE_GEOS_TRIANGULATION,
+            ProcessingConfig.tr('Use GEOS for Delaunay triangulation and Voronoi polygons (faster, but features are written in a different order)'), False))
 
         invalidFeaturesOptions = [ProcessingConfig.tr('Do not filter (better performance)'),
                                   ProcessingConfig.tr('Ignore features with invalid geometries'),
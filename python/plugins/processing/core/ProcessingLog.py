@@ -16,7 +16,6 @@
 *                                                                         *
 ***************************************************************************
 """
-from builtins import range
 from builtins import object
 
 __author__ = 'Victor Olaya'
@@ -29,67 +28,222 @@ __revision__ = '$Format:%H$'
 
 import os
 import codecs
+import sqlite3
 import datetime
+import threading
 from processing.tools.system import userFolder
 from processing.core.ProcessingConfig import ProcessingConfig
+from processing.core.outputs import OutputVector
 from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import QgsProcessingUtils, QgsVectorLayer
 
 
 class ProcessingLog(object):
 
+    """History of the algorithms executed from the toolbox, stored in
+    a SQLite database in the user folder.
+
+    Every entry has the command to run the algorithm again and, once
+    the execution finishes, its duration, the number of features in
+    its vector outputs and its exit status. Old entries are removed
+    when new ones are added, according to the maximum number of entries
+    and maximum age set in the processing configuration.
+    """
+
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
     recentAlgs = []
 
+    STATUS_OK = 'OK'
+    STATUS_FAILED = 'FAILED'
+
+    _connection = None
+    _lock = threading.RLock()
+
     @staticmethod
     def logFilename():
-        logFilename = userFolder() + os.sep + 'processing.log'
-        if not os.path.isfile(logFilename):
-            with codecs.open(logFilename, 'w', encoding='utf-8') as logfile:
-                logfile.write('Started logging at ' +
-                              datetime.datetime.now().strftime(ProcessingLog.DATE_FORMAT) + '\n')
+        return os.path.join(userFolder(), 'processing_history.db')
+
+    @staticmethod
+    def legacyLogFilename():
+        return os.path.join(userFolder(), 'processing.log')
 
-        return logFilename
+    @staticmethod
+    def connection():
+        with ProcessingLog._lock:
+            if ProcessingLog._connection is None:
+                connection = sqlite3.connect(ProcessingLog.logFilename(), check_same_thread=False)
+                connection.execute('CREATE TABLE IF NOT EXISTS history ('
+                                   'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                   'date TEXT NOT NULL, '
+                                   'algorithm TEXT, '
+                                   'command TEXT NOT NULL, '
+                                   'duration REAL, '
+                                   'features INTEGER, '
+                                   'status TEXT)')
+                connection.execute('CREATE INDEX IF NOT EXISTS history_date ON history (date)')
+                connection.execute('CREATE INDEX IF NOT EXISTS history_algorithm ON history (algorithm)')
+                connection.commit()
+                ProcessingLog._connection = connection
+                try:
+                    ProcessingLog._importLegacyLog()
+                except (IOError, OSError, sqlite3.Error):
+                    pass
+            return ProcessingLog._connection
+
+    @staticmethod
+    def _importLegacyLog():
+        """Moves the entries of the text log used by previous versions
+        to the database.
+
+        The log is renamed before its entries are added, so they are
+        never imported twice. If adding them fails, the renamed file is
+        kept.
+        """
+        legacy = ProcessingLog.legacyLogFilename()
+        if not os.path.isfile(legacy):
+            return
+        imported = legacy + '.old'
+        if os.path.exists(imported):
+            os.remove(imported)
+        os.rename(legacy, imported)
+        rows = []
+        with codecs.open(imported, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                tokens = line.strip('\n').strip().split('|')
+                if len(tokens) > 2 and tokens[0] == 'ALGORITHM':
+                    command = '|'.join(tokens[2:])
+                    rows.append((tokens[1], ProcessingLog._algorithmName(command), command))
+        ProcessingLog._connection.executemany('INSERT INTO history (date, algorithm, command) VALUES (?, ?, ?)', rows)
+        ProcessingLog._connection.commit()
+
+    @staticmethod
+    def _algorithmName(command):
+        try:
+            algname = command[len('processing.run("'):]
+            return algname[:algname.index('"')]
+        except ValueError:
+            return None
 
     @staticmethod
     def addToLog(msg):
+        """Adds the command of an algorithm to the history and returns
+        the id of the new entry, or None if it could not be added.
+        """
         try:
             # It seems that this fails sometimes depending on the msg
             # added. To avoid it stopping the normal functioning of the
             # algorithm, we catch all errors, assuming that is better
             # to miss some log info than breaking the algorithm.
-            line = 'ALGORITHM|' + datetime.datetime.now().strftime(
-                ProcessingLog.DATE_FORMAT) + '|' \
-                + msg + '\n'
-            with codecs.open(ProcessingLog.logFilename(), 'a',
-                             encoding='utf-8') as logfile:
-                logfile.write(line)
-            algname = msg[len('processing.run("'):]
-            algname = algname[:algname.index('"')]
-            if algname not in ProcessingLog.recentAlgs:
+            algname = ProcessingLog._algorithmName(msg)
+            date = datetime.datetime.now().strftime(ProcessingLog.DATE_FORMAT)
+            with ProcessingLog._lock:
+                connection = ProcessingLog.connection()
+                cursor = connection.execute('INSERT INTO history (date, algorithm, command) VALUES (?, ?, ?)',
+                                            (date, algname, msg))
+                connection.commit()
+                entryId = cursor.lastrowid
+                ProcessingLog.rotate()
+            if algname is not None and algname not in ProcessingLog.recentAlgs:
                 ProcessingLog.recentAlgs.append(algname)
                 recentAlgsString = ';'.join(ProcessingLog.recentAlgs[-6:])
                 ProcessingConfig.setSettingValue(
                     ProcessingConfig.RECENT_ALGORITHMS,
                     recentAlgsString)
+            return entryId
+        except:
+            return None
+
+    @staticmethod
+    def finishLogEntry(entryId, alg, context, duration, succeeded):
+        """Records the duration, the number of features in the vector
+        outputs and the exit status of an executed algorithm.
+        """
+        if entryId is None:
+            return
+        try:
+            features = None
+            if succeeded:
+                features = ProcessingLog._featureCount(alg, context)
+            status = ProcessingLog.STATUS_OK if succeeded else ProcessingLog.STATUS_FAILED
+            with ProcessingLog._lock:
+                connection = ProcessingLog.connection()
+                connection.execute('UPDATE history SET duration = ?, features = ?, status = ? WHERE id = ?',
+                                   (duration, features, status, entryId))
+                connection.commit()
         except:
             pass
 
     @staticmethod
-    def getLogEntries():
-        entries = []
+    def _featureCount(alg, context):
+        count = None
+        for out in alg.outputs:
+            if not isinstance(out, OutputVector) or not out.value:
+                continue
+            layer = QgsProcessingUtils.mapLayerFromString(out.value, context)
+            if isinstance(layer, QgsVectorLayer):
+                count = (count or 0) + max(0, layer.featureCount())
+        return count
+
+    @staticmethod
+    def rotate():
+        """Removes the entries exceeding the maximum number of entries
+        or older than the maximum age.
+        """
+        with ProcessingLog._lock:
+            connection = ProcessingLog.connection()
+            try:
+                maxEntries = int(ProcessingConfig.getSetting(ProcessingConfig.HISTORY_MAX_ENTRIES) or 0)
+                maxAge = int(ProcessingConfig.getSetting(ProcessingConfig.HISTORY_MAX_AGE) or 0)
+            except (TypeError, ValueError):
+                return
+            if maxEntries > 0:
+                connection.execute('DELETE FROM history WHERE id <= (SELECT MAX(id) FROM history) - ?',
+                                   (maxEntries, ))
+            if maxAge > 0:
+                oldest = datetime.datetime.now() - datetime.timedelta(days=maxAge)
+                connection.execute('DELETE FROM history WHERE date < ?',
+                                   (oldest.strftime(ProcessingLog.DATE_FORMAT), ))
+            connection.commit()
+
+    @staticmethod
+    def _filter(algorithm, dateFrom, dateTo):
+        conditions = []
+        values = []
+        if algorithm:
+            conditions.append('algorithm LIKE ?')
+            values.append('%' + algorithm + '%')
+        if dateFrom is not None:
+            conditions.append('date >= ?')
+            values.append(dateFrom.strftime(ProcessingLog.DATE_FORMAT))
+        if dateTo is not None:
+            conditions.append('date <= ?')
+            values.append(dateTo.strftime(ProcessingLog.DATE_FORMAT))
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return where, values
 
-        with open(ProcessingLog.logFilename()) as f:
-            lines = f.readlines()
-        for line in lines:
-            line = line.strip('\n').strip()
-            tokens = line.split('|')
-            text = ''
-            for i in range(2, len(tokens)):
-                text += tokens[i] + '|'
-            if line.startswith('ALGORITHM'):
-                entries.append(LogEntry(tokens[1], tokens[2]))
+    @staticmethod
+    def getLogEntries(limit=None, offset=0, algorithm=None, dateFrom=None, dateTo=None):
+        """Returns the entries of the history, most recent first.
+
+        Entries can be filtered by algorithm (a part of its name) and by
+        date (datetime objects), and paged with limit and offset.
+        """
+        where, values = ProcessingLog._filter(algorithm, dateFrom, dateTo)
+        sql = ('SELECT id, date, command, algorithm, duration, features, status FROM history' +
+               where + ' ORDER BY id DESC')
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            values += [limit, offset]
+        with ProcessingLog._lock:
+            rows = ProcessingLog.connection().execute(sql, values).fetchall()
+        return [LogEntry(date, text, entryId, algorithm, duration, features, status)
+                for entryId, date, text, algorithm, duration, features, status in rows]
 
-        return entries
+    @staticmethod
+    def countLogEntries(algorithm=None, dateFrom=None, dateTo=None):
+        where, values = ProcessingLog._filter(algorithm, dateFrom, dateTo)
+        with ProcessingLog._lock:
+            return ProcessingLog.connection().execute('SELECT COUNT(*) FROM history' + where, values).fetchone()[0]
 
     @staticmethod
     def getRecentAlgorithms():
@@ -103,14 +257,19 @@ class ProcessingLog(object):
 
     @staticmethod
     def clearLog():
-        os.unlink(ProcessingLog.logFilename())
+        with ProcessingLog._lock:
+            connection = ProcessingLog.connection()
+            connection.execute('DELETE FROM history')
+            connection.commit()
+            connection.execute('VACUUM')
 
     @staticmethod
     def saveLog(fileName):
-        entries = ProcessingLog.getLogEntries()
-        with codecs.open(fileName, 'w', encoding='utf-8') as f:
-            for entry in entries:
-                f.write('ALGORITHM|%s|%s\n' % (entry.date, entry.text))
+        with ProcessingLog._lock:
+            rows = ProcessingLog.connection().execute('SELECT date, command FROM history ORDER BY id')
+            with codecs.open(fileName, 'w', encoding='utf-8') as f:
+                for date, text in rows:
+                    f.write('ALGORITHM|%s|%s\n' % (date, text))
 
     @staticmethod
     def tr(string, context=''):
@@ -121,6 +280,11 @@ class ProcessingLog(object):
 
 class LogEntry(object):
 
-    def __init__(self, date, text):
+    def __init__(self, date, text, id=None, algorithm=None, duration=None, features=None, status=None):
         self.date = date
         self.text = text
+        self.id = id
+        self.algorithm = algorithm
+        self.duration = duration
+        self.features = features
+        self.status = status
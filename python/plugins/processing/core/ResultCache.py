@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    ResultCache.py
+    ---------------------
+    Date                 : June 2017
+    Copyright            : (C) 2017 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'June 2017'
+__copyright__ = '(C) 2017, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+
+from qgis.core import Qgis, QgsProject
+
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.core.parameters import ParameterDataObject, ParameterMultipleInput, ParameterFile
+from processing.core.outputs import (OutputDirectory,
+                                     OutputExtent,
+                                     OutputCrs,
+                                     OutputNumber,
+                                     OutputString)
+from processing.tools.system import userFolder, mkdir, relatedFiles
+
+
+class ResultCache(object):
+
+    """Stores the outputs of executed algorithms, keyed by a hash of
+    the algorithm, its parameter values and the state of its input
+    files, so running an algorithm again with the same inputs can
+    reuse them.
+
+    Each cache entry is a folder containing the output files and a
+    manifest. The modification time of the manifest is used to evict
+    the least recently used entries when the cache grows beyond its
+    size limit.
+    """
+
+    MANIFEST = 'manifest.json'
+    VALUE_OUTPUTS = (OutputExtent, OutputCrs, OutputNumber, OutputString)
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def isEnabled():
+        return bool(ProcessingConfig.getSetting(ProcessingConfig.USE_RESULT_CACHE))
+
+    @staticmethod
+    def cacheFolder():
+        folder = ProcessingConfig.getSetting(ProcessingConfig.RESULT_CACHE_FOLDER)
+        if not folder:
+            folder = os.path.join(userFolder(), 'cache')
+        mkdir(folder)
+        return folder
+
+    @staticmethod
+    def maxSize():
+        try:
+            return float(ProcessingConfig.getSetting(ProcessingConfig.RESULT_CACHE_SIZE)) * 1024 * 1024
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def key(alg):
+        """Returns the cache key for the current parameter values of an
+        algorithm, or None if its results can not be cached (for
+        instance, because one of the inputs is not a file).
+        """
+        if not alg.useResultCache:
+            return None
+        for out in alg.outputs:
+            if isinstance(out, OutputDirectory):
+                return None
+            if isinstance(out, ResultCache.VALUE_OUTPUTS):
+                continue
+            if out.hidden or not out.value or not os.path.isabs(out.value):
+                # outputs modifying the input layers, or written to a
+                # database or memory layer
+                return None
+            if os.path.splitext(out.value)[1].lower() == '.vrt':
+                # virtual rasters reference files outside the cache
+                return None
+
+        provider = alg.provider()
+        values = [alg.id(),
+                  provider.id() if provider is not None else None,
+                  Qgis.QGIS_VERSION_INT]
+        for param in alg.parameters:
+            if isinstance(param, ParameterDataObject):
+                if not param.value:
+                    values.append((param.name, None))
+                    continue
+                if isinstance(param, ParameterMultipleInput):
+                    sources = param.value.split(';')
+                else:
+                    sources = [param.value]
+                fingerprints = []
+                for source in sources:
+                    fingerprint = ResultCache._fingerprint(source)
+                    if fingerprint is None:
+                        return None
+                    fingerprints.append(fingerprint)
+                values.append((param.name, fingerprints))
+            elif isinstance(param, ParameterFile) and param.value and os.path.isfile(param.value):
+                values.append((param.name, ResultCache._fingerprint(param.value)))
+            else:
+                values.append((param.name, str(param.value)))
+        for out in alg.outputs:
+            if not isinstance(out, ResultCache.VALUE_OUTPUTS):
+                values.append((out.name, os.path.splitext(out.value)[1].lower()))
+
+        return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _fingerprint(source):
+        """Returns the path, size and modification time of a file based
+        layer source and its sidecar files, or None if the source is not
+        a file or has selected features that might be used instead of
+        the full layer.
+        """
+        path = source.split('|')[0]
+        if not os.path.isfile(path):
+            return None
+
+        if ProcessingConfig.getSetting(ProcessingConfig.USE_SELECTED):
+            for layer in QgsProject.instance().mapLayers().values():
+                if layer.source() == source and getattr(layer, 'selectedFeatureCount', lambda: 0)():
+                    return None
+
+        fingerprint = [source]
+        for f in sorted(relatedFiles(path)):
+            stat = os.stat(f)
+            fingerprint.append((os.path.basename(f), stat.st_size, stat.st_mtime))
+        return fingerprint
+
+    @staticmethod
+    def restore(alg, key, feedback):
+        """Copies the cached outputs for a key to the output locations
+        of an algorithm. Returns False if there is no usable cache entry
+        for the key, in which case the algorithm has to be executed.
+        """
+        entry = os.path.join(ResultCache.cacheFolder(), key)
+        manifestFile = os.path.join(entry, ResultCache.MANIFEST)
+        copied = []
+        # the entry is copied while holding the lock, so it can not be
+        # evicted by another execution storing its results meanwhile
+        with ResultCache._lock:
+            try:
+                with open(manifestFile) as f:
+                    manifest = json.load(f)
+            except (IOError, OSError, ValueError):
+                return False
+
+            values = {}
+            try:
+                for out in alg.outputs:
+                    if out.name not in manifest:
+                        return False
+                    if isinstance(out, ResultCache.VALUE_OUTPUTS):
+                        values[out.name] = manifest[out.name]
+                        continue
+                    folder = os.path.dirname(out.value)
+                    base = os.path.splitext(os.path.basename(out.value))[0]
+                    mkdir(folder)
+                    for suffix in manifest[out.name]:
+                        dst = os.path.join(folder, base + suffix)
+                        shutil.copyfile(os.path.join(entry, out.name + suffix), dst)
+                        copied.append(dst)
+                # touch the manifest, so the entry is the most recently used
+                os.utime(manifestFile, None)
+            except (IOError, OSError, TypeError):
+                # a broken entry (missing or unreadable files): remove
+                # whatever was copied and the entry itself
+                for f in copied:
+                    try:
+                        os.remove(f)
+                    except OSError:
+                        pass
+                shutil.rmtree(entry, True)
+                return False
+
+        for out in alg.outputs:
+            if out.name in values:
+                out.value = values[out.name]
+
+        feedback.pushInfo(
+            alg.tr('Cache hit: reusing results of a previous execution of {0}').format(alg.displayName()))
+        return True
+
+    @staticmethod
+    def store(alg, key):
+        """Copies the outputs of an executed algorithm to a new cache
+        entry for a key, then evicts old entries if the cache is too
+        large.
+        """
+        folder = ResultCache.cacheFolder()
+        tmp = os.path.join(folder, 'tmp_' + uuid.uuid4().hex)
+        try:
+            mkdir(tmp)
+            manifest = {}
+            for out in alg.outputs:
+                if isinstance(out, ResultCache.VALUE_OUTPUTS):
+                    json.dumps(out.value)
+                    manifest[out.name] = out.value
+                    continue
+                if not os.path.isfile(out.value):
+                    shutil.rmtree(tmp, True)
+                    return
+                base = os.path.splitext(out.value)[0]
+                suffixes = []
+                for f in relatedFiles(out.value):
+                    suffix = f[len(base):]
+                    shutil.copyfile(f, os.path.join(tmp, out.name + suffix))
+                    suffixes.append(suffix)
+                manifest[out.name] = suffixes
+            with open(os.path.join(tmp, ResultCache.MANIFEST), 'w') as f:
+                json.dump(manifest, f)
+        except (IOError, OSError, TypeError, ValueError):
+            # a result that can not be cached should never make the
+            # algorithm fail
+            shutil.rmtree(tmp, True)
+            return
+
+        entry = os.path.join(folder, key)
+        with ResultCache._lock:
+            if os.path.exists(entry):
+                shutil.rmtree(entry, True)
+            os.rename(tmp, entry)
+            ResultCache.evict()
+
+    @staticmethod
+    def evict():
+        """Removes the least recently used entries until the cache fits
+        in its maximum size.
+        """
+        folder = ResultCache.cacheFolder()
+        entries = []
+        total = 0
+        for name in os.listdir(folder):
+            entry = os.path.join(folder, name)
+            manifestFile = os.path.join(entry, ResultCache.MANIFEST)
+            if name.startswith('tmp_') or not os.path.isfile(manifestFile):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(manifestFile), size, entry))
+            total += size
+
+        maxSize = ResultCache.maxSize()
+        for lastUsed, size, entry in sorted(entries):
+            if total <= maxSize:
+                break
+            shutil.rmtree(entry, True)
+            total -= size
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    SpatialIndexCache.py
+    ---------------------
+    Date                 : June 2017
+    Copyright            : (C) 2017 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'June 2017'
+__copyright__ = '(C) 2017, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import json
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy
+from osgeo import gdal
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsFeatureRequest,
+                       QgsMessageLog,
+                       QgsProcessingContext,
+                       QgsProcessingUtils,
+                       QgsSpatialIndex,
+                       QgsVectorLayer)
+
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.tools.system import relatedFiles, SPATIAL_INDEX_SUFFIX
+
+
+class SpatialIndexCache(object):
+
+    """Keeps the spatial indexes of vector layers for the session, so
+    algorithms using the same unchanged layer do not need to read it
+    again to build its index.
+
+    Indexes are keyed by the source and subset string of a layer and
+    the size and modification time of its files. Only file based
+    layers without pending edits are cached, and never when the
+    selected features are used instead of the full layer.
+
+    Optionally, the bounding boxes of the features are also saved next
+    to the layer files, so the index can be rebuilt without reading the
+    layer in later sessions.
+    """
+
+    MAX_ENTRIES = 16
+
+    hits = 0
+    misses = 0
+
+    _entries = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def isEnabled():
+        return bool(ProcessingConfig.getSetting(ProcessingConfig.USE_SPATIAL_INDEX_CACHE))
+
+    @staticmethod
+    def isPersistent():
+        return bool(ProcessingConfig.getSetting(ProcessingConfig.PERSIST_SPATIAL_INDEXES))
+
+    @staticmethod
+    def key(layer, context):
+        """Returns the cache key for the index of a layer, or None if
+        the index of the layer can not be cached.
+        """
+        if context.flags() & QgsProcessingContext.UseSelectionIfPresent and layer.selectedFeatureCount() > 0:
+            return None
+        if layer.isModified():
+            return None
+
+        path = layer.source().split('|')[0]
+        if not os.path.isfile(path):
+            return None
+
+        # features with invalid geometries are skipped or not depending
+        # on the context, so indexes are only shared by the same check mode
+        fingerprint = [layer.source(), layer.subsetString(), int(context.invalidGeometryCheck())]
+        for f in sorted(relatedFiles(path)):
+            stat = os.stat(f)
+            fingerprint.append((os.path.basename(f), stat.st_size, stat.st_mtime))
+        return hashlib.sha1(json.dumps(fingerprint).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def index(layer, context, feedback=None):
+        """Returns a spatial index of the features of a layer, taking it
+        from the cache when possible. The index can be modified without
+        affecting the cached one.
+        """
+        key = SpatialIndexCache.key(layer, context) if SpatialIndexCache.isEnabled() else None
+        if key is None:
+            return QgsProcessingUtils.createSpatialIndex(layer, context)
+
+        with SpatialIndexCache._lock:
+            index = SpatialIndexCache._entries.get(key)
+            if index is not None:
+                SpatialIndexCache._entries.move_to_end(key)
+
+        hit = index is not None
+        if index is None:
+            if SpatialIndexCache.isPersistent():
+                index = SpatialIndexCache._load(layer, key)
+                hit = index is not None
+                if index is None:
+                    index = SpatialIndexCache._build(layer, context, key)
+            else:
+                index = QgsProcessingUtils.createSpatialIndex(layer, context)
+            with SpatialIndexCache._lock:
+                SpatialIndexCache._entries[key] = index
+                while len(SpatialIndexCache._entries) > SpatialIndexCache.MAX_ENTRIES:
+                    SpatialIndexCache._entries.popitem(last=False)
+
+        with SpatialIndexCache._lock:
+            if hit:
+                SpatialIndexCache.hits += 1
+            else:
+                SpatialIndexCache.misses += 1
+            msg = SpatialIndexCache.tr('Spatial index cache {0} for {1} ({2} hits, {3} misses in this session)').format(
+                SpatialIndexCache.tr('hit') if hit else SpatialIndexCache.tr('miss'),
+                layer.name(), SpatialIndexCache.hits, SpatialIndexCache.misses)
+        QgsMessageLog.logMessage(msg, SpatialIndexCache.tr('Processing'), QgsMessageLog.INFO)
+        if feedback is not None:
+            feedback.pushInfo(msg)
+
+        # copies of an index share its data until they are modified
+        return QgsSpatialIndex(index)
+
+    @staticmethod
+    def clear():
+        with SpatialIndexCache._lock:
+            SpatialIndexCache._entries.clear()
+            SpatialIndexCache.hits = 0
+            SpatialIndexCache.misses = 0
+
+    @staticmethod
+    def _fileName(layer):
+        # a file can contain several layers, so the name depends on
+        # the full source. The key is stored in the file.
+        name = hashlib.sha1(json.dumps([layer.source(), layer.subsetString()]).encode('utf-8')).hexdigest()
+        return layer.source().split('|')[0] + '.' + name[:12] + SPATIAL_INDEX_SUFFIX
+
+    @staticmethod
+    def _fromBoxes(fids, boxes):
+        """Returns an index bulk loaded with the given boxes. They are
+        read through an in-memory GeoJSON layer, which keeps the feature
+        ids, as the index can only be bulk loaded from a feature iterator.
+        """
+        if not len(fids):
+            return QgsSpatialIndex()
+        features = [{'type': 'Feature',
+                     'id': fid,
+                     'properties': {},
+                     'geometry': {'type': 'Polygon',
+                                  'coordinates': [[[xmin, ymin], [xmax, ymin], [xmax, ymax],
+                                                   [xmin, ymax], [xmin, ymin]]]}}
+                    for fid, (xmin, ymin, xmax, ymax) in zip(fids.tolist(), boxes.tolist())]
+        fileName = '/vsimem/{0}.geojson'.format(uuid.uuid4().hex)
+        gdal.FileFromMemBuffer(fileName, json.dumps({'type': 'FeatureCollection',
+                                                     'features': features}).encode('utf-8'))
+        try:
+            layer = QgsVectorLayer(fileName, 'boxes', 'ogr')
+            index = QgsSpatialIndex(layer.getFeatures(QgsFeatureRequest().setSubsetOfAttributes([])))
+            del layer
+        finally:
+            gdal.Unlink(fileName)
+        return index
+
+    @staticmethod
+    def _load(layer, key):
+        fileName = SpatialIndexCache._fileName(layer)
+        if not os.path.isfile(fileName):
+            return None
+        try:
+            with numpy.load(fileName) as data:
+                if str(data['key']) != key:
+                    return None
+                return SpatialIndexCache._fromBoxes(data['fids'], data['boxes'])
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _build(layer, context, key):
+        """Reads the bounding boxes of the features of a layer, saves
+        them next to the layer files and returns an index built from
+        them.
+        """
+        fids = []
+        boxes = []
+        request = QgsFeatureRequest().setSubsetOfAttributes([])
+        for f in QgsProcessingUtils.getFeatures(layer, context, request):
+            if not f.hasGeometry():
+                continue
+            rect = f.geometry().boundingBox()
+            fids.append(f.id())
+            boxes.append((rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum()))
+        fids = numpy.array(fids, dtype=numpy.int64)
+        boxes = numpy.array(boxes, dtype=numpy.float64).reshape((-1, 4))
+
+        fileName = SpatialIndexCache._fileName(layer)
+        try:
+            with open(fileName, 'wb') as f:
+                numpy.savez(f, key=numpy.array(key), fids=fids, boxes=boxes)
+        except (IOError, OSError):
+            # the layer might be in a read only folder
+            pass
+
+        return SpatialIndexCache._fromBoxes(fids, boxes)
+
+    @staticmethod
+    def tr(string, context=''):
+        if context == '':
+            context = 'SpatialIndexCache'
+        return QCoreApplication.translate(context, string)
@@ -214,6 +214,11 @@ class OutputRaster(Output):
 
     compatible = None
 
+    # Set for intermediate outputs of models. If the algorithm supports
+    # it, they are written as virtual rasters, so the pixels are only
+    # computed by the algorithms reading them
+    virtual = False
+
     def getFileFilter(self, alg):
         exts = dataobjects.getSupportedOutputRasterLayerExtensions()
         for i in range(len(exts)):
@@ -223,6 +228,11 @@ class OutputRaster(Output):
     def getDefaultFileExtension(self):
         return ProcessingConfig.getSetting(ProcessingConfig.DEFAULT_OUTPUT_RASTER_LAYER_EXT, True)
 
+    def _resolveTemporary(self, alg):
+        if self.virtual and alg.virtualRasterOutputs:
+            return getTempFilenameInTempFolder(self.name + '.vrt')
+        return Output._resolveTemporary(self, alg)
+
     def getCompatibleFileName(self, alg):
         """
         Returns a filename that is compatible with the algorithm
@@ -233,7 +243,7 @@ class OutputRaster(Output):
         result.
         """
 
-        ext = self.value[self.value.rfind('.') + 1:]
+        ext = self.value[self.value.rfind('.') + 1:].lower()
         if ext in alg.provider().supportedOutputRasterLayerExtensions():
             return self.value
         else:
@@ -257,7 +267,7 @@ class OutputTable(Output):
     compatible = None
 
     def getFileFilter(self, alg):
-        exts = ['dbf']
+        exts = ['dbf', 'csv', 'csv.gz', 'npz']
         for i in range(len(exts)):
             exts[i] = self.tr("{0} files (*.{1})").format(exts[i].upper(), exts[i].lower())
         return ';;'.join(exts)
@@ -275,7 +285,7 @@ class OutputTable(Output):
         generate the output result.
         """
 
-        ext = self.value[self.value.rfind('.') + 1:]
+        ext = self.value[self.value.rfind('.') + 1:].lower()
         if ext in alg.provider().supportedOutputTableExtensions():
             return self.value
         else:
@@ -350,7 +360,7 @@ class OutputVector(Output):
         temporary file with a supported file format, to be used to
         generate the output result.
         """
-        ext = self.value[self.value.rfind('.') + 1:]
+        ext = self.value[self.value.rfind('.') + 1:].lower()
         if ext in alg.provider().supportedOutputVectorLayerExtensions():
             return self.value
         else:
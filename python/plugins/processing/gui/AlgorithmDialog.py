@@ -26,6 +26,8 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
+import time
+
 from qgis.PyQt.QtCore import Qt
 from qgis.PyQt.QtWidgets import QMessageBox, QApplication, QPushButton, QWidget, QVBoxLayout, QSizePolicy
 from qgis.PyQt.QtGui import QCursor, QColor, QPalette
@@ -209,9 +211,11 @@ class AlgorithmDialog(AlgorithmDialogBase):
                     self.resetGUI()
             else:
                 command = self.alg.getAsCommand()
-                if command:
-                    ProcessingLog.addToLog(command)
-                if execute(self.alg, context, self.feedback):
+                entryId = ProcessingLog.addToLog(command) if command else None
+                start = time.time()
+                executed = execute(self.alg, context, self.feedback)
+                ProcessingLog.finishLogEntry(entryId, self.alg, context, time.time() - start, executed)
+                if executed:
                     self.finish(context)
                 else:
                     QApplication.restoreOverrideCursor()
@@ -26,10 +26,22 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
+import time
+import traceback
+import multiprocessing
+from collections import deque
+
 from qgis.PyQt.QtWidgets import QApplication, QMessageBox, QSizePolicy
 from qgis.PyQt.QtGui import QCursor
-from qgis.PyQt.QtCore import Qt
-
+from qgis.PyQt.QtCore import Qt, QCoreApplication, pyqtSignal
+
+from qgis.core import (QgsApplication,
+                       QgsMapLayer,
+                       QgsProcessingContext,
+                       QgsProcessingFeedback,
+                       QgsProcessingUtils,
+                       QgsProject,
+                       QgsTask)
 from qgis.gui import QgsMessageBar
 
 from processing.gui.BatchPanel import BatchPanel
@@ -37,8 +49,10 @@ from processing.gui.AlgorithmDialogBase import AlgorithmDialogBase
 from processing.gui.AlgorithmExecutor import execute
 from processing.gui.Postprocessing import handleAlgorithmResults
 
+from processing.core.ProcessingConfig import ProcessingConfig
 from processing.core.ProcessingResults import ProcessingResults
 
+from processing.core.parameters import ParameterDataObject, ParameterMultipleInput
 from processing.core.outputs import OutputNumber
 from processing.core.outputs import OutputString
 from processing.core.outputs import OutputHTML
@@ -49,6 +63,96 @@ from processing.tools import dataobjects
 import codecs
 
 
+class BatchRowFeedback(QgsProcessingFeedback):
+    """
+    Relays the feedback of a single batch row to the dialog. Signals
+    emitted from a task thread are queued to the dialog thread.
+    """
+
+    messageReported = pyqtSignal(int, str, bool)
+
+    def __init__(self, row):
+        QgsProcessingFeedback.__init__(self)
+        self.row = row
+
+    def reportError(self, msg):
+        self.messageReported.emit(self.row, msg, True)
+
+    def setProgressText(self, text):
+        self.messageReported.emit(self.row, text, False)
+
+    def pushInfo(self, msg):
+        self.messageReported.emit(self.row, msg, False)
+
+
+class BatchRowTask(QgsTask):
+    """
+    Executes a single batch row in the task manager thread pool, with
+    its own processing context. The project is not thread safe, so the
+    context has none while the task runs: layer inputs must have been
+    replaced by their sources (see layerSources) before queuing it.
+    """
+
+    def __init__(self, row, alg, feedback):
+        QgsTask.__init__(self, alg.displayName(), QgsTask.CanCancel)
+        self.row = row
+        self.alg = alg
+        self.context = dataobjects.createContext()
+        self.context.setProject(None)
+        self.feedback = feedback
+        self.feedback.progressChanged.connect(self.setProgress)
+        self.elapsed = 0
+        self.succeeded = False
+
+    def run(self):
+        start = time.time()
+        try:
+            self.succeeded = execute(self.alg, self.context, self.feedback)
+        except Exception:
+            self.feedback.reportError(traceback.format_exc())
+            self.succeeded = False
+        # layers created here belong to this thread, but are added to
+        # the project from the main thread
+        mainThread = QCoreApplication.instance().thread()
+        for layer in self.context.temporaryLayerStore().mapLayers().values():
+            layer.moveToThread(mainThread)
+        self.elapsed = time.time() - start
+        return self.succeeded and not self.isCanceled()
+
+    def cancel(self):
+        self.feedback.cancel()
+        QgsTask.cancel(self)
+
+
+def layerSources(alg, context):
+    """Returns the values of the layer parameters of an algorithm, with
+    the layers of the project replaced by their sources, or None if one
+    of them can not be read again from its source in another thread
+    (memory layers, filtered layers or layers with selected features to
+    use).
+    """
+    useSelection = context.flags() & QgsProcessingContext.UseSelectionIfPresent
+    values = {}
+    for param in alg.parameters:
+        if not isinstance(param, ParameterDataObject) or not param.value:
+            continue
+        items = param.value.split(';') if isinstance(param, ParameterMultipleInput) else [param.value]
+        sources = []
+        for item in items:
+            layer = QgsProcessingUtils.mapLayerFromString(item, context, False)
+            if layer is None:
+                sources.append(item)
+                continue
+            if layer.providerType() == 'memory':
+                return None
+            if layer.type() == QgsMapLayer.VectorLayer and (layer.subsetString() or
+                                                            (useSelection and layer.selectedFeatureCount())):
+                return None
+            sources.append(layer.source())
+        values[param.name] = ';'.join(sources)
+    return values
+
+
 class BatchAlgorithmDialog(AlgorithmDialogBase):
 
     def __init__(self, alg):
@@ -72,9 +176,9 @@ class BatchAlgorithmDialog(AlgorithmDialogBase):
         self.canceled = False
 
         for row in range(self.mainWidget.tblParameters.rowCount()):
-            alg = self.alg.getCopy()
-            # hack - remove when getCopy is removed
-            alg.setProvider(self.alg.provider())
+            # rows may run concurrently, so each of them needs its own
+            # parameter and output values
+            alg = self.alg.getIndependentCopy()
             col = 0
             for param in alg.parameters:
                 if param.hidden:
@@ -121,31 +225,127 @@ class BatchAlgorithmDialog(AlgorithmDialogBase):
         except:
             pass
 
+        self.results = [None] * len(self.algs)
+        self.contexts = [None] * len(self.algs)
+        self.finishedRows = 0
+        self.progressBar.setValue(0)
+
+        workers = self.workerCount()
+        if workers > 1 and not self.resolveLayerSources():
+            self.setInfo(self.tr('Some rows use memory layers, filtered layers or selected features, '
+                                 'running them sequentially'))
+            workers = 1
+        if workers == 1:
+            self.runSequentially()
+        else:
+            self.setInfo(self.tr('Running {0} rows on {1} workers').format(len(self.algs), workers))
+            self.pending = deque(range(len(self.algs)))
+            self.running = {}
+            for i in range(min(workers, len(self.algs))):
+                self.startNextRow()
+
+    def workerCount(self):
+        """Returns the number of batch rows to execute concurrently"""
+        try:
+            workers = int(ProcessingConfig.getSetting(ProcessingConfig.BATCH_WORKERS))
+        except (TypeError, ValueError):
+            workers = 1
+        if workers <= 0:
+            workers = multiprocessing.cpu_count()
+        return max(1, min(workers, len(self.algs)))
+
+    def resolveLayerSources(self):
+        """Replaces the project layers used by all rows by their sources,
+        so rows can run in task threads without accessing the project.
+        Returns False, changing nothing, if some layer can not be replaced.
+        """
         context = dataobjects.createContext()
-
-        for count, alg in enumerate(self.algs):
-            self.setText(self.tr('\nProcessing algorithm {0}/{1}...').format(count + 1, len(self.algs)))
-            self.setInfo(self.tr('<b>Algorithm {0} starting...</b>').format(alg.displayName()))
-            if execute(alg, context, self.feedback) and not self.canceled:
-                if self.load[count]:
-                    handleAlgorithmResults(alg, context, self.feedback, False)
-                self.setInfo(self.tr('Algorithm {0} correctly executed...').format(alg.displayName()))
-            else:
-                QApplication.restoreOverrideCursor()
-                return
+        values = [layerSources(alg, context) for alg in self.algs]
+        if None in values:
+            return False
+        for alg, algValues in zip(self.algs, values):
+            for name, value in algValues.items():
+                alg.setParameterValue(name, value)
+        return True
+
+    def rowFeedback(self, row):
+        feedback = BatchRowFeedback(row)
+        feedback.messageReported.connect(self.rowMessage)
+        return feedback
+
+    def rowMessage(self, row, msg, error):
+        self.setInfo(self.tr('[row {0}] {1}').format(row + 1, msg), error)
+
+    def rowStarted(self, row):
+        self.setInfo(self.tr('<b>Algorithm {0} starting (row {1}/{2})...</b>').format(
+            self.algs[row].displayName(), row + 1, len(self.algs)))
+
+    def rowFinished(self, row, succeeded, elapsed):
+        self.results[row] = (succeeded, elapsed)
+        self.finishedRows += 1
+        self.progressBar.setValue(self.finishedRows)
+        if succeeded:
+            if self.load[row]:
+                handleAlgorithmResults(self.algs[row], self.contexts[row], self.feedback, False)
+            self.setInfo(self.tr('Algorithm {0} correctly executed (row {1}, {2:0.2f} seconds)').format(
+                self.algs[row].displayName(), row + 1, elapsed))
+        else:
+            self.setInfo(self.tr('Algorithm {0} failed (row {1}, {2:0.2f} seconds)').format(
+                self.algs[row].displayName(), row + 1, elapsed), True)
+        self.setText(self.tr('{0}/{1} rows processed').format(self.finishedRows, len(self.algs)))
+
+    def runSequentially(self):
+        for row, alg in enumerate(self.algs):
+            self.rowStarted(row)
+            self.contexts[row] = dataobjects.createContext()
+            start = time.time()
+            try:
+                succeeded = execute(alg, self.contexts[row], self.rowFeedback(row))
+            except Exception:
+                self.rowMessage(row, traceback.format_exc(), True)
+                succeeded = False
+            self.rowFinished(row, succeeded, time.time() - start)
 
         self.finish()
 
+    def startNextRow(self):
+        if not self.pending:
+            return
+        row = self.pending.popleft()
+        task = BatchRowTask(row, self.algs[row], self.rowFeedback(row))
+        self.contexts[row] = task.context
+        task.taskCompleted.connect(lambda: self.taskFinished(task))
+        task.taskTerminated.connect(lambda: self.taskFinished(task))
+        # keep a reference, the task manager does not own the python object
+        self.running[row] = task
+        self.rowStarted(row)
+        QgsApplication.taskManager().addTask(task)
+
+    def taskFinished(self, task):
+        del self.running[task.row]
+        task.context.setProject(QgsProject.instance())
+        self.rowFinished(task.row, task.succeeded and task.status() == QgsTask.Complete, task.elapsed)
+        self.startNextRow()
+        if not self.running:
+            self.finish()
+
     def finish(self):
         for count, alg in enumerate(self.algs):
-            self.loadHTMLResults(alg, count)
+            if self.results[count][0]:
+                self.loadHTMLResults(alg, count)
 
         self.createSummaryTable()
         QApplication.restoreOverrideCursor()
 
         self.mainWidget.setEnabled(True)
-        QMessageBox.information(self, self.tr('Batch processing'),
-                                self.tr('Batch processing completed'))
+        failed = len([r for r in self.results if not r[0]])
+        if failed:
+            QMessageBox.warning(self, self.tr('Batch processing'),
+                                self.tr('Batch processing completed with {0} failed rows out of {1}').format(
+                                    failed, len(self.algs)))
+        else:
+            QMessageBox.information(self, self.tr('Batch processing'),
+                                    self.tr('Batch processing completed'))
 
     def loadHTMLResults(self, alg, num):
         for out in alg.outputs:
@@ -157,24 +357,27 @@ class BatchAlgorithmDialog(AlgorithmDialogBase):
                     '{} [{}]'.format(out.description, num), out.value)
 
     def createSummaryTable(self):
-        createTable = False
-
-        for out in self.algs[0].outputs:
-            if isinstance(out, (OutputNumber, OutputString)):
-                createTable = True
-                break
-
-        if not createTable:
-            return
+        outputs = [out for out in self.algs[0].outputs
+                   if isinstance(out, (OutputNumber, OutputString))]
 
         outputFile = getTempFilename('html')
         with codecs.open(outputFile, 'w', encoding='utf-8') as f:
-            for alg in self.algs:
-                f.write('<hr>\n')
+            f.write('<table border="1" cellpadding="3">\n<tr><th>{}</th><th>{}</th><th>{}</th>'.format(
+                self.tr('Row'), self.tr('Status'), self.tr('Elapsed time (s)')))
+            for out in outputs:
+                f.write('<th>{}</th>'.format(out.description))
+            f.write('</tr>\n')
+            for row, alg in enumerate(self.algs):
+                succeeded, elapsed = self.results[row]
+                f.write('<tr><td>{}</td><td>{}</td><td>{:0.2f}</td>'.format(
+                    row + 1, self.tr('OK') if succeeded else self.tr('Failed'), elapsed))
                 for out in alg.outputs:
                     if isinstance(out, (OutputNumber, OutputString)):
-                        f.write('<p>{}: {}</p>\n'.format(out.description, out.value))
-            f.write('<hr>\n')
+                        f.write('<td>{}</td>'.format(out.value if succeeded else ''))
+                f.write('</tr>\n')
+            f.write('<tr><td></td><td>{}</td><td>{:0.2f}</td></tr>\n'.format(
+                self.tr('Total'), sum(r[1] for r in self.results)))
+            f.write('</table>\n')
 
         ProcessingResults.addResult(
             '{} [summary]'.format(self.algs[0].name), outputFile)
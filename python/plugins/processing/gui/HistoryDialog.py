@@ -29,7 +29,7 @@ import os
 
 from qgis.PyQt import uic
 from qgis.PyQt.QtCore import Qt
-from qgis.PyQt.QtWidgets import QAction, QPushButton, QDialogButtonBox, QStyle, QMessageBox, QFileDialog, QMenu, QTreeWidgetItem
+from qgis.PyQt.QtWidgets import QAction, QPushButton, QDialogButtonBox, QStyle, QMessageBox, QFileDialog, QMenu, QTreeWidgetItem, QLineEdit
 from qgis.PyQt.QtGui import QIcon
 from processing.gui import TestTools
 from processing.core.ProcessingLog import ProcessingLog
@@ -41,6 +41,9 @@ WIDGET, BASE = uic.loadUiType(
 
 class HistoryDialog(BASE, WIDGET):
 
+    # number of entries read from the history at once
+    PAGE_SIZE = 500
+
     def __init__(self):
         super(HistoryDialog, self).__init__(None)
         self.setupUi(self)
@@ -62,6 +65,12 @@ class HistoryDialog(BASE, WIDGET):
         self.saveButton.setToolTip(self.tr('Save history'))
         self.buttonBox.addButton(self.saveButton, QDialogButtonBox.ActionRole)
 
+        self.searchBox = QLineEdit()
+        self.searchBox.setPlaceholderText(self.tr('Filter by algorithm...'))
+        self.verticalLayout.insertWidget(0, self.searchBox)
+        self.searchBox.textChanged.connect(self.fillTree)
+
+        self.tree.verticalScrollBar().valueChanged.connect(self.scrolled)
         self.tree.doubleClicked.connect(self.executeAlgorithm)
         self.tree.currentItemChanged.connect(self.changeText)
         self.clearButton.clicked.connect(self.clearLog)
@@ -97,15 +106,30 @@ class HistoryDialog(BASE, WIDGET):
 
     def fillTree(self):
         self.tree.clear()
-        entries = ProcessingLog.getLogEntries()
-        groupItem = QTreeWidgetItem()
-        groupItem.setText(0, 'ALGORITHM')
-        groupItem.setIcon(0, self.groupIcon)
+        self.groupItem = QTreeWidgetItem()
+        self.groupItem.setText(0, 'ALGORITHM')
+        self.groupItem.setIcon(0, self.groupIcon)
+        self.tree.addTopLevelItem(self.groupItem)
+        self.loaded = 0
+        self.total = ProcessingLog.countLogEntries(self.searchBox.text())
+        self.loadEntries()
+
+    def loadEntries(self):
+        """Adds the next page of entries, most recent first."""
+        if self.loaded >= self.total:
+            return
+        entries = ProcessingLog.getLogEntries(self.PAGE_SIZE, self.loaded, self.searchBox.text())
         for entry in entries:
             item = TreeLogEntryItem(entry, True)
             item.setIcon(0, self.keyIcon)
-            groupItem.insertChild(0, item)
-        self.tree.addTopLevelItem(groupItem)
+            self.groupItem.addChild(item)
+        self.loaded += len(entries)
+        if not entries:
+            self.total = self.loaded
+
+    def scrolled(self, value):
+        if value == self.tree.verticalScrollBar().maximum():
+            self.loadEntries()
 
     def executeAlgorithm(self):
         item = self.tree.currentItem()
@@ -118,7 +142,15 @@ class HistoryDialog(BASE, WIDGET):
     def changeText(self):
         item = self.tree.currentItem()
         if isinstance(item, TreeLogEntryItem):
-            self.text.setText(item.entry.text.replace('|', '\n'))
+            entry = item.entry
+            text = entry.text.replace('|', '\n')
+            if entry.status is not None:
+                text += '\n\n' + self.tr('Status: {0}').format(entry.status)
+            if entry.duration is not None:
+                text += '\n' + self.tr('Duration: {0:0.2f} seconds').format(entry.duration)
+            if entry.features is not None:
+                text += '\n' + self.tr('Output features: {0}').format(entry.features)
+            self.text.setText(text)
 
     def createTest(self):
         item = self.tree.currentItem()
@@ -32,13 +32,17 @@ import sys
 import copy
 import time
 import json
-from qgis.PyQt.QtCore import QPointF
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from qgis.PyQt.QtCore import QPointF, QThread
 from operator import attrgetter
 
-from qgis.core import QgsApplication
+from qgis.core import QgsApplication, QgsProcessingFeedback
 from qgis.gui import QgsMessageBar
 from qgis.utils import iface
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.ProcessingConfig import ProcessingConfig
 from processing.modeler.WrongModelException import WrongModelException
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.core.parameters import (Parameter,
@@ -50,8 +54,10 @@ from processing.core.parameters import (Parameter,
                                         ParameterString,
                                         ParameterNumber,
                                         ParameterDataObject)
+from processing.core.outputs import Output, OutputRaster, OutputVector
 
 from processing.gui.Help2Html import getHtmlFromDescriptionsDict
+from processing.tools import dataobjects
 
 pluginPath = os.path.split(os.path.dirname(__file__))[0]
 
@@ -108,6 +114,10 @@ class Algorithm(object):
         self.outputsFolded = True
         self.active = True
 
+        # If True, intermediate raster outputs are always written to
+        # disk instead of as virtual rasters
+        self.materialize = False
+
     def todict(self):
         return {k: v for k, v in list(self.__dict__.items()) if not k.startswith("_")}
 
@@ -221,10 +231,49 @@ class CompoundValue(object):
         return ""  # TODO
 
 
+class ModelerChildFeedback(QgsProcessingFeedback):
+    """
+    Stores the feedback of a model child algorithm running in a worker
+    thread, so it can be relayed to the model feedback from the thread
+    running the model.
+    """
+
+    def __init__(self):
+        QgsProcessingFeedback.__init__(self)
+        self.messages = []
+
+    def reportError(self, msg):
+        self.messages.append(('reportError', msg))
+
+    def setProgressText(self, text):
+        self.messages.append(('setProgressText', text))
+
+    def pushInfo(self, msg):
+        self.messages.append(('pushInfo', msg))
+
+    def pushCommandInfo(self, msg):
+        self.messages.append(('pushCommandInfo', msg))
+
+    def pushDebugInfo(self, msg):
+        self.messages.append(('pushDebugInfo', msg))
+
+    def pushConsoleInfo(self, msg):
+        self.messages.append(('pushConsoleInfo', msg))
+
+    def relay(self, feedback):
+        messages, self.messages = self.messages, []
+        for method, msg in messages:
+            getattr(feedback, method)(msg)
+
+
 class ModelerAlgorithm(GeoAlgorithm):
 
     CANVAS_SIZE = 4000
 
+    # the model can be edited without changing the algorithm id, so
+    # results are only cached for the algorithms it contains
+    useResultCache = False
+
     def getCopy(self):
         newone = ModelerAlgorithm()
 
@@ -240,6 +289,11 @@ class ModelerAlgorithm(GeoAlgorithm):
         newone.helpContent = copy.deepcopy(self.helpContent)
         return newone
 
+    def getIndependentCopy(self):
+        newone = self.getCopy()
+        newone.setProvider(self.provider())
+        return newone
+
     def __init__(self):
         self._name = self.tr('Model', 'ModelerAlgorithm')
         # The dialog where this model is being edited
@@ -425,12 +479,17 @@ class ModelerAlgorithm(GeoAlgorithm):
             for output, pos in list(positions.items()):
                 self.algs[alg].outputs[output].pos = pos
 
-    def prepareAlgorithm(self, alg):
-        algInstance = alg.algorithm
+    def prepareAlgorithm(self, alg, instances=None):
+        """Sets the parameter and output values of the instance of a
+        child algorithm before executing it. instances is a dict with
+        the instance used for each child in the current execution, or
+        None to use the instances of the model algorithms.
+        """
+        algInstance = alg.algorithm if instances is None else instances[alg.modeler_name]
         for param in algInstance.parameters:
             if not param.hidden:
                 if param.name in alg.params:
-                    value = self.resolveValue(alg.params[param.name], param)
+                    value = self.resolveValue(alg.params[param.name], param, instances)
                 else:
                     if iface is not None:
                         iface.messageBar().pushMessage(self.tr("Warning"),
@@ -447,6 +506,8 @@ class ModelerAlgorithm(GeoAlgorithm):
                         )
                     )
 
+        virtual = (ProcessingConfig.getSetting(ProcessingConfig.VIRTUAL_INTERMEDIATE_RASTERS) and
+                   not alg.materialize)
         for out in algInstance.outputs:
             if not out.hidden:
                 if out.name in alg.outputs:
@@ -456,6 +517,10 @@ class ModelerAlgorithm(GeoAlgorithm):
                         out.value = modelOut.value
                 else:
                     out.value = None
+            if isinstance(out, OutputRaster):
+                # only intermediate outputs can be virtual, final ones
+                # are always written to disk
+                out.virtual = bool(virtual) and out.value is None
 
         return algInstance
 
@@ -475,64 +540,230 @@ class ModelerAlgorithm(GeoAlgorithm):
     def getSafeNameForOutput(self, algName, outName):
         return outName + '_ALG' + algName
 
-    def resolveValue(self, value, param):
+    def resolveValue(self, value, param, instances=None):
         if value is None:
             v = None
         if isinstance(value, list):
-            v = ";".join([self.resolveValue(v, param) for v in value])
+            v = ";".join([self.resolveValue(v, param, instances) for v in value])
         elif isinstance(value, CompoundValue):
-            v = self.resolveValue(value.definition, param)
+            v = self.resolveValue(value.definition, param, instances)
         elif isinstance(value, ValueFromInput):
             v = self.getParameterFromName(value.name).value
         elif isinstance(value, ValueFromOutput):
-            v = self.algs[value.alg].algorithm.getOutputFromName(value.output).value
+            algInstance = self.algs[value.alg].algorithm if instances is None else instances[value.alg]
+            v = algInstance.getOutputFromName(value.output).value
         else:
             v = value
         return param.evaluateForModeler(v, self)
 
+    def getExecutionGraph(self):
+        """This method returns a dict with the names of the active
+        algorithms as keys and the sets of names of the algorithms
+        each of them directly depends on as values.
+        """
+        graph = {}
+        for alg in list(self.algs.values()):
+            if not alg.active:
+                continue
+            parents = set(alg.dependencies)
+            for value in list(alg.params.values()):
+                if isinstance(value, CompoundValue):
+                    values = value.values
+                elif isinstance(value, list):
+                    values = value
+                else:
+                    values = [value]
+                for v in values:
+                    if isinstance(v, ValueFromOutput):
+                        parents.add(v.alg)
+            parents.discard(alg.modeler_name)
+            graph[alg.modeler_name] = parents
+        return graph
+
+    def workerCount(self):
+        """Returns the number of child algorithms that can run at the
+        same time, as set in the processing configuration.
+        """
+        try:
+            workers = int(ProcessingConfig.getSetting(ProcessingConfig.MODELER_WORKERS))
+        except (TypeError, ValueError):
+            workers = 1
+        if workers <= 0:
+            workers = multiprocessing.cpu_count()
+        return workers
+
     def processAlgorithm(self, context, feedback):
-        executed = []
-        toExecute = [alg for alg in list(self.algs.values()) if alg.active]
-        while len(executed) < len(toExecute):
-            for alg in toExecute:
-                if alg.modeler_name not in executed:
-                    canExecute = True
-                    required = self.getDependsOnAlgorithms(alg.modeler_name)
-                    for requiredAlg in required:
-                        if requiredAlg != alg.modeler_name and requiredAlg not in executed:
-                            canExecute = False
-                            break
-                    if canExecute:
+        graph = self.getExecutionGraph()
+        children = {name: [] for name in graph}
+        for name, parents in list(graph.items()):
+            for parent in parents:
+                if parent not in graph:
+                    raise GeoAlgorithmExecutionException(
+                        self.tr('Algorithm {0} depends on {1}, which is not active in the model', 'ModelerAlgorithm').format(
+                            self.algs[name].description, parent))
+                children[parent].append(name)
+
+        # number of unfinished parents of each algorithm
+        waiting = {name: len(parents) for name, parents in list(graph.items())}
+        ready = deque(sorted(name for name, count in list(waiting.items()) if count == 0))
+        workers = self.workerCount()
+
+        self.executionReport = {'model': self.name(),
+                                'workers': workers,
+                                'algorithms': []}
+        start = time.time()
+
+        # every child gets its own algorithm instance for this execution,
+        # as several children (or several executions of the model) might
+        # be running the same algorithm at the same time
+        instances = {name: self.algs[name].algorithm.getIndependentCopy() for name in graph}
+
+        def prepare(name):
+            alg = self.algs[name]
+            feedback.pushDebugInfo(
+                self.tr('Prepare algorithm: {0}', 'ModelerAlgorithm').format(name))
+            algInstance = self.prepareAlgorithm(alg, instances)
+            feedback.setProgressText(
+                self.tr('Running {0} [{1}/{2}]', 'ModelerAlgorithm').format(alg.description, len(report) + len(running) + 1, len(graph)))
+            feedback.pushDebugInfo('Parameters: ' + ', '.join([str(p).strip() +
+                                                               '=' + str(p.value) for p in algInstance.parameters]))
+            return algInstance
+
+        def finished(name, t0, dt):
+            algInstance = instances[name]
+            alg = self.algs[name]
+            # copy algorithm output value(s) back to model in case the algorithm modified those
+            for out in algInstance.outputs:
+                if not out.hidden:
+                    if out.name in alg.outputs:
+                        modelOut = self.getOutputFromName(self.getSafeNameForOutput(name, out.name))
+                        if modelOut:
+                            modelOut.value = out.value
+            report.append(self._reportEntry(name, 'ok', t0 - start, dt))
+            feedback.pushDebugInfo(
+                self.tr('OK. Execution took %{0:.3f} ms ({1} outputs).', 'ModelerAlgorithm').format(dt, len(algInstance.outputs)))
+            for child in children[name]:
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    ready.append(child)
+
+        def failed(name, t0, e):
+            report.append(self._reportEntry(name, 'failed', t0 - start, time.time() - t0))
+            feedback.pushDebugInfo(self.tr('Failed', 'ModelerAlgorithm'))
+            self._writeExecutionReport(start, feedback)
+            raise GeoAlgorithmExecutionException(
+                self.tr('Error executing algorithm {0}\n{1}', 'ModelerAlgorithm').format(self.algs[name].description, e.msg))
+
+        report = self.executionReport['algorithms']
+        running = {}
+        if workers == 1:
+            while ready:
+                name = ready.popleft()
+                algInstance = prepare(name)
+                t0 = time.time()
+                try:
+                    algInstance.execute(context, feedback)
+                except GeoAlgorithmExecutionException as e:
+                    failed(name, t0, e)
+                finished(name, t0, time.time() - t0)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                modelThread = QThread.currentThread()
+                while ready or running:
+                    # once canceled, only wait for the running children
+                    while ready and len(running) < workers and not feedback.isCanceled():
+                        name = ready.popleft()
+                        algInstance = prepare(name)
+                        self._useFileOutputs(algInstance)
+                        childContext = self._childContext(context)
+                        childFeedback = ModelerChildFeedback()
+                        future = pool.submit(self._executeChild, algInstance, childContext, childFeedback, modelThread)
+                        running[future] = (name, time.time(), childContext, childFeedback)
+
+                    done, notDone = wait(list(running.keys()), timeout=0.1, return_when=FIRST_COMPLETED)
+                    if feedback.isCanceled():
+                        ready.clear()
+                        for name, t0, childContext, childFeedback in list(running.values()):
+                            childFeedback.cancel()
+                    for future in done:
+                        name, t0, childContext, childFeedback = running.pop(future)
+                        childFeedback.relay(feedback)
+                        self._takeTemporaryLayers(childContext, context)
                         try:
-                            feedback.pushDebugInfo(
-                                self.tr('Prepare algorithm: {0}', 'ModelerAlgorithm').format(alg.modeler_name))
-                            self.prepareAlgorithm(alg)
-                            feedback.setProgressText(
-                                self.tr('Running {0} [{1}/{2}]', 'ModelerAlgorithm').format(alg.description, len(executed) + 1, len(toExecute)))
-                            feedback.pushDebugInfo('Parameters: ' + ', '.join([str(p).strip() +
-                                                                               '=' + str(p.value) for p in alg.algorithm.parameters]))
-                            t0 = time.time()
-                            alg.algorithm.execute(context, feedback)
-                            dt = time.time() - t0
-
-                            # copy algorithm output value(s) back to model in case the algorithm modified those
-                            for out in alg.algorithm.outputs:
-                                if not out.hidden:
-                                    if out.name in alg.outputs:
-                                        modelOut = self.getOutputFromName(self.getSafeNameForOutput(alg.modeler_name, out.name))
-                                        if modelOut:
-                                            modelOut.value = out.value
-
-                            executed.append(alg.modeler_name)
-                            feedback.pushDebugInfo(
-                                self.tr('OK. Execution took %{0:.3f} ms ({1} outputs).', 'ModelerAlgorithm').format(dt, len(alg.algorithm.outputs)))
+                            dt = future.result()
                         except GeoAlgorithmExecutionException as e:
-                            feedback.pushDebugInfo(self.tr('Failed', 'ModelerAlgorithm'))
-                            raise GeoAlgorithmExecutionException(
-                                self.tr('Error executing algorithm {0}\n{1}', 'ModelerAlgorithm').format(alg.description, e.msg))
+                            for other in list(running.values()):
+                                other[3].cancel()
+                            failed(name, t0, e)
+                        finished(name, t0, dt)
+                        feedback.setProgress(int(100.0 * len(report) / len(graph)))
+
+        if len(report) < len(graph):
+            if feedback.isCanceled():
+                raise GeoAlgorithmExecutionException(
+                    self.tr('Model execution canceled', 'ModelerAlgorithm'))
+            pending = sorted(name for name in graph if waiting[name] > 0)
+            raise GeoAlgorithmExecutionException(
+                self.tr('Circular dependencies between algorithms: {0}', 'ModelerAlgorithm').format(', '.join(pending)))
+
+        self._writeExecutionReport(start, feedback)
+        feedback.pushDebugInfo(
+            self.tr('Model processed ok. Executed {0} algorithms total', 'ModelerAlgorithm').format(len(report)))
 
+    def _executeChild(self, algInstance, context, feedback, modelThread):
+        t0 = time.time()
+        try:
+            algInstance.execute(context, feedback)
+        finally:
+            # layers can only be moved to another thread by the thread
+            # they belong to, so they are handed to the model thread here,
+            # before _takeTemporaryLayers adds them to the model context
+            for layer in context.temporaryLayerStore().mapLayers().values():
+                layer.moveToThread(modelThread)
+        return time.time() - t0
+
+    def _childContext(self, context):
+        """Returns a new context with the settings of the model context,
+        for a child algorithm running in a worker thread, so children
+        running at the same time never share a temporary layer store.
+        """
+        childContext = dataobjects.createContext()
+        childContext.setProject(context.project())
+        childContext.setFlags(context.flags())
+        childContext.setInvalidGeometryCheck(context.invalidGeometryCheck())
+        childContext.setDefaultEncoding(context.defaultEncoding())
+        return childContext
+
+    def _takeTemporaryLayers(self, childContext, context):
+        """Moves the layers loaded or created by a child algorithm to the
+        temporary layer store of the model context.
+        """
+        store = childContext.temporaryLayerStore()
+        for layer in list(store.mapLayers().values()):
+            context.temporaryLayerStore().addMapLayer(store.takeMapLayer(layer))
+
+    def _useFileOutputs(self, algInstance):
+        """Writes the intermediate vector outputs of a child running in a
+        worker thread to temporary files instead of memory layers, which
+        would only be available in the context of that child.
+        """
+        for out in algInstance.outputs:
+            if isinstance(out, OutputVector) and not out.hidden and not out.value:
+                out.value = Output._resolveTemporary(out, algInstance)
+
+    def _reportEntry(self, name, status, started, elapsed):
+        alg = self.algs[name]
+        return {'name': name,
+                'algorithm': alg.consoleName,
+                'description': alg.description,
+                'status': status,
+                'started': round(started, 3),
+                'elapsed': round(elapsed, 3)}
+
+    def _writeExecutionReport(self, start, feedback):
+        self.executionReport['elapsed'] = round(time.time() - start, 3)
         feedback.pushDebugInfo(
-            self.tr('Model processed ok. Executed {0} algorithms total', 'ModelerAlgorithm').format(len(executed)))
+            self.tr('Execution report: {0}', 'ModelerAlgorithm').format(json.dumps(self.executionReport)))
 
     def getAsCommand(self):
         if self.descriptionFile:
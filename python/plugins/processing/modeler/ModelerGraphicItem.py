@@ -168,12 +168,20 @@ class ModelerGraphicItem(QGraphicsItem):
             else:
                 deactivateAction = popupmenu.addAction('Deactivate')
                 deactivateAction.triggered.connect(self.deactivateAlgorithm)
+            materializeAction = popupmenu.addAction('Always Write Outputs to Disk')
+            materializeAction.setCheckable(True)
+            materializeAction.setChecked(self.element.materialize)
+            materializeAction.toggled.connect(self.setMaterialize)
         popupmenu.exec_(event.screenPos())
 
     def deactivateAlgorithm(self):
         self.model.deactivateAlgorithm(self.element.modeler_name)
         self.model.updateModelerView()
 
+    def setMaterialize(self, materialize):
+        self.element.materialize = materialize
+        self.model.updateModelerView()
+
     def activateAlgorithm(self):
         if self.model.activateAlgorithm(self.element.modeler_name):
             self.model.updateModelerView()
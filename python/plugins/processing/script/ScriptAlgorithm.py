@@ -48,6 +48,9 @@ pluginPath = os.path.split(os.path.dirname(__file__))[0]
 
 class ScriptAlgorithm(GeoAlgorithm):
 
+    # the script can be edited without changing the algorithm id
+    useResultCache = False
+
     def __init__(self, descriptionFile, script=None):
         """The script parameter can be used to directly pass the code
         of the script without a file.
@@ -27,10 +27,17 @@ __revision__ = ':%H$'
 
 import AlgorithmsTestBase
 from processing.algs.gdal.ogr2ogrtopostgis import Ogr2OgrToPostGis
+from processing.algs.gdal.GdalUtils import GdalUtils
+from processing.algs.gdal.GdalLibrary import GdalLibrary
 
+import os
 import nose2
 import shutil
+import tempfile
 
+from osgeo import gdal, ogr
+
+from qgis.core import QgsProcessingFeedback
 from qgis.testing import (
     start_app,
     unittest
@@ -102,5 +109,98 @@ class TestGdalOgr2OgrToPostgis(unittest.TestCase):
                          "password=pwd active_schema=public user=usr")
 
 
+class TestGdalUtils(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start_app()
+        cls.testDataPath = os.path.join(os.path.dirname(__file__), 'testdata')
+
+    def checksum(self, path):
+        dataset = gdal.Open(path)
+        return dataset.GetRasterBand(1).Checksum()
+
+    def testTranslateRaster(self):
+        outdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(outdir, 'source.tif')
+            shutil.copyfile(os.path.join(self.testDataPath, 'dem.tif'), source)
+            expected = self.checksum(source)
+
+            # a different format is written by GDAL
+            dest = os.path.join(outdir, 'dest.img')
+            GdalUtils.translateRaster(source, dest)
+            self.assertEqual(gdal.Open(dest).GetDriver().ShortName, 'HFA')
+            self.assertEqual(self.checksum(dest), expected)
+
+            # the same format is renamed
+            dest = os.path.join(outdir, 'dest.tiff')
+            GdalUtils.translateRaster(source, dest)
+            self.assertFalse(os.path.exists(source))
+            self.assertEqual(self.checksum(dest), expected)
+
+            # VRT files reference the pixels moved next to them
+            dest = os.path.join(outdir, 'virtual.vrt')
+            GdalUtils.translateRaster(os.path.join(outdir, 'dest.tiff'), dest)
+            self.assertTrue(os.path.exists(os.path.join(outdir, 'virtual.tiff')))
+            self.assertEqual(self.checksum(dest), expected)
+        finally:
+            shutil.rmtree(outdir, True)
+
+    def testTranslateVector(self):
+        outdir = tempfile.mkdtemp()
+        try:
+            dest = os.path.join(outdir, 'points.gpkg')
+            if not GdalUtils.translateVector(os.path.join(self.testDataPath, 'points.gml'), dest):
+                return
+            dataSource = ogr.Open(dest)
+            self.assertEqual(dataSource.GetLayer(0).GetName(), 'points')
+            self.assertEqual(dataSource.GetLayer(0).GetFeatureCount(), 9)
+        finally:
+            shutil.rmtree(outdir, True)
+
+
+class TestGdalLibrary(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start_app()
+        cls.testDataPath = os.path.join(os.path.dirname(__file__), 'testdata')
+
+    def testParse(self):
+        name, args = GdalLibrary.parse(['gdal_translate', '-of GTiff -co "A=B C" in.tif "out file.tif"'])
+        self.assertEqual(name, 'gdal_translate')
+        self.assertEqual(args, ['-of', 'GTiff', '-co', 'A=B C', 'in.tif', 'out file.tif'])
+        name, args = GdalLibrary.parse(['cmd.exe', '/C ', 'gdal_sieve.bat', '-st 2 in.tif out.tif'])
+        self.assertEqual(name, 'gdal_sieve')
+
+    def testUnsupported(self):
+        feedback = QgsProcessingFeedback()
+        self.assertFalse(GdalLibrary.run(['gdal2tiles.py', 'in.tif out'], feedback))
+        self.assertFalse(GdalLibrary.run(['gdal_sieve.py', '-unknown in.tif out.tif'], feedback))
+
+    def testRun(self):
+        if not GdalLibrary.isAvailable():
+            return
+        outdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(self.testDataPath, 'dem.tif')
+            expected = gdal.Open(source).GetRasterBand(1).Checksum()
+
+            dest = os.path.join(outdir, 'translated.tif')
+            feedback = QgsProcessingFeedback()
+            self.assertTrue(GdalLibrary.run(['gdal_translate', '-of GTiff {} {}'.format(source, dest)], feedback))
+            self.assertEqual(gdal.Open(dest).GetRasterBand(1).Checksum(), expected)
+
+            dest = os.path.join(outdir, 'sieved.tif')
+            self.assertTrue(GdalLibrary.run(['gdal_sieve.py', '-st 2 -4 -of GTiff {} {}'.format(source, dest)], feedback))
+            self.assertTrue(os.path.exists(dest))
+
+            output = GdalLibrary.run(['gdalinfo', source], feedback)
+            self.assertTrue(any('Driver: GTiff' in line for line in output))
+        finally:
+            shutil.rmtree(outdir, True)
+
+
 if __name__ == '__main__':
     nose2.main()
@@ -33,6 +33,8 @@ from processing.modeler.ModelerAlgorithm import (Algorithm,
                                                  ModelerOutput,
                                                  ValueFromOutput)
 from processing.modeler.ModelerParametersDialog import (ModelerParametersDialog)
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.algs.gdal.translate import translate
 from processing.core.parameters import (ParameterFile,
                                         ParameterNumber,
                                         ParameterString,
@@ -91,6 +93,71 @@ class ModelerTest(unittest.TestCase):
         a2.params['INPUT'] = ValueFromOutput('QGISCLIP_1', 'OUTPUT')
         self.assertEqual(m.hasDependencies('QGISCLIP_1'), True)
 
+    def testModelerAlgorithmExecutionGraph(self):
+        # test getExecutionGraph from ModelerAlgorithm
+
+        m = ModelerAlgorithm()
+
+        a = Algorithm("qgis:clip")
+        m.addAlgorithm(a)
+        a2 = Algorithm("qgis:clip")
+        m.addAlgorithm(a2)
+        a3 = Algorithm("qgis:clip")
+        m.addAlgorithm(a3)
+
+        self.assertEqual(m.getExecutionGraph(),
+                         {'QGISCLIP_1': set(), 'QGISCLIP_2': set(), 'QGISCLIP_3': set()})
+
+        # direct dependencies only, from outputs and explicit dependencies
+        a.outputs['OUTPUT'] = ModelerOutput('out')
+        a2.params['INPUT'] = ValueFromOutput('QGISCLIP_1', 'OUTPUT')
+        a3.params['INPUT'] = [ValueFromOutput('QGISCLIP_2', 'OUTPUT')]
+        a3.dependencies = ['QGISCLIP_3']
+        self.assertEqual(m.getExecutionGraph(),
+                         {'QGISCLIP_1': set(), 'QGISCLIP_2': set(['QGISCLIP_1']), 'QGISCLIP_3': set(['QGISCLIP_2'])})
+
+        # inactive algorithms are not part of the graph
+        a3.active = False
+        self.assertEqual(set(m.getExecutionGraph().keys()), set(['QGISCLIP_1', 'QGISCLIP_2']))
+
+    def testModelerChildInstances(self):
+        # executions prepare their own instance of each child algorithm,
+        # leaving the instances of the model untouched
+
+        m = ModelerAlgorithm()
+        a = Algorithm("gdal:translate")
+        a._algInstance = translate()
+        m.addAlgorithm(a)
+        a.algorithm.getOutputFromName('OUTPUT').value = 'shared.tif'
+
+        instances = {a.modeler_name: a.algorithm.getIndependentCopy()}
+        instance = m.prepareAlgorithm(a, instances)
+        self.assertIs(instance, instances[a.modeler_name])
+        self.assertIsNone(instance.getOutputFromName('OUTPUT').value)
+        self.assertEqual(a.algorithm.getOutputFromName('OUTPUT').value, 'shared.tif')
+
+    def testModelerVirtualIntermediateRasters(self):
+        # intermediate raster outputs are written as VRT by algorithms
+        # supporting it, unless the algorithm is set to materialize them
+
+        ProcessingConfig.initialize()
+        ProcessingConfig.setSettingValue(ProcessingConfig.VIRTUAL_INTERMEDIATE_RASTERS, True)
+        m = ModelerAlgorithm()
+        a = Algorithm("gdal:translate")
+        a._algInstance = translate()
+        m.addAlgorithm(a)
+
+        out = m.prepareAlgorithm(a).getOutputFromName('OUTPUT')
+        self.assertTrue(out.virtual)
+        out.resolveValue(a.algorithm)
+        self.assertTrue(out.value.endswith('.vrt'))
+
+        a.materialize = True
+        out = m.prepareAlgorithm(a).getOutputFromName('OUTPUT')
+        self.assertFalse(out.virtual)
+        out.resolveValue(a.algorithm)
+        self.assertFalse(out.value.endswith('.vrt'))
+
 
 if __name__ == '__main__':
     unittest.main()
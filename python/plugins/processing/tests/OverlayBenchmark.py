@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    OverlayBenchmark.py
+    ---------------------
+    Date                 : June 2017
+    Copyright            : (C) 2017 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'June 2017'
+__copyright__ = '(C) 2017, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+# Compares the number of provider requests and the time needed to look
+# up the overlay candidates of every feature of a layer, fetching them
+# by id for each feature, as the overlay algorithms used to do, and
+# using vector.FeatureCache.
+#
+# Usage: python3 OverlayBenchmark.py [features] [cache size in MB]
+
+import sys
+import time
+import random
+
+from qgis.core import (QgsVectorLayer,
+                       QgsFeature,
+                       QgsFeatureRequest,
+                       QgsGeometry,
+                       QgsRectangle,
+                       QgsProcessingContext,
+                       QgsProcessingUtils)
+from qgis.testing import start_app
+
+from processing.tools import vector
+
+
+def createLayer(count, seed):
+    random.seed(seed)
+    layer = QgsVectorLayer('Polygon?field=id:integer&field=name:string', 'bench', 'memory')
+    features = []
+    for i in range(count):
+        x = random.uniform(0, 1000)
+        y = random.uniform(0, 1000)
+        size = random.uniform(1, 20)
+        f = QgsFeature(layer.fields())
+        f.setAttributes([i, 'feature {}'.format(i)])
+        f.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, y, x + size, y + size)))
+        features.append(f)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def byId(layerA, layerB, context):
+    requests = 1
+    index = QgsProcessingUtils.createSpatialIndex(layerB, context)
+    candidates = 0
+    for f in QgsProcessingUtils.getFeatures(layerA, context):
+        intersects = index.intersects(f.geometry().boundingBox())
+        requests += 1
+        candidates += len(list(layerB.getFeatures(QgsFeatureRequest().setFilterFids(intersects))))
+    return requests, candidates
+
+
+def cached(layerA, layerB, context, maxSize):
+    cache = vector.FeatureCache(layerB, context, maxSize=maxSize)
+    candidates = 0
+    for f in QgsProcessingUtils.getFeatures(layerA, context):
+        candidates += len(cache.candidates(f.geometry().boundingBox()))
+    return cache.requests, candidates
+
+
+def run(count, maxSize):
+    context = QgsProcessingContext()
+    context.setFlags(QgsProcessingContext.Flags(0))
+    layerA = createLayer(count, 1)
+    layerB = createLayer(count, 2)
+
+    for name, function, args in [('by id', byId, ()),
+                                 ('cached', cached, (maxSize, ))]:
+        start = time.time()
+        requests, candidates = function(layerA, layerB, context, *args)
+        print('{:<8} {:>8} requests {:>8} candidates {:>8.2f} s'.format(
+            name, requests, candidates, time.time() - start))
+
+
+if __name__ == '__main__':
+    start_app()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    maxSize = float(sys.argv[2]) if len(sys.argv) > 2 else 256
+    run(count, maxSize)
@@ -26,15 +26,45 @@ __copyright__ = '(C) 2016, Nyall Dawson'
 __revision__ = '$Format:%H$'
 
 import os
+import glob
+import codecs
+import datetime
+import gzip
+import math
 import shutil
 import tempfile
+import subprocess
+import sys
 
+import numpy
+
+from osgeo import gdal
 from qgis.core import (QgsVectorLayer,
-                       QgsProcessingContext)
+                       QgsFeature,
+                       QgsFeatureRequest,
+                       QgsGeometry,
+                       QgsCoordinateReferenceSystem,
+                       QgsProcessingContext,
+                       QgsProcessingFeedback,
+                       QgsProject)
 from qgis.testing import start_app, unittest
 
+from processing.algs.grass7.Grass7Pool import Grass7Pool
+from processing.algs.grass7.Grass7Utils import Grass7Session
+from processing.algs.qgis.Centroids import centroid
+from processing.algs.qgis.Delaunay import Delaunay
+from processing.algs.qgis.VoronoiPolygons import VoronoiPolygons
+from processing.core.ExportCache import ExportCache
+from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.core.ProcessingLog import ProcessingLog
+from processing.core.ResultCache import ResultCache
+from processing.core.SpatialIndexCache import SpatialIndexCache
+from processing.core.parameters import ParameterRaster, ParameterNumber
+from processing.core.outputs import OutputRaster, OutputNumber
 from processing.tests.TestData import points
-from processing.tools import vector
+from processing.tools import vector, raster, parallel, dataobjects
+from processing.tools.system import SPATIAL_INDEX_SUFFIX
 
 testDataPath = os.path.join(os.path.dirname(__file__), 'testdata')
 
@@ -129,6 +159,824 @@ class VectorTest(unittest.TestCase):
         name = vector.ogrLayerName('port=5493 sslmode=disable key=\'edge_id\' srid=0 type=LineString table="city_data"."edge" (geom) sql=')
         self.assertEqual(name, 'city_data.edge')
 
+    def testSnapToPrecision(self):
+        geom = QgsGeometry.fromWkt('MultiPolygon(((0.12 0.34, 1.26 0, 1 1, 0.12 0.34)))')
+        snapped = vector.snapToPrecision(geom, 0.5)
+        expected = QgsGeometry.fromWkt('MultiPolygon(((0 0.5, 1.5 0, 1 1, 0 0.5)))')
+        self.assertTrue(snapped.equals(expected), snapped.exportToWkt())
+
+        # unchanged for no precision
+        snapped = vector.snapToPrecision(geom, 0.0)
+        self.assertTrue(snapped.equals(geom))
+
+    def testDuplicateGeometryFinder(self):
+        finder = vector.DuplicateGeometryFinder()
+        wkts = ['LineString(0 0, 1 1)',
+                'LineString(1 1, 0 0)',
+                'LineString(0 0, 0.5 0.5, 1 1)',
+                'LineString(0 0, 1 1.001)',
+                'LineString(0 0, 1 1)']
+        for fid, wkt in enumerate(wkts):
+            finder.addGeometry(fid, QgsGeometry.fromWkt(wkt))
+        self.assertEqual(finder.groups, [[0, 1, 2, 4], [3]])
+
+        finder = vector.DuplicateGeometryFinder(0.01)
+        for fid, wkt in enumerate(wkts):
+            finder.addGeometry(fid, QgsGeometry.fromWkt(wkt))
+        self.assertEqual(finder.groups, [[0, 1, 2, 3, 4]])
+
+    def testNearestNeighbourFinder(self):
+        context = QgsProcessingContext()
+        context.setFlags(QgsProcessingContext.Flags(0))
+
+        test_layer = QgsVectorLayer(points(), 'test', 'ogr')
+        finder = vector.NearestNeighbourFinder(test_layer, context, ['id'])
+        self.assertEqual(len(finder), test_layer.featureCount())
+
+        targets = [(f.id(), f['id'], f.geometry().asPoint()) for f in test_layer.getFeatures()]
+        queries = [(0, 0), (5, 5), (-2.5, 10)]
+        ids, distances, rows = finder.query(queries, 3)
+        self.assertEqual(ids.shape, (3, 3))
+        idIdx = test_layer.fields().lookupField('id')
+        for (x, y), qIds, qDistances, qRows in zip(queries, ids, distances, rows):
+            expected = sorted(math.hypot(p.x() - x, p.y() - y) for fid, value, p in targets)[:3]
+            for e, d in zip(expected, qDistances):
+                self.assertAlmostEqual(e, d)
+            # attributes are returned along with the ids
+            values = dict((fid, value) for fid, value, p in targets)
+            for fid, row in zip(qIds, qRows):
+                self.assertEqual(finder.attributes[row][idIdx], values[fid])
+
+        # k is limited to the number of features
+        ids, distances, rows = finder.query([(0, 0)], 100)
+        self.assertEqual(ids.shape, (1, test_layer.featureCount()))
+
+    def testSpatialPredicateIndex(self):
+        context = QgsProcessingContext()
+        context.setFlags(QgsProcessingContext.Flags(0))
+
+        layer = QgsVectorLayer('Polygon', 'test', 'memory')
+        features = []
+        for wkt in ['Polygon((0 0, 2 0, 2 2, 0 2, 0 0))',
+                    'Polygon((2 0, 4 0, 4 2, 2 2, 2 0))',
+                    'Polygon((10 10, 11 10, 11 11, 10 11, 10 10))']:
+            f = QgsFeature()
+            f.setGeometry(QgsGeometry.fromWkt(wkt))
+            features.append(f)
+        layer.dataProvider().addFeatures(features)
+        fids = [f.id() for f in layer.getFeatures()]
+
+        index = vector.SpatialPredicateIndex(layer, context)
+        probe = QgsGeometry.fromWkt('Point(1 1)')
+        # the probe is within the first polygon, which contains it
+        self.assertEqual(index.matches(probe, ['within']), [fids[0]])
+        self.assertEqual(index.matches(probe, ['within'], True), [])
+        self.assertEqual(index.matches(probe, ['contains'], True), [fids[0]])
+        self.assertEqual(sorted(index.matches(QgsGeometry.fromWkt('Point(2 1)'), ['touches'])), fids[:2])
+        self.assertEqual(index.allFids() - set(index.matches(probe, ['intersects'])), set(fids[1:]))
+
+        # geometries are snapped to the precision
+        index = vector.SpatialPredicateIndex(layer, context, 1.0)
+        self.assertEqual(index.matches(QgsGeometry.fromWkt('Point(4.2 1)'), ['touches']), [fids[1]])
+
+    def testFeatureCache(self):
+        context = QgsProcessingContext()
+        context.setFlags(QgsProcessingContext.Flags(0))
+
+        layer = QgsVectorLayer('Polygon?field=name:string', 'test', 'memory')
+        features = []
+        for name, wkt in [('a', 'Polygon((0 0, 2 0, 2 2, 0 2, 0 0))'),
+                          ('b', 'Polygon((2 0, 4 0, 4 2, 2 2, 2 0))'),
+                          ('c', 'Polygon((10 10, 11 10, 11 11, 10 11, 10 10))')]:
+            f = QgsFeature(layer.fields())
+            f.setAttributes([name])
+            f.setGeometry(QgsGeometry.fromWkt(wkt))
+            features.append(f)
+        layer.dataProvider().addFeatures(features)
+        fids = [f.id() for f in layer.getFeatures()]
+
+        # everything fits in memory: the layer is only read once
+        cache = vector.FeatureCache(layer, context)
+        self.assertEqual(len(cache), 3)
+        for i in range(5):
+            candidates = cache.candidates(QgsGeometry.fromWkt('Point(2 1)').boundingBox())
+        self.assertEqual([c[0] for c in candidates], fids[:2])
+        self.assertEqual([c[2] for c in candidates], [['a'], ['b']])
+        self.assertEqual(candidates[1][1].exportToWkt(), features[1].geometry().exportToWkt())
+        self.assertEqual(cache.requests, 1)
+
+        # a cache holding a single feature fetches the other ones again
+        cache = vector.FeatureCache(layer, context, attributes=False, maxSize=400.0 / 1024 / 1024)
+        candidates = cache.candidates(layer.extent())
+        self.assertEqual([c[0] for c in candidates], fids)
+        self.assertEqual([c[2] for c in candidates], [[], [], []])
+        self.assertEqual(cache.requests, 2)
+        self.assertLessEqual(cache.size, 400)
+
+        # features outside of the extent are not read
+        cache = vector.FeatureCache(layer, context, extent=QgsGeometry.fromWkt('Point(1 1)').boundingBox())
+        self.assertEqual(len(cache), 1)
+
+    def testPointsInPolygonCounter(self):
+        context = QgsProcessingContext()
+        context.setFlags(QgsProcessingContext.Flags(0))
+
+        polygons = QgsVectorLayer('Polygon', 'polygons', 'memory')
+        features = []
+        for wkt in ['Polygon((0 0, 2 0, 2 2, 0 2, 0 0))',
+                    'Polygon((1 0, 4 0, 4 2, 1 2, 1 0))',
+                    'Polygon((10 10, 11 10, 11 11, 10 11, 10 10))']:
+            f = QgsFeature()
+            f.setGeometry(QgsGeometry.fromWkt(wkt))
+            features.append(f)
+        polygons.dataProvider().addFeatures(features)
+
+        points = QgsVectorLayer('Point?field=value:string', 'points', 'memory')
+        features = []
+        for wkt, value in [('Point(0.5 0.5)', '1'),
+                           ('Point(1.5 0.5)', '2'),
+                           ('Point(1.5 1.5)', '2'),
+                           ('Point(3 1)', 'x')]:
+            f = QgsFeature(points.fields())
+            f.setAttributes([value])
+            f.setGeometry(QgsGeometry.fromWkt(wkt))
+            features.append(f)
+        points.dataProvider().addFeatures(features)
+
+        for mode, expected in [(vector.PointsInPolygonCounter.COUNT, [3, 3, 0]),
+                               (vector.PointsInPolygonCounter.SUM, [5, 4, 0]),
+                               (vector.PointsInPolygonCounter.UNIQUE, [2, 2, 0])]:
+            counter = vector.PointsInPolygonCounter(polygons, points, context, mode, 0)
+            self.assertTrue(counter.pointMajor())
+            self.assertEqual([v for f, v in counter.values(QgsProcessingFeedback())], expected)
+            # both strategies give the same results
+            counter.pointMajor = lambda: False
+            self.assertEqual([v for f, v in counter.values(QgsProcessingFeedback())], expected)
+
+    def testSpatialIndexCache(self):
+        outdir = tempfile.mkdtemp()
+        self.cleanup_paths.append(outdir)
+        for f in glob.glob(os.path.join(testDataPath, 'points.*')):
+            shutil.copy(f, outdir)
+        fileName = os.path.join(outdir, 'points.gml')
+
+        ProcessingConfig.initialize()
+        ProcessingConfig.setSettingValue(ProcessingConfig.USE_SPATIAL_INDEX_CACHE, True)
+        ProcessingConfig.setSettingValue(ProcessingConfig.PERSIST_SPATIAL_INDEXES, True)
+        try:
+            context = QgsProcessingContext()
+            layer = QgsVectorLayer(fileName, 'points', 'ogr')
+            fids = sorted(f.id() for f in layer.getFeatures())
+
+            SpatialIndexCache.clear()
+            index = SpatialIndexCache.index(layer, context)
+            self.assertEqual((SpatialIndexCache.hits, SpatialIndexCache.misses), (0, 1))
+            self.assertEqual(sorted(index.intersects(layer.extent())), fids)
+            self.assertEqual(len(glob.glob(os.path.join(outdir, '*' + SPATIAL_INDEX_SUFFIX))), 1)
+
+            index = SpatialIndexCache.index(layer, context)
+            self.assertEqual((SpatialIndexCache.hits, SpatialIndexCache.misses), (1, 1))
+            self.assertEqual(sorted(index.intersects(layer.extent())), fids)
+
+            # the persisted index is used in later sessions
+            SpatialIndexCache.clear()
+            index = SpatialIndexCache.index(layer, context)
+            self.assertEqual((SpatialIndexCache.hits, SpatialIndexCache.misses), (1, 0))
+            self.assertEqual(sorted(index.intersects(layer.extent())), fids)
+
+            # indexes are not shared between invalid geometry checks
+            skipContext = QgsProcessingContext()
+            skipContext.setInvalidGeometryCheck(QgsFeatureRequest.GeometrySkipInvalid)
+            self.assertNotEqual(SpatialIndexCache.key(layer, skipContext), SpatialIndexCache.key(layer, context))
+
+            # but not once the file changes
+            os.utime(fileName, (0, 0))
+            SpatialIndexCache.index(layer, context)
+            self.assertEqual((SpatialIndexCache.hits, SpatialIndexCache.misses), (1, 1))
+        finally:
+            ProcessingConfig.setSettingValue(ProcessingConfig.PERSIST_SPATIAL_INDEXES, False)
+            SpatialIndexCache.clear()
+
+    def testTableWriter(self):
+        outdir = tempfile.mkdtemp()
+        self.cleanup_paths.append(outdir)
+
+        # csv, extension added when missing
+        with vector.TableWriter(os.path.join(outdir, 'table'), None, ['a', 'b']) as writer:
+            writer.addRecord([1, 'x'])
+            writer.addRecords([[2, 'y'], [3, 'z']])
+        with open(os.path.join(outdir, 'table.csv')) as f:
+            self.assertEqual(f.read().splitlines(), ['a,b', '1,x', '2,y', '3,z'])
+
+        # compressed csv
+        fileName = os.path.join(outdir, 'table.csv.gz')
+        with vector.TableWriter(fileName, None, ['a', 'b']) as writer:
+            writer.addRecord([1, 'x'])
+        with gzip.open(fileName, 'rt') as f:
+            self.assertEqual(f.read().splitlines(), ['a,b', '1,x'])
+
+        # columnar, with the header given as the first record
+        fileName = os.path.join(outdir, 'table.npz')
+        writer = vector.TableWriter(fileName, None, [])
+        writer.addRecord(['a', 'b'])
+        writer.addRecords([[1, 'x'], [2.5, 'y']])
+        writer.close()
+        with numpy.load(fileName) as data:
+            self.assertEqual(data['a'].tolist(), [1.0, 2.5])
+            self.assertEqual(data['b'].tolist(), ['x', 'y'])
+
+        # field names clashing with numpy.savez arguments or with path
+        # separators
+        fileName = os.path.join(outdir, 'names.npz')
+        with vector.TableWriter(fileName, None, ['file', 'a/b', 'a_b']) as writer:
+            writer.addRecord([1, 'x', 2])
+        with numpy.load(fileName) as data:
+            self.assertEqual(sorted(data.files), ['a_b', 'a_b_', 'file'])
+            self.assertEqual(data['file'].tolist(), [1.0])
+            self.assertEqual(data['a_b'].tolist(), ['x'])
+
+    def testPartitionedFeatureSink(self):
+        outdir = tempfile.mkdtemp()
+        self.cleanup_paths.append(outdir)
+        context = QgsProcessingContext()
+        layer = QgsVectorLayer(os.path.join(testDataPath, 'points.gml'), 'points', 'ogr')
+
+        def destination(key):
+            return os.path.join(outdir, 'part_{}.shp'.format(key))
+
+        # more partitions than open outputs, so they are closed and
+        # reopened while features are added
+        sink = vector.PartitionedFeatureSink(destination, layer.fields(), layer.wkbType(),
+                                             layer.crs(), context, maxOpenSinks=2)
+        expected = {}
+        for i, f in enumerate(layer.getFeatures()):
+            key = i % 5
+            sink.addFeature(key, f)
+            expected[key] = expected.get(key, 0) + 1
+        self.assertLessEqual(len(sink.sinks), 2)
+        destinations = sink.close()
+        self.assertEqual(sink.sinks, {})
+
+        self.assertEqual(sorted(destinations.keys()), sorted(expected.keys()))
+        for key, count in expected.items():
+            output = QgsVectorLayer(destinations[key], 'part', 'ogr')
+            self.assertTrue(output.isValid())
+            self.assertEqual(output.featureCount(), count)
+
+    def testExportCache(self):
+        ProcessingConfig.initialize()
+        settings = [ProcessingConfig.USE_SELECTED,
+                    ProcessingConfig.USE_EXPORT_CACHE,
+                    ProcessingConfig.EXPORT_CACHE_SIZE]
+        values = [ProcessingConfig.getSetting(name) for name in settings]
+        ProcessingConfig.setSettingValue(ProcessingConfig.USE_EXPORT_CACHE, True)
+        layer = QgsVectorLayer(os.path.join(testDataPath, 'points.gml'), 'points', 'ogr')
+        pins = ExportCache.pinCount()
+        try:
+            exported = dataobjects.exportVectorLayer(layer)
+            self.assertTrue(exported.endswith('.shp'))
+            self.assertEqual(QgsVectorLayer(exported, 'exported', 'ogr').featureCount(), layer.featureCount())
+            # unchanged layers are exported only once
+            self.assertEqual(dataobjects.exportVectorLayer(layer), exported)
+
+            # entries in use are never evicted
+            ProcessingConfig.setSettingValue(ProcessingConfig.EXPORT_CACHE_SIZE, 0)
+            ExportCache.evict(None)
+            self.assertTrue(os.path.isfile(exported))
+            ExportCache.unpin(pins)
+            ExportCache.evict(None)
+            self.assertFalse(os.path.isfile(exported))
+            ProcessingConfig.setSettingValue(ProcessingConfig.EXPORT_CACHE_SIZE, values[2])
+            exported = dataobjects.exportVectorLayer(layer)
+
+            # GeoPackage is preferred when supported
+            self.assertTrue(dataobjects.exportVectorLayer(layer, ['shp', 'gpkg']).endswith('.gpkg'))
+
+            # supported layers are not exported
+            self.assertEqual(dataobjects.exportVectorLayer(QgsVectorLayer(exported, 'exported', 'ogr')), exported)
+
+            # the selected features are exported when used
+            ProcessingConfig.setSettingValue(ProcessingConfig.USE_SELECTED, True)
+            layer.selectByIds([min(f.id() for f in layer.getFeatures())])
+            selected = dataobjects.exportVectorLayer(layer)
+            self.assertNotEqual(selected, exported)
+            self.assertEqual(QgsVectorLayer(selected, 'selected', 'ogr').featureCount(), 1)
+        finally:
+            ExportCache.unpin(pins)
+            layer.removeSelection()
+            for name, value in zip(settings, values):
+                ProcessingConfig.setSettingValue(name, value)
+
+
+class RasterTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cleanup_paths = []
+
+    @classmethod
+    def tearDownClass(cls):
+        for path in cls.cleanup_paths:
+            shutil.rmtree(path)
+
+    def testRasterWriter(self):
+        outdir = tempfile.mkdtemp()
+        self.cleanup_paths.append(outdir)
+        crs = QgsCoordinateReferenceSystem('EPSG:4326')
+
+        for streaming in (False, True):
+            fileName = os.path.join(outdir, 'out_{}.tif'.format(streaming))
+            w = raster.RasterWriter(fileName, 0, 0, 20, 10, 1, 2, crs,
+                                    dataType=gdal.GDT_Int16, streaming=streaming)
+            w.fill(3)
+            w.writeArray([[1, 2], [4, 5]], 18, 8, band=1)
+            w.setValue(7, 0, 0)
+            self.assertEqual(w.getValue(0, 0), 7)
+            w.close()
+
+            ds = gdal.Open(fileName)
+            self.assertEqual((ds.RasterXSize, ds.RasterYSize, ds.RasterCount), (20, 10, 2))
+            self.assertEqual(ds.GetRasterBand(1).DataType, gdal.GDT_Int16)
+            self.assertEqual(ds.GetGeoTransform(), (0, 1, 0, 10, 0, -1))
+            first = ds.GetRasterBand(1).ReadAsArray()
+            second = ds.GetRasterBand(2).ReadAsArray()
+            self.assertEqual(first[0, 0], 7)
+            self.assertEqual(first[9, 19], 3)
+            self.assertEqual(second[8:, 18:].tolist(), [[1, 2], [4, 5]])
+            self.assertEqual(second[0, 0], 3)
+            ds = None
+
+    def testScanRasterBlocks(self):
+        path = os.path.join(testDataPath, 'dem.tif')
+
+        cells = 0
+        valid = 0
+        nextRow = 0
+        for xOff, yOff, block in raster.scanRasterBlocks(path, blockRows=7):
+            self.assertEqual(xOff, 0)
+            self.assertEqual(yOff, nextRow)
+            nextRow += block.shape[0]
+            cells += block.size
+            valid += block.count()
+
+        values = list(raster.scanraster(path, None))
+        self.assertEqual(cells, len(values))
+        self.assertEqual(valid, len([v for v in values if v is not None]))
+
+        # restricted to a window
+        blocks = list(raster.scanRasterBlocks(path, window=(3, 5, 10, 20), blockRows=8))
+        self.assertEqual([(b[0], b[1]) for b in blocks], [(3, 5), (3, 13), (3, 21)])
+        self.assertEqual([b[2].shape for b in blocks], [(8, 10), (8, 10), (4, 10)])
+
+    def testBandRange(self):
+        path = os.path.join(testDataPath, 'dem.tif')
+        blocks = [b for x, y, b in raster.scanRasterBlocks(path) if b.count()]
+        self.assertEqual(raster.bandRange(path), (min(float(b.min()) for b in blocks),
+                                                  max(float(b.max()) for b in blocks)))
+
+        # no valid cells
+        outdir = tempfile.mkdtemp()
+        self.cleanup_paths.append(outdir)
+        path = os.path.join(outdir, 'nodata.tif')
+        ds = gdal.GetDriverByName('GTiff').Create(path, 4, 4, 1, gdal.GDT_Float32)
+        ds.GetRasterBand(1).SetNoDataValue(-1)
+        ds.GetRasterBand(1).Fill(-1)
+        ds = None
+        self.assertIsNone(raster.bandRange(path))
+
+    def testZoneValueCounts(self):
+        zones = numpy.array([0, 1, 0, 0, 2, 1, 0, 2] * 50)
+        values = numpy.array([1.0, 5.0, 2.0, 1.0, 3.0, 5.0, 4.0, 3.5] * 50)
+        expected = [(0, [1.0, 2.0, 4.0], [100, 50, 50]),
+                    (1, [5.0], [100]),
+                    (2, [3.0, 3.5], [50, 50])]
+
+        # in memory, and spilled to disk with a tiny memory budget
+        for maxSize in (1024 * 1024, 64):
+            counts = raster.ZoneValueCounts(3, maxSize)
+            try:
+                for i in range(0, zones.size, 40):
+                    counts.add(zones[i:i + 40], values[i:i + 40])
+                found = []
+                for z, v, c in counts.groups():
+                    for zone in numpy.unique(z):
+                        found.append((zone, v[z == zone].tolist(), c[z == zone].tolist()))
+                self.assertEqual(sorted(found), expected)
+            finally:
+                counts.close()
+
+
+class ParallelTest(unittest.TestCase):
+
+    def testGeometryBuckets(self):
+        squares = [QgsGeometry.fromWkt('Polygon(({0} 0, {1} 0, {1} 1, {0} 1, {0} 0))'.format(i, i + 1))
+                   for i in range(6)]
+        # a tiny budget spills the buckets to disk
+        buckets = parallel.GeometryBuckets(200)
+        for i, square in enumerate(squares):
+            buckets.add(i % 2, square)
+        buckets.add(2, None)
+        self.assertEqual(buckets.keys(), [0, 1, 2])
+        self.assertTrue(buckets.files)
+        self.assertLessEqual(buckets.size, 200)
+
+        results = list(parallel.unionBuckets(buckets, [1, 0, 2], QgsProcessingFeedback()))
+        buckets.close()
+        self.assertEqual([r[0] for r in results], [1, 0, 2])
+        self.assertAlmostEqual(results[0][1].area(), 3)
+        self.assertEqual(results[0][1].geometry().numGeometries(), 3)
+        self.assertIsNone(results[2][1])
+
+        merged = parallel.reduceGeometries(squares, QgsProcessingFeedback())
+        self.assertAlmostEqual(merged.area(), 6)
+        self.assertEqual(merged.boundingBox().toString(0), '0,0 : 6,1')
+
+    def testMapFeatures(self):
+        class Collector(object):
+
+            def __init__(self):
+                self.features = []
+
+            def addFeature(self, feature):
+                self.features.append((feature.geometry().exportToWkt(), feature.attributes()))
+
+        context = QgsProcessingContext()
+        layer = QgsVectorLayer(os.path.join(testDataPath, 'polys.gml'), 'polys', 'ogr')
+
+        ProcessingConfig.initialize()
+        chunkSize = parallel.CHUNK_SIZE
+        try:
+            results = []
+            for workers in (1, 2):
+                ProcessingConfig.setSettingValue(ProcessingConfig.PARALLEL_WORKERS, workers)
+                # several chunks per worker
+                parallel.CHUNK_SIZE = 2
+                writer = Collector()
+                parallel.mapFeatures(layer, context, QgsProcessingFeedback(), writer, centroid)
+                results.append(writer.features)
+        finally:
+            parallel.CHUNK_SIZE = chunkSize
+            ProcessingConfig.setSettingValue(ProcessingConfig.PARALLEL_WORKERS, 1)
+
+        self.assertEqual(len(results[0]), layer.featureCount())
+        self.assertEqual(results[1], results[0])
+
+
+class TriangulationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cleanup_paths = []
+
+    @classmethod
+    def tearDownClass(cls):
+        for path in cls.cleanup_paths:
+            shutil.rmtree(path)
+
+    def run_backends(self, alg, params):
+        """Runs an algorithm with the Fortune sweep and GEOS backends, and
+        returns the output features of both as lists of (attributes, area).
+        """
+        outdir = tempfile.mkdtemp()
+        self.cleanup_paths.append(outdir)
+        context = QgsProcessingContext()
+        context.setProject(QgsProject.instance())
+
+        ProcessingConfig.initialize()
+        results = []
+        try:
+            for useGeos in (False, True):
+                ProcessingConfig.setSettingValue(ProcessingConfig.USE_GEOS_TRIANGULATION, useGeos)
+                instance = alg()
+                for name, value in params.items():
+                    instance.setParameterValue(name, value)
+                output = os.path.join(outdir, 'out_{}.shp'.format(int(useGeos)))
+                instance.setOutputValue('OUTPUT', output)
+                instance.execute(context)
+                layer = QgsVectorLayer(output, 'out', 'ogr')
+                results.append([(f.attributes(), f.geometry().area()) for f in layer.getFeatures()])
+        finally:
+            ProcessingConfig.setSettingValue(ProcessingConfig.USE_GEOS_TRIANGULATION, False)
+        return results
+
+    def testDelaunay(self):
+        fortune, geos = self.run_backends(Delaunay, {'INPUT': os.path.join(testDataPath, 'multipoints.gml')})
+        # any triangulation of a point set has the same number of
+        # triangles and covers its convex hull
+        self.assertEqual(len(geos), len(fortune))
+        self.assertAlmostEqual(sum(a for _, a in geos), sum(a for _, a in fortune), 6)
+
+    def testVoronoi(self):
+        for buf in (0.0, 10.0):
+            fortune, geos = self.run_backends(VoronoiPolygons, {'INPUT': os.path.join(testDataPath, 'points.gml'),
+                                                                'BUFFER': buf})
+            self.assertEqual(sorted((attrs for attrs, _ in geos), key=str),
+                             sorted((attrs for attrs, _ in fortune), key=str))
+
+
+class Grass7PoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = tempfile.mkdtemp()
+        self.maxSize = 1024 * 1024
+        # keep the pool out of the user folder
+        self.poolFolder = Grass7Pool.poolFolder
+        self.poolMaxSize = Grass7Pool.maxSize
+        Grass7Pool.poolFolder = staticmethod(lambda: self.pool)
+        Grass7Pool.maxSize = staticmethod(lambda: self.maxSize)
+
+    def tearDown(self):
+        Grass7Pool.poolFolder = self.poolFolder
+        Grass7Pool.maxSize = self.poolMaxSize
+        shutil.rmtree(self.pool, True)
+
+    def location(self, name, maps):
+        """Creates a fake location with a 100 bytes vector map for each
+        (name, lastUsed) tuple in maps, and returns its folder.
+        """
+        folder = os.path.join(self.pool, name)
+        manifest = {}
+        for mapName, lastUsed in maps:
+            os.makedirs(os.path.join(folder, 'PERMANENT', 'vector', mapName))
+            with open(os.path.join(folder, 'PERMANENT', 'vector', mapName, 'coor'), 'wb') as f:
+                f.write(b'x' * 100)
+            manifest['key_' + mapName] = {'name': mapName, 'type': 'vector', 'lastUsed': lastUsed}
+        os.makedirs(os.path.join(folder, 'PERMANENT'), exist_ok=True)
+        Grass7Pool.writeManifest(folder, manifest)
+        return folder
+
+    def testLock(self):
+        folder = os.path.join(self.pool, 'location_0')
+        self.assertTrue(Grass7Pool.lock(folder))
+        self.assertFalse(Grass7Pool.lock(folder))
+        self.assertFalse(Grass7Pool.isStale(folder + '.lock'))
+        Grass7Pool.unlock(folder)
+        self.assertTrue(Grass7Pool.lock(folder))
+        Grass7Pool.unlock(folder)
+
+        # locks left behind by a finished process are stale
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        with open(folder + '.lock', 'w') as f:
+            f.write(str(process.pid))
+        os.utime(folder + '.lock', (0, 0))
+        self.assertTrue(Grass7Pool.isStale(folder + '.lock'))
+        self.assertTrue(Grass7Pool.lock(folder))
+        Grass7Pool.unlock(folder)
+
+        # locks being created are not
+        open(folder + '.lock', 'w').close()
+        self.assertFalse(Grass7Pool.isStale(folder + '.lock'))
+        self.assertFalse(Grass7Pool.lock(folder))
+        Grass7Pool.unlock(folder)
+
+    def testRelease(self):
+        folder = self.location('location_0', [('kept', 1)])
+        for element, name in [('vector', 'imported'), ('vector', 'output'), ('cell', 'raster')]:
+            os.makedirs(os.path.join(folder, 'PERMANENT', element), exist_ok=True)
+            path = os.path.join(folder, 'PERMANENT', element, name)
+            if element == 'vector':
+                os.mkdir(path)
+            else:
+                open(path, 'w').close()
+
+        session = Grass7Session(folder)
+        session.manifest = Grass7Pool.readManifest(folder)
+        Grass7Pool.addImport(session, 'key_imported', 'imported', 'vector')
+        Grass7Pool.addImport(session, 'key_missing', 'missing', 'raster')
+        Grass7Pool.release(session)
+        session.close()
+
+        # imported layers are kept, any other map is removed
+        manifest = Grass7Pool.readManifest(folder)
+        self.assertEqual(sorted(manifest.keys()), ['key_imported', 'key_kept'])
+        self.assertEqual(sorted(os.listdir(os.path.join(folder, 'PERMANENT', 'vector'))), ['imported', 'kept'])
+        self.assertEqual(os.listdir(os.path.join(folder, 'PERMANENT', 'cell')), [])
+
+        session = Grass7Session(folder)
+        session.manifest = manifest
+        self.assertEqual(Grass7Pool.cachedImport(session, 'key_imported'), 'imported')
+        self.assertIsNone(Grass7Pool.cachedImport(session, 'key_missing'))
+        session.close()
+
+    def testEvict(self):
+        current = self.location('location_0', [('a', 1)])
+        other = self.location('location_1', [('b', 2)])
+        # locations used by other executions are left untouched
+        busy = self.location('location_2', [('c', 0)])
+        self.assertTrue(Grass7Pool.lock(busy))
+
+        try:
+            self.maxSize = 150
+            Grass7Pool.evict(current)
+            self.assertEqual(Grass7Pool.readManifest(current), {})
+            self.assertFalse(os.path.exists(os.path.join(current, 'PERMANENT', 'vector', 'a')))
+            self.assertEqual(list(Grass7Pool.readManifest(other).keys()), ['key_b'])
+
+            # empty locations are removed, except the current one
+            self.maxSize = 0
+            Grass7Pool.evict(current)
+            self.assertTrue(os.path.isdir(current))
+            self.assertFalse(os.path.exists(other))
+            self.assertFalse(os.path.exists(other + '.lock'))
+            self.assertEqual(list(Grass7Pool.readManifest(busy).keys()), ['key_c'])
+        finally:
+            Grass7Pool.unlock(busy)
+
+
+class ProcessingLogTest(unittest.TestCase):
+
+    SETTINGS = [ProcessingConfig.HISTORY_MAX_ENTRIES,
+                ProcessingConfig.HISTORY_MAX_AGE,
+                ProcessingConfig.RECENT_ALGORITHMS]
+
+    def setUp(self):
+        ProcessingConfig.initialize()
+        self.values = [ProcessingConfig.getSetting(name) for name in self.SETTINGS]
+        ProcessingConfig.setSettingValue(ProcessingConfig.HISTORY_MAX_ENTRIES, 0)
+        ProcessingConfig.setSettingValue(ProcessingConfig.HISTORY_MAX_AGE, 0)
+
+        # keep the history out of the user folder
+        self.folder = tempfile.mkdtemp()
+        self.logFilename = ProcessingLog.logFilename
+        self.legacyLogFilename = ProcessingLog.legacyLogFilename
+        self.connection = ProcessingLog._connection
+        ProcessingLog.logFilename = staticmethod(lambda: os.path.join(self.folder, 'history.db'))
+        ProcessingLog.legacyLogFilename = staticmethod(lambda: os.path.join(self.folder, 'processing.log'))
+        ProcessingLog._connection = None
+
+    def tearDown(self):
+        if ProcessingLog._connection is not None:
+            ProcessingLog._connection.close()
+        ProcessingLog._connection = self.connection
+        ProcessingLog.logFilename = self.logFilename
+        ProcessingLog.legacyLogFilename = self.legacyLogFilename
+        for name, value in zip(self.SETTINGS, self.values):
+            ProcessingConfig.setSettingValue(name, value)
+        shutil.rmtree(self.folder, True)
+
+    def reconnect(self):
+        ProcessingLog._connection.close()
+        ProcessingLog._connection = None
+
+    def testLegacyImport(self):
+        with codecs.open(ProcessingLog.legacyLogFilename(), 'w', encoding='utf-8') as f:
+            f.write('ALGORITHM|2017-01-01 10:00:00|processing.run("qgis:buffer", "a|b")\n')
+            f.write('INFO|2017-01-01 10:00:01|not an algorithm\n')
+            f.write('ALGORITHM|2017-01-02 10:00:00|processing.run("gdal:translate")\n')
+
+        entries = ProcessingLog.getLogEntries()
+        self.assertEqual([(e.date, e.algorithm, e.text) for e in entries],
+                         [('2017-01-02 10:00:00', 'gdal:translate', 'processing.run("gdal:translate")'),
+                          ('2017-01-01 10:00:00', 'qgis:buffer', 'processing.run("qgis:buffer", "a|b")')])
+        self.assertFalse(os.path.exists(ProcessingLog.legacyLogFilename()))
+        self.assertTrue(os.path.exists(ProcessingLog.legacyLogFilename() + '.old'))
+
+        # the log is imported only once
+        self.reconnect()
+        self.assertEqual(ProcessingLog.countLogEntries(), 2)
+
+    def testPagingAndFiltering(self):
+        for i in range(5):
+            ProcessingLog.addToLog('processing.run("qgis:buffer", {})'.format(i))
+        ids = [ProcessingLog.addToLog('processing.run("gdal:translate", {})'.format(i)) for i in range(3)]
+        ProcessingLog.finishLogEntry(ids[0], None, None, 1.5, False)
+
+        self.assertEqual(ProcessingLog.countLogEntries(), 8)
+        entries = ProcessingLog.getLogEntries(limit=3, offset=2)
+        self.assertEqual([e.text for e in entries],
+                         ['processing.run("gdal:translate", 0)',
+                          'processing.run("qgis:buffer", 4)',
+                          'processing.run("qgis:buffer", 3)'])
+        self.assertEqual((entries[0].duration, entries[0].status), (1.5, ProcessingLog.STATUS_FAILED))
+
+        self.assertEqual(ProcessingLog.countLogEntries(algorithm='buffer'), 5)
+        self.assertEqual([e.algorithm for e in ProcessingLog.getLogEntries(algorithm='gdal')],
+                         ['gdal:translate'] * 3)
+        tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.assertEqual(ProcessingLog.countLogEntries(dateFrom=tomorrow), 0)
+        self.assertEqual(ProcessingLog.countLogEntries(algorithm='buffer', dateTo=tomorrow), 5)
+
+    def testRotation(self):
+        ProcessingLog.connection().execute('INSERT INTO history (date, command) VALUES (?, ?)',
+                                           ('2000-01-01 00:00:00', 'processing.run("qgis:old")'))
+        ProcessingConfig.setSettingValue(ProcessingConfig.HISTORY_MAX_AGE, 30)
+        ProcessingLog.addToLog('processing.run("qgis:buffer", 0)')
+        self.assertEqual([e.algorithm for e in ProcessingLog.getLogEntries()], ['qgis:buffer'])
+
+        ProcessingConfig.setSettingValue(ProcessingConfig.HISTORY_MAX_ENTRIES, 3)
+        for i in range(1, 5):
+            ProcessingLog.addToLog('processing.run("qgis:buffer", {})'.format(i))
+        self.assertEqual([e.text for e in ProcessingLog.getLogEntries()],
+                         ['processing.run("qgis:buffer", {})'.format(i) for i in (4, 3, 2)])
+
+
+class CachedAlgorithm(GeoAlgorithm):
+
+    def name(self):
+        return 'cachedalgorithm'
+
+    def displayName(self):
+        return 'Cached algorithm'
+
+    def defineCharacteristics(self):
+        self.addParameter(ParameterRaster('INPUT', 'Input'))
+        self.addParameter(ParameterNumber('VALUE', 'Value', default=1))
+        self.addOutput(OutputRaster('OUTPUT', 'Output'))
+        self.addOutput(OutputNumber('COUNT', 'Count'))
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cleanup_paths = []
+
+    @classmethod
+    def tearDownClass(cls):
+        for path in cls.cleanup_paths:
+            shutil.rmtree(path)
+
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+        self.cleanup_paths.append(self.outdir)
+        shutil.copy(os.path.join(testDataPath, 'dem.tif'), self.outdir)
+        os.mkdir(os.path.join(self.outdir, 'cache'))
+        ProcessingConfig.initialize()
+        ProcessingConfig.setSettingValue(ProcessingConfig.RESULT_CACHE_FOLDER,
+                                         os.path.join(self.outdir, 'cache'))
+        ProcessingConfig.setSettingValue(ProcessingConfig.RESULT_CACHE_SIZE, 1)
+
+    def tearDown(self):
+        ProcessingConfig.setSettingValue(ProcessingConfig.RESULT_CACHE_FOLDER, '')
+        ProcessingConfig.setSettingValue(ProcessingConfig.RESULT_CACHE_SIZE,
+                                         ProcessingConfig.settings[ProcessingConfig.RESULT_CACHE_SIZE].default)
+
+    def algorithm(self, value=1, output='out.tif'):
+        alg = CachedAlgorithm()
+        alg.getParameterFromName('INPUT').value = os.path.join(self.outdir, 'dem.tif')
+        alg.getParameterFromName('VALUE').value = value
+        alg.getOutputFromName('OUTPUT').value = os.path.join(self.outdir, output)
+        return alg
+
+    def execute(self, alg, content=b'result'):
+        with open(alg.getOutputFromName('OUTPUT').value, 'wb') as f:
+            f.write(content)
+        alg.getOutputFromName('COUNT').value = 42
+        key = ResultCache.key(alg)
+        ResultCache.store(alg, key)
+        return key
+
+    def testKey(self):
+        key = ResultCache.key(self.algorithm())
+        self.assertIsNotNone(key)
+        self.assertEqual(ResultCache.key(self.algorithm(output='other.tif')), key)
+        self.assertNotEqual(ResultCache.key(self.algorithm(value=2)), key)
+        self.assertIsNone(ResultCache.key(self.algorithm(output='out.vrt')))
+
+        alg = self.algorithm()
+        alg.useResultCache = False
+        self.assertIsNone(ResultCache.key(alg))
+
+        # a modified input gives a different key
+        os.utime(os.path.join(self.outdir, 'dem.tif'), (0, 0))
+        self.assertNotEqual(ResultCache.key(self.algorithm()), key)
+
+    def testStoreRestore(self):
+        key = self.execute(self.algorithm())
+        self.assertFalse(ResultCache.restore(self.algorithm(), 'missing', QgsProcessingFeedback()))
+
+        alg = self.algorithm(output='restored.tif')
+        self.assertTrue(ResultCache.restore(alg, key, QgsProcessingFeedback()))
+        self.assertEqual(alg.getOutputFromName('COUNT').value, 42)
+        with open(os.path.join(self.outdir, 'restored.tif'), 'rb') as f:
+            self.assertEqual(f.read(), b'result')
+
+    def testRestoreBrokenEntry(self):
+        key = self.execute(self.algorithm())
+        entry = os.path.join(ResultCache.cacheFolder(), key)
+
+        # a missing file drops the entry, without leaving partial outputs
+        os.remove(os.path.join(entry, 'OUTPUT.tif'))
+        self.assertFalse(ResultCache.restore(self.algorithm(output='restored.tif'), key, QgsProcessingFeedback()))
+        self.assertFalse(os.path.exists(entry))
+        self.assertFalse(os.path.exists(os.path.join(self.outdir, 'restored.tif')))
+
+        # so does a corrupted manifest
+        key = self.execute(self.algorithm())
+        with open(os.path.join(entry, ResultCache.MANIFEST), 'w') as f:
+            f.write('{')
+        self.assertFalse(ResultCache.restore(self.algorithm(output='restored.tif'), key, QgsProcessingFeedback()))
+
+    def testEvict(self):
+        # the 1 MB cache has room for a single entry
+        first = self.execute(self.algorithm(), b'x' * 600 * 1024)
+        os.utime(os.path.join(ResultCache.cacheFolder(), first, ResultCache.MANIFEST), (0, 0))
+        second = self.execute(self.algorithm(value=2), b'y' * 600 * 1024)
+
+        self.assertFalse(os.path.exists(os.path.join(ResultCache.cacheFolder(), first)))
+        self.assertTrue(ResultCache.restore(self.algorithm(value=2), second, QgsProcessingFeedback()))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -16,14 +16,14 @@
       <ogr:geometryProperty><gml:Polygon srsName="EPSG:4326"><gml:outerBoundaryIs><gml:LinearRing><gml:coordinates>18.6744202640594,45.7984964727494 18.6832040953424,45.8078615869849 18.6896627948151,45.8045676502538 18.6948297543933,45.8001757346123 18.694442232425,45.7962359279339 18.6838499652896,45.7903585114137 18.6759703519329,45.7902293374243 18.6731931111596,45.7899709894453 18.6744202640594,45.7984964727494</gml:coordinates></gml:LinearRing></gml:outerBoundaryIs></gml:Polygon></ogr:geometryProperty>
       <ogr:_min>85.000000</ogr:_min>
       <ogr:_max>230.000000</ogr:_max>
-      <ogr:_sum>3498496.250000</ogr:_sum>
+      <ogr:_sum>3498496.427818</ogr:_sum>
       <ogr:_count>24890.000000</ogr:_count>
-      <ogr:_mean>140.558307</ogr:_mean>
+      <ogr:_mean>140.558314</ogr:_mean>
       <ogr:_std>39.336077</ogr:_std>
       <ogr:_unique>23959.000000</ogr:_unique>
       <ogr:_range>145.000000</ogr:_range>
-      <ogr:_var>1547.326959</ogr:_var>
-      <ogr:_median>141.308746</ogr:_median>
+      <ogr:_var>1547.326934</ogr:_var>
+      <ogr:_median>141.308739</ogr:_median>
     </ogr:zonal_statistics>
   </gml:featureMember>
   <gml:featureMember>
@@ -31,13 +31,13 @@
       <ogr:geometryProperty><gml:Polygon srsName="EPSG:4326"><gml:outerBoundaryIs><gml:LinearRing><gml:coordinates>18.6906961867308,45.7866124657195 18.694442232425,45.7911335553504 18.7009009318977,45.7856436607986 18.6997383659926,45.7811225711677 18.6884356419153,45.777957808426 18.6804914415638,45.7798954182678 18.6800393326007,45.7833185289884 18.6906961867308,45.7866124657195</gml:coordinates></gml:LinearRing></gml:outerBoundaryIs></gml:Polygon></ogr:geometryProperty>
       <ogr:_min>121.586990</ogr:_min>
       <ogr:_max>209.600006</ogr:_max>
-      <ogr:_sum>2569446.750000</ogr:_sum>
+      <ogr:_sum>2569446.541069</ogr:_sum>
       <ogr:_count>14940.000000</ogr:_count>
-      <ogr:_mean>171.984388</ogr:_mean>
-      <ogr:_std>21.902397</ogr:_std>
+      <ogr:_mean>171.984374</ogr:_mean>
+      <ogr:_std>21.902396</ogr:_std>
       <ogr:_unique>14404.000000</ogr:_unique>
       <ogr:_range>88.013016</ogr:_range>
-      <ogr:_var>479.714993</ogr:_var>
+      <ogr:_var>479.714968</ogr:_var>
       <ogr:_median>179.076462</ogr:_median>
     </ogr:zonal_statistics>
   </gml:featureMember>
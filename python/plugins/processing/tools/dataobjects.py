@@ -29,6 +29,7 @@ __revision__ = '$Format:%H$'
 
 import os
 import re
+from collections import OrderedDict
 
 from qgis.core import (QgsVectorFileWriter,
                        QgsMapLayer,
@@ -45,6 +46,7 @@ from qgis.gui import QgsSublayersDialog
 from qgis.PyQt.QtCore import QCoreApplication
 
 from processing.core.ProcessingConfig import ProcessingConfig
+from processing.core.ExportCache import ExportCache
 from processing.algs.gdal.GdalUtils import GdalUtils
 from processing.tools.system import (getTempFilenameInTempFolder,
                                      getTempFilename,
@@ -62,6 +64,12 @@ TYPE_RASTER = 3
 TYPE_FILE = 4
 TYPE_TABLE = 5
 
+# formats vector layers are exported to for external apps, by order of
+# preference, and their OGR drivers
+EXPORT_FORMATS = OrderedDict([('gpkg', 'GPKG'),
+                              ('fgb', 'FlatGeobuf'),
+                              ('shp', 'ESRI Shapefile')])
+
 
 def createContext():
     """
@@ -160,46 +168,55 @@ def exportVectorLayer(layer, supported=None):
     selection and it should be used, exporting just the selected
     features.
 
-    Currently, the output is restricted to shapefiles, so anything
-    that is not in a shapefile will get exported. It also export to
-    a new file if the original one contains non-ascii characters.
+    supported is the list of file extensions the external app can read,
+    shapefiles by default. Layers are exported to GeoPackage or
+    FlatGeobuf if supported, and to shapefiles otherwise. Exports of
+    file-based layers are kept in the export cache, so they are not
+    repeated while the layer does not change.
     """
 
-    supported = supported or ["shp"]
+    supported = [e.lower() for e in supported or ["shp"]]
     settings = QgsSettings()
     systemEncoding = settings.value('/UI/encoding', 'System')
 
-    output = getTempFilename('shp')
+    useSelection = ProcessingConfig.getSetting(ProcessingConfig.USE_SELECTED) \
+        and layer.selectedFeatureCount() != 0
+    if not useSelection and \
+            os.path.splitext(layer.source())[1].lower().lstrip('.') in supported:
+        return layer.source()
+
+    extension = 'shp'
+    for preferred in EXPORT_FORMATS:
+        if preferred in supported:
+            extension = preferred
+            break
+
+    key = ExportCache.key(layer, extension, systemEncoding, useSelection)
+    if key is not None:
+        cached = ExportCache.get(key)
+        if cached is not None:
+            return cached
+
     basename = removeInvalidChars(os.path.basename(layer.source()))
     if basename:
-        if not basename.endswith("shp"):
-            basename = os.path.splitext(basename)[0] + ".shp"
+        basename = os.path.splitext(basename)[0] + '.' + extension
         output = getTempFilenameInTempFolder(basename)
     else:
-        output = getTempFilename("shp")
-    useSelection = ProcessingConfig.getSetting(ProcessingConfig.USE_SELECTED)
-    if useSelection and layer.selectedFeatureCount() != 0:
-        writer = QgsVectorFileWriter(output, systemEncoding,
-                                     layer.fields(),
-                                     layer.wkbType(), layer.crs())
-        selection = layer.selectedFeatures()
-        for feat in selection:
-            writer.addFeature(feat)
-        del writer
-        return output
+        output = getTempFilename(extension)
+    writer = QgsVectorFileWriter(output, systemEncoding,
+                                 layer.fields(), layer.wkbType(),
+                                 layer.crs(), EXPORT_FORMATS[extension])
+    if useSelection:
+        features = layer.selectedFeatures()
     else:
-        if not os.path.splitext(layer.source())[1].lower() in supported:
-            writer = QgsVectorFileWriter(
-                output, systemEncoding,
-                layer.fields(), layer.wkbType(),
-                layer.crs()
-            )
-            for feat in layer.getFeatures():
-                writer.addFeature(feat)
-            del writer
-            return output
-        else:
-            return layer.source()
+        features = layer.getFeatures()
+    for feat in features:
+        writer.addFeature(feat)
+    del writer
+
+    if key is not None:
+        output = ExportCache.store(key, output)
+    return output
 
 
 def exportRasterLayer(layer):
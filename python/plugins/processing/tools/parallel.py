@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    parallel.py
+    ---------------------
+    Date                 : June 2017
+    Copyright            : (C) 2017 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'June 2017'
+__copyright__ = '(C) 2017, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import sys
+import shutil
+import struct
+import traceback
+import multiprocessing
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant, QByteArray
+from qgis.core import (QgsFeature,
+                       QgsGeometry,
+                       QgsMessageLog,
+                       QgsProcessingUtils)
+
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
+from processing.tools.system import getTempDirInTempFolder, isWindows
+
+CHUNK_SIZE = 1000
+
+# number of geometries unioned at once by unaryUnion
+UNION_CHUNK_SIZE = 10000
+# number of results unioned at once in each round of a tree reduction
+REDUCTION_FAN_IN = 4
+
+# how to handle invalid geometries when unioning buckets
+LOG_INVALID = 1
+SKIP_INVALID = 2
+
+
+def workerCount():
+    """Returns the number of worker processes to use for feature-wise
+    algorithms, as set in the processing configuration. A value of 1
+    means algorithms run in the main process.
+    """
+    try:
+        workers = int(ProcessingConfig.getSetting(ProcessingConfig.PARALLEL_WORKERS))
+    except (TypeError, ValueError):
+        workers = 1
+    if workers <= 0:
+        workers = multiprocessing.cpu_count()
+    return workers
+
+
+def _pythonExecutable():
+    """Returns the Python interpreter to start worker processes with.
+    Inside QGIS, sys.executable is usually the application itself.
+    """
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    if isWindows():
+        folder = sys.exec_prefix
+        names = ['python3.exe', 'python.exe']
+    else:
+        folder = os.path.join(sys.exec_prefix, 'bin')
+        names = ['python{}.{}'.format(*sys.version_info[:2]), 'python3']
+    for name in names:
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            return path
+    return sys.executable
+
+
+def _mpContext():
+    """Returns the multiprocessing context for worker processes.
+
+    Workers are started as new interpreters (through a fork server where
+    available) instead of forking the main process, as forking the
+    multi-threaded QGIS process can leave locks held by other threads
+    locked forever in the child. Only serialized geometries, attributes
+    and module level functions are sent to the workers.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+    else:
+        context = multiprocessing.get_context('spawn')
+    context.set_executable(_pythonExecutable())
+    return context
+
+
+def _toGeometry(wkb):
+    if wkb is None:
+        return None
+    geometry = QgsGeometry()
+    geometry.fromWkb(QByteArray(wkb))
+    return geometry
+
+
+def _fromGeometry(geometry):
+    if geometry is None or geometry.isNull():
+        return None
+    return geometry.exportToWkb().data()
+
+
+def _runChunk(function, args, chunk):
+    """Runs function on a chunk of serialized features inside a worker
+    process. Errors are returned as text, as exceptions raised by the
+    algorithms can not always be pickled.
+    """
+    try:
+        results = []
+        for fid, wkb, attributes in chunk:
+            outputs = function(_toGeometry(wkb), attributes, *args)
+            results.append((fid, [(_fromGeometry(o[0]), ) + tuple(o[1:]) for o in outputs]))
+        return results, None
+    except GeoAlgorithmExecutionException as e:
+        return None, e.msg
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def mapFeatures(layer, context, feedback, writer, function, args=(), request=None):
+    """Applies a feature-wise function to every feature of a layer and
+    adds the resulting features to writer, in input order.
+
+    function must be a module level function taking a QgsGeometry (or
+    None), the list of attributes of a feature and args, and returning
+    a list of (geometry, attributes) tuples, one for each output
+    feature. It must not depend on other features, so consecutive chunks
+    of features can be handed to a pool of worker processes.
+    Progress is reported as chunks are completed.
+
+    An output tuple can have a third item, a message with a {} field
+    for the feature id, which is logged as a warning by the main process
+    (messages logged inside worker processes never reach the QGIS log).
+    """
+    if request is None:
+        features = QgsProcessingUtils.getFeatures(layer, context)
+    else:
+        features = QgsProcessingUtils.getFeatures(layer, context, request)
+    count = QgsProcessingUtils.featureCount(layer, context)
+    total = 100.0 / count if count else 0
+
+    fields = layer.fields()
+    workers = workerCount()
+
+    def write(fid, outputs):
+        for output in outputs:
+            geometry, attributes = output[:2]
+            if len(output) > 2 and output[2]:
+                QgsMessageLog.logMessage(output[2].format(fid),
+                                         QCoreApplication.translate('parallel', 'Processing'),
+                                         QgsMessageLog.WARNING)
+            outFeat = QgsFeature(fields)
+            if geometry is not None:
+                outFeat.setGeometry(geometry)
+            outFeat.setAttributes(attributes)
+            writer.addFeature(outFeat)
+
+    if workers == 1:
+        for current, f in enumerate(features):
+            if feedback.isCanceled():
+                break
+            geometry = f.geometry() if f.hasGeometry() else None
+            write(f.id(), function(geometry, f.attributes(), *args))
+            feedback.setProgress(int(current * total))
+        return
+
+    def chunks():
+        chunk = []
+        for f in features:
+            wkb = _fromGeometry(f.geometry()) if f.hasGeometry() else None
+            # NULL values can not be pickled
+            attributes = [None if isinstance(a, QVariant) else a for a in f.attributes()]
+            chunk.append((f.id(), wkb, attributes))
+            if len(chunk) == CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    done = 0
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_mpContext()) as pool:
+        for chunk in chunks():
+            pending.append((len(chunk), pool.submit(_runChunk, function, args, chunk)))
+            # keep a bounded number of chunks in flight and write
+            # results in input order
+            while len(pending) > workers * 2:
+                done += _collect(pending.popleft(), write)
+                feedback.setProgress(int(done * total))
+            if feedback.isCanceled():
+                for size, future in pending:
+                    future.cancel()
+                return
+
+        while pending:
+            done += _collect(pending.popleft(), write)
+            feedback.setProgress(int(done * total))
+
+
+def _collect(item, write):
+    size, future = item
+    results, error = future.result()
+    if error is not None:
+        raise GeoAlgorithmExecutionException(error)
+    for fid, outputs in results:
+        write(fid, [(_toGeometry(o[0]), ) + tuple(o[1:]) for o in outputs])
+    return size
+
+
+def _imap(function, argsList, workers):
+    """Yields function(*args) for every item in argsList, in order,
+    using a pool of worker processes if workers is greater than 1.
+    """
+    if workers == 1:
+        for args in argsList:
+            yield function(*args)
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_mpContext()) as pool:
+        for args in argsList:
+            pending.append(pool.submit(function, *args))
+            while len(pending) > workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class GeometryBuckets(object):
+
+    """Collects serialized geometries in buckets identified by a key,
+    keeping at most maxSize bytes of geometries in memory.
+
+    When the budget is exceeded, the largest buckets are appended to
+    temporary files until half of the budget is free. Buckets keep the
+    order in which their keys were first added.
+    """
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.size = 0
+        self.memory = OrderedDict()
+        self.sizes = {}
+        self.files = {}
+        self.folder = None
+
+    def __len__(self):
+        return len(self.memory)
+
+    def keys(self):
+        return list(self.memory.keys())
+
+    def add(self, key, geometry):
+        """Adds a QgsGeometry to a bucket. If geometry is None, the
+        bucket is only created.
+        """
+        bucket = self.memory.get(key)
+        if bucket is None:
+            bucket = self.memory[key] = []
+            self.sizes[key] = 0
+        wkb = _fromGeometry(geometry)
+        if wkb is None:
+            return
+        bucket.append(wkb)
+        self.sizes[key] += len(wkb)
+        self.size += len(wkb)
+        if self.size > self.maxSize:
+            self.spill()
+
+    def spill(self):
+        if self.folder is None:
+            self.folder = getTempDirInTempFolder()
+        for key in sorted(self.sizes, key=self.sizes.get, reverse=True):
+            if self.size <= self.maxSize / 2 or not self.sizes[key]:
+                break
+            if key not in self.files:
+                self.files[key] = os.path.join(self.folder, '{}.wkb'.format(len(self.files)))
+            with open(self.files[key], 'ab') as f:
+                for wkb in self.memory[key]:
+                    f.write(struct.pack('<I', len(wkb)))
+                    f.write(wkb)
+            self.size -= self.sizes[key]
+            self.sizes[key] = 0
+            self.memory[key] = []
+
+    def bucket(self, key):
+        """Returns the path of the file the bucket was spilled to (or
+        None) and the list of geometries of the bucket kept in memory.
+        """
+        return self.files.get(key), self.memory[key]
+
+    def close(self):
+        if self.folder is not None:
+            shutil.rmtree(self.folder, True)
+            self.folder = None
+        self.memory.clear()
+        self.files.clear()
+        self.size = 0
+
+
+def _readSpilled(path):
+    wkbs = []
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                break
+            wkbs.append(f.read(struct.unpack('<I', header)[0]))
+    return wkbs
+
+
+def unionGeometries(geometries):
+    """Returns the union of a list of QgsGeometry, combining them in
+    chunks of UNION_CHUNK_SIZE geometries.
+    """
+    while len(geometries) > UNION_CHUNK_SIZE:
+        geometries = [QgsGeometry.unaryUnion(geometries[i:i + UNION_CHUNK_SIZE])
+                      for i in range(0, len(geometries), UNION_CHUNK_SIZE)]
+    return QgsGeometry.unaryUnion(geometries)
+
+
+def _unionBucket(path, wkbs, validate):
+    """Unions the geometries of a bucket inside a worker process and
+    returns the union, the validation errors found, and the error that
+    stopped the union, if any.
+    """
+    try:
+        if path is not None:
+            wkbs = _readSpilled(path) + wkbs
+        geometries = []
+        errors = []
+        for wkb in wkbs:
+            geometry = _toGeometry(wkb)
+            if validate:
+                found = geometry.validateGeometry()
+                if found:
+                    errors.extend(e.what() for e in found)
+                    if validate == SKIP_INVALID:
+                        continue
+            geometries.append(geometry)
+        if not geometries:
+            return None, errors, None
+        return _fromGeometry(unionGeometries(geometries)), errors, None
+    except Exception:
+        return None, [], traceback.format_exc()
+
+
+def unionBuckets(buckets, keys, feedback, validate=0):
+    """Unions the geometries of each bucket in keys, in parallel when
+    more than one worker process is configured, and yields (key,
+    QgsGeometry or None, validation errors) tuples in the order of keys.
+
+    If validate is LOG_INVALID or SKIP_INVALID, geometries are checked
+    with validateGeometry() in the workers, and the invalid ones are
+    left out of the union if validate is SKIP_INVALID.
+    """
+    argsList = (buckets.bucket(key) + (validate, ) for key in keys)
+    results = _imap(_unionBucket, argsList, workerCount())
+    for key, (wkb, errors, error) in zip(keys, results):
+        if error is not None:
+            raise GeoAlgorithmExecutionException(error)
+        yield key, _toGeometry(wkb), errors
+        if feedback.isCanceled():
+            return
+
+
+def reduceGeometries(geometries, feedback):
+    """Unions a list of QgsGeometry with a tree reduction: groups of
+    REDUCTION_FAN_IN consecutive geometries are unioned in parallel,
+    and the results are unioned again until one geometry is left.
+    Neighbouring geometries should be consecutive in the list.
+    """
+    wkbs = [w for w in (_fromGeometry(g) for g in geometries) if w is not None]
+    if not wkbs:
+        return QgsGeometry()
+    workers = workerCount()
+    while len(wkbs) > 1:
+        groups = [(None, wkbs[i:i + REDUCTION_FAN_IN], 0) for i in range(0, len(wkbs), REDUCTION_FAN_IN)]
+        wkbs = []
+        for wkb, errors, error in _imap(_unionBucket, groups, workers):
+            if error is not None:
+                raise GeoAlgorithmExecutionException(error)
+            if wkb is not None:
+                wkbs.append(wkb)
+            if feedback.isCanceled():
+                return QgsGeometry()
+        if not wkbs:
+            return QgsGeometry()
+    return _toGeometry(wkbs[0])
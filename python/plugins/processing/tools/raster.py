@@ -30,12 +30,15 @@ from builtins import range
 from builtins import object
 
 import os
-import struct
+import shutil
 
 import numpy
-from osgeo import gdal
+from osgeo import gdal, gdal_array, ogr
+
+from qgis.core import QgsFeature, QgsSpatialIndex
 
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
+from processing.tools.system import getTempDirInTempFolder
 
 
 RASTER_EXTENSION_MAP = None
@@ -71,35 +74,113 @@ def formatShortNameFromFileName(fileName):
     return 'GTiff'
 
 
-def scanraster(layer, feedback):
-    filename = str(layer.source())
-    dataset = gdal.Open(filename, gdal.GA_ReadOnly)
-    band = dataset.GetRasterBand(1)
+def readBlock(band, xOff, yOff, width, height):
+    """Reads a window of a GDAL raster band as a masked numpy array.
+
+    Scale and offset of the band are applied and cells which are no-data
+    or NaN are masked out.
+    """
+    data = band.ReadAsArray(xOff, yOff, width, height)
+    if data is None:
+        raise GeoAlgorithmExecutionException('Could not read raster block')
+    if numpy.iscomplexobj(data):
+        raise GeoAlgorithmExecutionException('Raster format not supported')
+
     nodata = band.GetNoDataValue()
-    bandtype = gdal.GetDataTypeName(band.DataType)
-    for y in range(band.YSize):
-        feedback.setProgress(y / float(band.YSize) * 100)
-        scanline = band.ReadRaster(0, y, band.XSize, 1, band.XSize, 1,
-                                   band.DataType)
-        if bandtype == 'Byte':
-            values = struct.unpack('B' * band.XSize, scanline)
-        elif bandtype == 'Int16':
-            values = struct.unpack('h' * band.XSize, scanline)
-        elif bandtype == 'UInt16':
-            values = struct.unpack('H' * band.XSize, scanline)
-        elif bandtype == 'Int32':
-            values = struct.unpack('i' * band.XSize, scanline)
-        elif bandtype == 'UInt32':
-            values = struct.unpack('I' * band.XSize, scanline)
-        elif bandtype == 'Float32':
-            values = struct.unpack('f' * band.XSize, scanline)
-        elif bandtype == 'Float64':
-            values = struct.unpack('d' * band.XSize, scanline)
-        else:
-            raise GeoAlgorithmExecutionException('Raster format not supported')
-        for value in values:
-            if value == nodata:
-                value = None
+    mask = numpy.zeros(data.shape, dtype=bool)
+    if nodata is not None:
+        mask |= data == nodata
+    if data.dtype.kind == 'f':
+        mask |= numpy.isnan(data)
+
+    scale = band.GetScale()
+    offset = band.GetOffset()
+    data = data.astype(numpy.float64)
+    if scale not in (None, 1.0):
+        data *= scale
+    if offset not in (None, 0.0):
+        data += offset
+
+    return numpy.ma.MaskedArray(data, mask=mask)
+
+
+def scanRasterBlocks(layer, feedback=None, band=1, window=None, blockRows=None):
+    """Iterates over a raster band in strips of whole block rows.
+
+    layer can be a raster layer or a path to a raster file. window is
+    an optional (xOff, yOff, width, height) pixel window to restrict the
+    scan to. Yields (xOff, yOff, data) tuples, where data is a masked
+    numpy array as returned by readBlock().
+    """
+    filename = layer if isinstance(layer, str) else str(layer.source())
+    dataset = gdal.Open(filename, gdal.GA_ReadOnly)
+    if dataset is None:
+        raise GeoAlgorithmExecutionException('Could not open raster {}'.format(filename))
+    rasterBand = dataset.GetRasterBand(band)
+
+    if window is None:
+        window = (0, 0, rasterBand.XSize, rasterBand.YSize)
+    xOff, yOff, width, height = window
+
+    if blockRows is None:
+        # read strips of about 4 million cells, aligned to the block rows
+        blockHeight = rasterBand.GetBlockSize()[1]
+        blockRows = max(1, 4194304 // max(1, width * blockHeight)) * blockHeight
+
+    for row in range(yOff, yOff + height, blockRows):
+        if feedback is not None:
+            if feedback.isCanceled():
+                break
+            feedback.setProgress((row - yOff) / float(height) * 100)
+        rows = min(blockRows, yOff + height - row)
+        yield (xOff, row, readBlock(rasterBand, xOff, row, width, rows))
+
+    rasterBand = None
+    dataset = None
+
+
+def bandRange(layer, band=1):
+    """Returns the exact (min, max) of a raster band, with its scale and
+    offset applied, or None if the band has no valid cells.
+
+    The range is computed by GDAL, so the band is not read in Python.
+    """
+    filename = layer if isinstance(layer, str) else str(layer.source())
+    dataset = gdal.Open(filename, gdal.GA_ReadOnly)
+    if dataset is None:
+        raise GeoAlgorithmExecutionException('Could not open raster {}'.format(filename))
+    rasterBand = dataset.GetRasterBand(band)
+
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    try:
+        gdal.ErrorReset()
+        values = rasterBand.ComputeRasterMinMax(False)
+        if gdal.GetLastErrorType() >= gdal.CE_Failure:
+            values = None
+    except RuntimeError:
+        # only raised when GDAL exceptions are enabled
+        values = None
+    finally:
+        gdal.PopErrorHandler()
+    if values is None or any(numpy.isnan(v) for v in values):
+        return None
+
+    scale = rasterBand.GetScale()
+    offset = rasterBand.GetOffset()
+    scale = 1.0 if scale is None else scale
+    offset = 0.0 if offset is None else offset
+    minimum, maximum = sorted(v * scale + offset for v in values)
+    return minimum, maximum
+
+
+def scanraster(layer, feedback):
+    """Yields every cell of the first band of a raster layer as a
+    Python float, or None for no-data cells.
+
+    Prefer scanRasterBlocks() for new code.
+    """
+    for xOff, yOff, data in scanRasterBlocks(layer, feedback):
+        for value in data.astype(object).filled(None).flat:
             yield value
 
 
@@ -115,44 +196,492 @@ def pixelToMap(pX, pY, geoTransform):
 
 class RasterWriter(object):
 
+    """Writes a raster from cell values or numpy windows.
+
+    By default all cells are kept in memory and written on close().
+    With streaming=True the output dataset is created up front and
+    windows are written through the GDAL block cache as soon as they
+    are passed to writeArray(), so memory use does not depend on the
+    output size. Prefer writeArray() over setValue() in that mode.
+    """
+
     NODATA = -99999.0
 
     def __init__(self, fileName, minx, miny, maxx, maxy, cellsize,
-                 nbands, crs, geotransform=None):
+                 nbands, crs, geotransform=None, dataType=gdal.GDT_Float32,
+                 options=None, streaming=False, noData=None):
         self.fileName = fileName
         self.nx = int((maxx - minx) / float(cellsize))
         self.ny = int((maxy - miny) / float(cellsize))
         self.nbands = nbands
-        self.matrix = numpy.empty(shape=(self.ny, self.nx), dtype=numpy.float32)
-        self.matrix.fill(self.NODATA)
         self.cellsize = cellsize
         self.crs = crs
         self.minx = minx
         self.maxy = maxy
         self.geotransform = geotransform
+        self.dataType = dataType
+        self.dtype = gdal_array.GDALTypeCodeToNumericTypeCode(dataType)
+        self.noData = noData
+        if self.noData is None:
+            if numpy.issubdtype(self.dtype, numpy.integer):
+                self.noData = numpy.iinfo(self.dtype).min
+            else:
+                self.noData = self.NODATA
+        self.format = formatShortNameFromFileName(fileName)
+        self.options = options
+        if self.options is None:
+            self.options = []
+            if streaming and self.format == 'GTiff':
+                self.options = ['TILED=YES', 'BIGTIFF=IF_SAFER']
+        self.streaming = streaming
+
+        self.dataset = None
+        self.matrices = []
+        if self.streaming:
+            self.dataset = self._create()
+            self.matrix = None
+        else:
+            for i in range(self.nbands):
+                matrix = numpy.empty(shape=(self.ny, self.nx), dtype=self.dtype)
+                matrix.fill(self.noData)
+                self.matrices.append(matrix)
+            # kept for code which accesses the first band directly
+            self.matrix = self.matrices[0]
+
+    def _create(self):
+        driver = gdal.GetDriverByName(self.format)
+        dst_ds = driver.Create(self.fileName, self.nx, self.ny, self.nbands,
+                               self.dataType, self.options)
+        if dst_ds is None:
+            raise GeoAlgorithmExecutionException(
+                'Could not create raster {}'.format(self.fileName))
+        dst_ds.SetProjection(str(self.crs.toWkt()))
+        if self.geotransform is None:
+            dst_ds.SetGeoTransform([self.minx, self.cellsize, 0,
+                                    self.maxy, 0, -self.cellsize])
+        else:
+            dst_ds.SetGeoTransform(self.geotransform)
+        for i in range(self.nbands):
+            dst_ds.GetRasterBand(i + 1).SetNoDataValue(float(self.noData))
+        return dst_ds
 
     def setValue(self, value, x, y, band=0):
+        if self.streaming:
+            if 0 <= x < self.nx and 0 <= y < self.ny:
+                self.writeArray(numpy.array([[value]]), x, y, band)
+            return
         try:
-            self.matrix[y, x] = value
+            self.matrices[band][y, x] = value
         except IndexError:
             pass
 
     def getValue(self, x, y, band=0):
+        if self.streaming:
+            if 0 <= x < self.nx and 0 <= y < self.ny:
+                return self.dataset.GetRasterBand(band + 1).ReadAsArray(x, y, 1, 1)[0, 0]
+            return self.noData
         try:
-            return self.matrix[y, x]
+            return self.matrices[band][y, x]
         except IndexError:
-            return self.NODATA
+            return self.noData
+
+    def writeArray(self, array, xOff=0, yOff=0, band=0):
+        """Writes a 2D numpy array with its upper left cell at
+        (xOff, yOff) into the given zero-based band.
+        """
+        array = numpy.asarray(array, dtype=self.dtype)
+        if self.streaming:
+            self.dataset.GetRasterBand(band + 1).WriteArray(array, xOff, yOff)
+        else:
+            rows, cols = array.shape
+            self.matrices[band][yOff:yOff + rows, xOff:xOff + cols] = array
+
+    def fill(self, value, band=None):
+        """Sets all cells of a zero-based band, or of every band if
+        band is None, to value.
+        """
+        bands = range(self.nbands) if band is None else [band]
+        for i in bands:
+            if not self.streaming:
+                self.matrices[i].fill(value)
+                continue
+            rasterBand = self.dataset.GetRasterBand(i + 1)
+            blockHeight = rasterBand.GetBlockSize()[1]
+            rows = max(1, 4194304 // max(1, self.nx * blockHeight)) * blockHeight
+            for yOff in range(0, self.ny, rows):
+                block = numpy.full((min(rows, self.ny - yOff), self.nx), value,
+                                   dtype=self.dtype)
+                rasterBand.WriteArray(block, 0, yOff)
 
     def close(self):
-        fmt = 'GTiff'
-        driver = gdal.GetDriverByName(fmt)
-        dst_ds = driver.Create(self.fileName, self.nx, self.ny, 1,
-                               gdal.GDT_Float32)
-        dst_ds.SetProjection(str(self.crs.toWkt()))
-        if self.geotransform is None:
-            dst_ds.SetGeoTransform([self.minx, self.cellsize, 0,
-                                    self.maxy, self.cellsize, 0])
+        if not self.streaming:
+            self.dataset = self._create()
+            for i, matrix in enumerate(self.matrices):
+                self.dataset.GetRasterBand(i + 1).WriteArray(matrix)
+            self.matrices = []
+            self.matrix = None
+        self.dataset.FlushCache()
+        self.dataset = None
+
+
+class ZoneValueCounts(object):
+
+    """Counts of the distinct values of each zone, as records of zone,
+    value and count.
+
+    Records are kept in memory and merged as they are added. When they
+    use more than maxSize bytes, they are appended to temporary files,
+    one for each range of zones, so each range can be loaded on its own
+    when the order statistics are computed.
+    """
+
+    DTYPE = numpy.dtype([('zone', numpy.int64), ('value', numpy.float64),
+                         ('count', numpy.int64)])
+    BUCKETS = 64
+
+    def __init__(self, nZones, maxSize):
+        self.nZones = nZones
+        self.maxSize = maxSize
+        self.nBuckets = max(1, min(self.BUCKETS, nZones))
+        self.chunks = []
+        self.size = 0
+        self.folder = None
+
+    @staticmethod
+    def _merge(records):
+        """Returns the records sorted by zone and value, with the
+        counts of equal zones and values added up.
+        """
+        if records.size == 0:
+            return records
+        order = numpy.lexsort((records['value'], records['zone']))
+        records = records[order]
+        starts = numpy.ones(records.size, dtype=bool)
+        starts[1:] = ((records['zone'][1:] != records['zone'][:-1]) |
+                      (records['value'][1:] != records['value'][:-1]))
+        merged = records[starts]
+        merged['count'] = numpy.add.reduceat(records['count'], numpy.flatnonzero(starts))
+        return merged
+
+    def _bucket(self, zones):
+        return zones * self.nBuckets // self.nZones
+
+    def add(self, zones, values):
+        records = numpy.empty(zones.size, dtype=self.DTYPE)
+        records['zone'] = zones
+        records['value'] = values
+        records['count'] = 1
+        records = self._merge(records)
+        self.chunks.append(records)
+        self.size += records.nbytes
+        if self.size > self.maxSize:
+            records = self._merge(numpy.concatenate(self.chunks))
+            self.chunks = [records]
+            self.size = records.nbytes
+            if self.size > self.maxSize / 2:
+                self.spill()
+
+    def spill(self):
+        if self.folder is None:
+            self.folder = getTempDirInTempFolder()
+        records = numpy.concatenate(self.chunks)
+        buckets = self._bucket(records['zone'])
+        for bucket in numpy.unique(buckets):
+            with open(os.path.join(self.folder, '%d.bin' % bucket), 'ab') as f:
+                records[buckets == bucket].tofile(f)
+        self.chunks = []
+        self.size = 0
+
+    def groups(self):
+        """Yields the zones, values and counts of each range of zones,
+        sorted by zone and value.
+        """
+        records = numpy.concatenate(self.chunks) if self.chunks else numpy.empty(0, dtype=self.DTYPE)
+        self.chunks = []
+        if self.folder is None:
+            buckets = [(None, records)]
         else:
-            dst_ds.SetGeoTransform(self.geotransform)
-        dst_ds.GetRasterBand(1).WriteArray(self.matrix)
-        dst_ds = None
+            memoryBuckets = self._bucket(records['zone'])
+            buckets = [(b, records[memoryBuckets == b]) for b in range(self.nBuckets)]
+        for bucket, inMemory in buckets:
+            parts = [inMemory]
+            if bucket is not None:
+                path = os.path.join(self.folder, '%d.bin' % bucket)
+                if os.path.exists(path):
+                    parts.append(numpy.fromfile(path, dtype=self.DTYPE))
+            merged = self._merge(numpy.concatenate(parts))
+            if merged.size:
+                yield merged['zone'], merged['value'], merged['count']
+
+    def close(self):
+        if self.folder is not None:
+            shutil.rmtree(self.folder, True)
+            self.folder = None
+        self.chunks = []
+
+
+class ZonalStatisticsEngine(object):
+
+    """Computes statistics of a raster band for many zones at once.
+
+    Zones are collected with addZone() and then rasterized together
+    into a label raster for each block of the input raster, so every
+    pixel is read only once no matter how many zones cover it. Zones
+    which overlap each other are spread across several label rasters
+    (overlap groups), as a pixel can only carry one label at a time.
+
+    Statistics are accumulated per label with grouped NumPy reductions.
+    The distinct values of each zone, needed for the unique, median and
+    mode statistics, are only collected when those are requested, and
+    are spilled to disk beyond maxMemory bytes (see ZoneValueCounts).
+    """
+
+    STATISTICS = ['min', 'max', 'sum', 'count', 'mean', 'std', 'unique',
+                  'range', 'var', 'median', 'mode']
+    # statistics needing the distinct values of each zone
+    ORDER_STATISTICS = ['unique', 'median', 'mode']
+
+    def __init__(self, rasterPath, bandNumber=1, tileSize=2048,
+                 statistics=None, maxMemory=256 * 1024 * 1024):
+        self.dataset = gdal.Open(rasterPath, gdal.GA_ReadOnly)
+        self.band = self.dataset.GetRasterBand(bandNumber)
+        self.geoTransform = self.dataset.GetGeoTransform()
+        self.noData = self.band.GetNoDataValue()
+        self.scale = self.band.GetScale()
+        self.offset = self.band.GetOffset()
+        if self.scale is None:
+            self.scale = 1.0
+        if self.offset is None:
+            self.offset = 0.0
+        self.tileSize = tileSize
+        self.statistics = statistics or self.STATISTICS
+        self.maxMemory = maxMemory
+
+        self.windows = []
+        self.groups = []
+        self.groupLayers = []
+        self.geometries = []
+        self.index = QgsSpatialIndex()
+        self.memVDS = ogr.GetDriverByName('Memory').CreateDataSource('zones')
+
+    def addZone(self, geometry, window=None):
+        """Adds a zone and returns its zone id.
+
+        geometry is a QgsGeometry in the raster CRS. If a pixel window
+        (xoff, yoff, xsize, ysize) is given, only pixels inside it are
+        taken into account for this zone.
+        """
+        zoneId = len(self.geometries)
+        if window is None:
+            window = (0, 0, self.dataset.RasterXSize, self.dataset.RasterYSize)
+        self.windows.append(window)
+
+        # find an overlap group without any zone sharing area with this one
+        usedGroups = set()
+        for candidate in self.index.intersects(geometry.boundingBox()):
+            other = self.geometries[candidate]
+            if geometry.intersects(other) and not geometry.touches(other):
+                usedGroups.add(self.groups[candidate])
+        group = 0
+        while group in usedGroups:
+            group += 1
+        self.groups.append(group)
+
+        f = QgsFeature(zoneId)
+        f.setGeometry(geometry)
+        self.index.insertFeature(f)
+        self.geometries.append(geometry)
+
+        while len(self.groupLayers) <= group:
+            layer = self.memVDS.CreateLayer('zones%d' % len(self.groupLayers),
+                                            None, ogr.wkbUnknown)
+            layer.CreateField(ogr.FieldDefn('zone', ogr.OFTInteger))
+            self.groupLayers.append(layer)
+
+        layer = self.groupLayers[group]
+        ft = ogr.Feature(layer.GetLayerDefn())
+        # label 0 is reserved for pixels outside any zone
+        ft.SetField('zone', zoneId + 1)
+        ft.SetGeometry(ogr.CreateGeometryFromWkt(geometry.exportToWkt()))
+        layer.CreateFeature(ft)
+        ft = None
+
+        return zoneId
+
+    def _tiles(self):
+        xSize = self.dataset.RasterXSize
+        ySize = self.dataset.RasterYSize
+        if self.tileSize is None:
+            yield (0, 0, xSize, ySize)
+            return
+
+        blockX, blockY = self.band.GetBlockSize()
+        xStep = max(blockX, (self.tileSize // blockX) * blockX)
+        yStep = max(blockY, (self.tileSize // blockY) * blockY)
+        for yOff in range(0, ySize, yStep):
+            for xOff in range(0, xSize, xStep):
+                yield (xOff, yOff, min(xStep, xSize - xOff),
+                       min(yStep, ySize - yOff))
+
+    def _labels(self, layer, tile):
+        xOff, yOff, width, height = tile
+        gt = self.geoTransform
+        tileGeoTransform = (gt[0] + xOff * gt[1] + yOff * gt[2], gt[1], gt[2],
+                            gt[3] + xOff * gt[4] + yOff * gt[5], gt[4], gt[5])
+
+        xs = [tileGeoTransform[0], tileGeoTransform[0] + width * gt[1]]
+        ys = [tileGeoTransform[3], tileGeoTransform[3] + height * gt[5]]
+        layer.SetSpatialFilterRect(min(xs), min(ys), max(xs), max(ys))
+
+        labelDS = gdal.GetDriverByName('MEM').Create('', width, height, 1,
+                                                     gdal.GDT_Int32)
+        labelDS.SetGeoTransform(tileGeoTransform)
+        gdal.RasterizeLayer(labelDS, [1], layer, options=['ATTRIBUTE=zone'])
+        labels = labelDS.GetRasterBand(1).ReadAsArray()
+        layer.SetSpatialFilter(None)
+        labelDS = None
+        return labels
+
+    def compute(self, feedback=None):
+        """Returns a dict with one numpy array per statistic name,
+        indexed by zone id. Float statistics of zones without valid
+        pixels are NaN.
+        """
+        nZones = len(self.geometries)
+        windows = numpy.array(self.windows, dtype=numpy.int64).reshape(-1, 4)
+        x0 = windows[:, 0]
+        y0 = windows[:, 1]
+        x1 = x0 + windows[:, 2]
+        y1 = y0 + windows[:, 3]
+        groups = numpy.array(self.groups, dtype=numpy.int64)
+
+        count = numpy.zeros(nZones, dtype=numpy.int64)
+        total = numpy.zeros(nZones)
+        minimum = numpy.full(nZones, numpy.inf)
+        maximum = numpy.full(nZones, -numpy.inf)
+        # sums of the values shifted by the first value of each zone, for
+        # a numerically stable variance in a single pass
+        shift = numpy.full(nZones, numpy.nan)
+        shiftedTotal = numpy.zeros(nZones)
+        shiftedSquares = numpy.zeros(nZones)
+
+        # order statistics need the distinct values of each zone, which
+        # are only collected if requested
+        valueCounts = None
+        if set(self.statistics) & set(self.ORDER_STATISTICS):
+            valueCounts = ZoneValueCounts(nZones, self.maxMemory)
+
+        try:
+            tiles = list(self._tiles())
+            for current, tile in enumerate(tiles):
+                if feedback is not None:
+                    if feedback.isCanceled():
+                        break
+                    feedback.setProgress(int(current * 100.0 / len(tiles)))
+
+                xOff, yOff, width, height = tile
+                inTile = (x0 < xOff + width) & (x1 > xOff) & (y0 < yOff + height) & (y1 > yOff)
+                if not inTile.any():
+                    continue
+
+                data = self.band.ReadAsArray(xOff, yOff, width, height)
+                data = data * self.scale + self.offset
+                data = numpy.nan_to_num(data)
+                valid = data != self.noData
+
+                for group in numpy.unique(groups[inTile]):
+                    labels = self._labels(self.groupLayers[group], tile) - 1
+                    rows, cols = numpy.nonzero((labels >= 0) & valid)
+                    zones = labels[rows, cols]
+                    rows += yOff
+                    cols += xOff
+                    keep = ((cols >= x0[zones]) & (cols < x1[zones]) &
+                            (rows >= y0[zones]) & (rows < y1[zones]))
+                    zones = zones[keep]
+                    values = data[rows[keep] - yOff, cols[keep] - xOff].astype(numpy.float64)
+                    if zones.size == 0:
+                        continue
+
+                    count += numpy.bincount(zones, minlength=nZones)
+                    total += numpy.bincount(zones, weights=values, minlength=nZones)
+                    numpy.minimum.at(minimum, zones, values)
+                    numpy.maximum.at(maximum, zones, values)
+
+                    # any value of a zone is a good enough shift
+                    newZone = numpy.isnan(shift[zones])
+                    shift[zones[newZone]] = values[newZone]
+                    deviation = values - shift[zones]
+                    shiftedTotal += numpy.bincount(zones, weights=deviation, minlength=nZones)
+                    shiftedSquares += numpy.bincount(zones, weights=deviation * deviation,
+                                                     minlength=nZones)
+
+                    if valueCounts is not None:
+                        valueCounts.add(zones, values)
+
+            return self._finalize(nZones, count, total, minimum, maximum,
+                                  shiftedTotal, shiftedSquares, valueCounts)
+        finally:
+            if valueCounts is not None:
+                valueCounts.close()
+
+    def _finalize(self, nZones, count, total, minimum, maximum,
+                  shiftedTotal, shiftedSquares, valueCounts):
+        stats = {}
+        empty = count == 0
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            var = (shiftedSquares - shiftedTotal * shiftedTotal / count) / count
+        minimum[empty] = numpy.nan
+        maximum[empty] = numpy.nan
+        total = total.copy()
+        total[empty] = numpy.nan
+        var[empty] = numpy.nan
+        # rounding errors must not give negative variances
+        var[~empty] = numpy.maximum(var[~empty], 0)
+
+        stats['count'] = count
+        stats['sum'] = total
+        stats['min'] = minimum
+        stats['max'] = maximum
+        stats['range'] = maximum - minimum
+        stats['mean'] = mean
+        stats['var'] = var
+        stats['std'] = numpy.sqrt(var)
+
+        median = numpy.full(nZones, numpy.nan)
+        mode = numpy.full(nZones, numpy.nan)
+        unique = numpy.zeros(nZones, dtype=numpy.int64)
+
+        if valueCounts is not None:
+            for zones, values, counts in valueCounts.groups():
+                # records are sorted by zone and value, so order
+                # statistics can be picked from the cumulative counts
+                ends = numpy.cumsum(counts)
+                zoneCounts = numpy.bincount(zones, weights=counts, minlength=nZones).astype(numpy.int64)
+                present = numpy.unique(zones)
+                firstRecord = numpy.searchsorted(zones, present)
+                zoneStarts = ends[firstRecord] - counts[firstRecord]
+                n = zoneCounts[present]
+                lower = values[numpy.searchsorted(ends, zoneStarts + (n - 1) // 2, side='right')]
+                upper = values[numpy.searchsorted(ends, zoneStarts + n // 2, side='right')]
+                median[present] = (lower + upper) / 2.0
+
+                unique += numpy.bincount(zones, minlength=nZones)
+
+                # most frequent value, the smallest one wins on ties
+                order = numpy.lexsort((numpy.arange(zones.size), -counts, zones))
+                sortedZones = zones[order]
+                first = numpy.ones(sortedZones.size, dtype=bool)
+                first[1:] = sortedZones[1:] != sortedZones[:-1]
+                mode[sortedZones[first]] = values[order[first]]
+
+        stats['median'] = median
+        stats['mode'] = mode
+        stats['unique'] = unique
+        return stats
+
+    def close(self):
+        self.groupLayers = []
+        self.memVDS = None
+        self.band = None
+        self.dataset = None
@@ -32,12 +32,16 @@ import time
 import sys
 import uuid
 import math
+import glob
 
 from qgis.PyQt.QtCore import QDir
 from qgis.core import QgsApplication
 
 numExported = 1
 
+# suffix of the spatial indexes persisted next to vector files
+SPATIAL_INDEX_SUFFIX = '.sidx.npz'
+
 
 def userFolder():
     userDir = os.path.join(QgsApplication.qgisSettingsDirPath(), 'processing')
@@ -142,6 +146,17 @@ def mkdir(newdir):
             os.mkdir(newdir)
 
 
+def relatedFiles(path):
+    """Returns the files sharing the base name of a file, such as
+    the .dbf and .prj files of a shapefile, leaving out the spatial
+    indexes persisted by processing.
+    """
+    base = os.path.splitext(path)[0]
+    files = set(glob.glob(glob.escape(base) + '.*'))
+    files.add(path)
+    return [f for f in files if os.path.isfile(f) and not f.endswith(SPATIAL_INDEX_SUFFIX)]
+
+
 def escapeAndJoin(strList):
     joined = ''
     for s in strList:
@@ -33,17 +33,32 @@ __copyright__ = '(C) 2013, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import re
+import io
 import os
 import csv
+import gzip
 import uuid
+import zipfile
+import struct
+from collections import OrderedDict
 
+import sip
+import numpy
 import psycopg2
+try:
+    import scipy  # NOQA
+    hasSciPy = True
+except ImportError:
+    hasSciPy = False
 from osgeo import ogr
 
-from qgis.PyQt.QtCore import QVariant
+from qgis.PyQt.QtCore import QCoreApplication, QVariant, QByteArray
 from qgis.core import (QgsFields,
                        QgsField,
+                       QgsFeature,
                        QgsGeometry,
+                       QgsPoint,
+                       QgsSpatialIndex,
                        QgsWkbTypes,
                        QgsVectorLayer,
                        QgsVectorFileWriter,
@@ -55,6 +70,9 @@ from qgis.core import (QgsFields,
                        QgsProcessingContext,
                        QgsProcessingUtils)
 
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
+from processing.core.SpatialIndexCache import SpatialIndexCache
 from processing.tools import dataobjects
 
 
@@ -273,22 +291,618 @@ def checkMinDistance(point, index, distance, points):
     return True
 
 
+def _wkbCoordinateBlocks(wkb, offset=0):
+    """Walks a WKB geometry starting at offset and returns a tuple with
+    the offset following it and a list of (offset, points, dimensions,
+    byte order) entries, one for each array of coordinates it contains.
+    """
+    byteOrder = '<' if wkb[offset] == 1 else '>'
+    wkbType = struct.unpack_from(byteOrder + 'I', wkb, offset + 1)[0]
+    offset += 5
+
+    dimensions = 2
+    if wkbType & 0x80000000:
+        # legacy 2.5D geometries
+        dimensions = 3
+        wkbType &= 0x7FFFFFFF
+    else:
+        dimensions += {0: 0, 1: 1, 2: 1, 3: 2}.get(wkbType // 1000, 0)
+    baseType = wkbType % 1000
+
+    blocks = []
+    if baseType == 1:
+        blocks.append((offset, 1, dimensions, byteOrder))
+        offset += 8 * dimensions
+    elif baseType in (2, 8):
+        count = struct.unpack_from(byteOrder + 'I', wkb, offset)[0]
+        blocks.append((offset + 4, count, dimensions, byteOrder))
+        offset += 4 + 8 * dimensions * count
+    elif baseType in (3, 17):
+        rings = struct.unpack_from(byteOrder + 'I', wkb, offset)[0]
+        offset += 4
+        for i in range(rings):
+            count = struct.unpack_from(byteOrder + 'I', wkb, offset)[0]
+            blocks.append((offset + 4, count, dimensions, byteOrder))
+            offset += 4 + 8 * dimensions * count
+    else:
+        # collections, compound curves and curve polygons hold
+        # complete WKB geometries
+        parts = struct.unpack_from(byteOrder + 'I', wkb, offset)[0]
+        offset += 4
+        for i in range(parts):
+            offset, partBlocks = _wkbCoordinateBlocks(wkb, offset)
+            blocks.extend(partBlocks)
+    return offset, blocks
+
+
 def snapToPrecision(geom, precision):
+    """Returns a copy of geom with the x and y coordinates of all its
+    vertices rounded to a grid of the given precision.
+    """
     snapped = QgsGeometry(geom)
-    if precision == 0.0:
+    if precision == 0.0 or snapped.isNull() or snapped.isEmpty():
         return snapped
 
-    i = 0
-    p = snapped.vertexAt(i)
-    while p.x() != 0.0 and p.y() != 0.0:
-        x = round(p.x() / precision, 0) * precision
-        y = round(p.y() / precision, 0) * precision
-        snapped.moveVertex(x, y, i)
-        i = i + 1
-        p = snapped.vertexAt(i)
+    wkb = bytearray(geom.exportToWkb().data())
+    offset, blocks = _wkbCoordinateBlocks(wkb)
+    for offset, points, dimensions, byteOrder in blocks:
+        coords = numpy.frombuffer(wkb, dtype=byteOrder + 'f8',
+                                  count=points * dimensions,
+                                  offset=offset).reshape(points, dimensions)
+        coords[:, :2] = numpy.round(coords[:, :2] / precision) * precision
+
+    snapped.fromWkb(QByteArray(bytes(wkb)))
     return snapped
 
 
+class DuplicateGeometryFinder(object):
+
+    """Groups features with equal geometries.
+
+    Geometries are bucketed by their bounding box, which topologically
+    equal geometries always share, so the expensive GEOS equality test
+    is only run between members of the same bucket. Geometries with an
+    identical WKB representation are matched without calling GEOS at
+    all. If a tolerance is given, geometries are snapped to a grid of
+    that size before being compared.
+    """
+
+    def __init__(self, tolerance=0.0):
+        self.tolerance = tolerance
+        # fids of each group, the first one is the representative
+        self.groups = []
+        # representative geometry of each group
+        self.geometries = []
+        self.buckets = {}
+        self.wkbs = {}
+
+    def addFeature(self, feature):
+        return self.addGeometry(feature.id(), feature.geometry())
+
+    def addGeometry(self, fid, geometry):
+        """Adds a geometry and returns the index of the group it has
+        been assigned to.
+        """
+        if geometry is None or geometry.isNull() or geometry.isEmpty():
+            return self._newGroup(fid, geometry, None, None)
+
+        if self.tolerance:
+            geometry = snapToPrecision(geometry, self.tolerance)
+
+        wkb = geometry.exportToWkb().data()
+        group = self.wkbs.get(wkb)
+        if group is not None:
+            self.groups[group].append(fid)
+            return group
+
+        bbox = geometry.boundingBox()
+        key = (bbox.xMinimum(), bbox.yMinimum(), bbox.xMaximum(), bbox.yMaximum())
+        for group in self.buckets.get(key, []):
+            if geometry.isGeosEqual(self.geometries[group]):
+                self.groups[group].append(fid)
+                return group
+
+        return self._newGroup(fid, geometry, key, wkb)
+
+    def _newGroup(self, fid, geometry, key, wkb):
+        group = len(self.groups)
+        self.groups.append([fid])
+        self.geometries.append(geometry)
+        if key is not None:
+            self.buckets.setdefault(key, []).append(group)
+            self.wkbs[wkb] = group
+        return group
+
+
+class NearestNeighbourFinder(object):
+
+    """Answers k nearest neighbour queries against the features of a
+    layer.
+
+    The layer is read once, keeping the id, the requested attributes
+    and the center of the bounding box of each feature in memory, so
+    results never need to be fetched back from the provider. Point
+    layers are searched with a KD-tree when SciPy is available. Other
+    layers use an in-memory spatial index.
+
+    Distances are planar, measured to the bounding box centers, in
+    layer units. Note that for layers other than points the spatial
+    index ranks features by the distance to their bounding box, not to
+    its center, so the returned neighbours are not always the ones with
+    the smallest distances, nor sorted by them.
+    """
+
+    # number of features queried at once by queryFeatures
+    CHUNK_SIZE = 4096
+
+    def __init__(self, layer, context, attributes=None):
+        """attributes is a list of the names of the fields to keep, or
+        None to keep all of them.
+        """
+        request = QgsFeatureRequest()
+        if attributes is not None:
+            request.setSubsetOfAttributes(attributes, layer.fields())
+
+        useTree = hasSciPy and QgsWkbTypes.flatType(layer.wkbType()) == QgsWkbTypes.Point
+        self.index = None if useTree else QgsSpatialIndex()
+
+        ids = []
+        coords = []
+        self.attributes = []
+        for f in QgsProcessingUtils.getFeatures(layer, context, request):
+            if not f.hasGeometry():
+                continue
+            center = f.geometry().boundingBox().center()
+            ids.append(f.id())
+            coords.append((center.x(), center.y()))
+            self.attributes.append(f.attributes())
+            if self.index is not None:
+                self.index.insertFeature(f)
+
+        self.ids = numpy.array(ids, dtype=numpy.int64)
+        self.coords = numpy.array(coords, dtype=numpy.float64).reshape(-1, 2)
+        self.rows = {fid: row for row, fid in enumerate(ids)}
+        self.tree = None
+        if useTree and len(ids):
+            from scipy.spatial import cKDTree
+            self.tree = cKDTree(self.coords)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, points, k=1):
+        """Returns the k nearest features to each of a sequence of
+        (x, y) tuples, as three arrays with one row per point: the
+        feature ids, the distances and the row of each neighbour in
+        the coords and attributes of the finder. Neighbours are sorted
+        by distance for point layers, and by the distance to their
+        bounding box otherwise.
+        """
+        points = numpy.array(points, dtype=numpy.float64).reshape(-1, 2)
+        k = min(k, len(self.ids))
+        if k == 0:
+            empty = numpy.zeros((len(points), 0))
+            return empty.astype(numpy.int64), empty, empty.astype(numpy.int64)
+
+        if self.tree is not None:
+            distances, rows = self.tree.query(points, k)
+            distances = distances.reshape(len(points), k)
+            rows = rows.reshape(len(points), k)
+        else:
+            rows = numpy.empty((len(points), k), dtype=numpy.int64)
+            for i, (x, y) in enumerate(points):
+                neighbours = self.index.nearestNeighbor(QgsPoint(x, y), k)
+                rows[i] = [self.rows[fid] for fid in neighbours[:k]]
+            distances = numpy.hypot(self.coords[rows, 0] - points[:, 0, None],
+                                    self.coords[rows, 1] - points[:, 1, None])
+
+        return self.ids[rows], distances, rows
+
+    def queryFeatures(self, features, k=1, chunkSize=None):
+        """Queries the k nearest neighbours of the center of the
+        bounding box of every feature in an iterator, in batches.
+
+        Yields (feature, ids, distances, rows) for each feature with a
+        geometry, where ids, distances and rows are the rows returned
+        by query() for that feature.
+        """
+        if chunkSize is None:
+            chunkSize = self.CHUNK_SIZE
+
+        chunk = []
+        for f in features:
+            if not f.hasGeometry():
+                continue
+            chunk.append(f)
+            if len(chunk) == chunkSize:
+                for result in self._queryChunk(chunk, k):
+                    yield result
+                chunk = []
+        if chunk:
+            for result in self._queryChunk(chunk, k):
+                yield result
+
+    def _queryChunk(self, features, k):
+        points = []
+        for f in features:
+            center = f.geometry().boundingBox().center()
+            points.append((center.x(), center.y()))
+        ids, distances, rows = self.query(points, k)
+        for i, f in enumerate(features):
+            yield f, ids[i], distances[i], rows[i]
+
+
+class SpatialPredicateIndex(object):
+
+    """Finds the features of a layer that match geometric predicates
+    with probe geometries, as used by the location based algorithms.
+
+    The layer is read once. Its geometries are snapped to the given
+    precision once per feature and kept in memory along with a spatial
+    index, so candidates never need to be fetched back from the
+    provider. If an extent is given, the bounding box filter is passed
+    to the provider when reading the layer. Each probe geometry is
+    snapped and prepared once, and then tested against the candidates
+    from the index.
+    """
+
+    # predicates to evaluate on the probe geometry when the predicate
+    # is expressed from the point of view of the indexed features
+    CONVERSE = {'within': 'contains',
+                'contains': 'within'}
+
+    def __init__(self, layer, context, precision=0.0, attributes=None, extent=None):
+        """attributes is a list of the names of the fields whose values
+        are kept in the attributes dict, or None to keep no attribute.
+        """
+        self.layer = layer
+        self.context = context
+        self.precision = precision
+        self.index = QgsSpatialIndex()
+        self.geometries = {}
+        self.attributes = {}
+        self._allFids = None
+
+        request = QgsFeatureRequest()
+        if attributes is not None:
+            request.setSubsetOfAttributes(attributes, layer.fields())
+        else:
+            request.setSubsetOfAttributes([])
+        if extent is not None:
+            request.setFilterRect(extent)
+
+        for f in QgsProcessingUtils.getFeatures(layer, context, request):
+            if not f.hasGeometry():
+                continue
+            geometry = snapToPrecision(f.geometry(), precision)
+            snapped = QgsFeature(f.id())
+            snapped.setGeometry(geometry)
+            self.index.insertFeature(snapped)
+            self.geometries[f.id()] = geometry
+            if attributes is not None:
+                self.attributes[f.id()] = f.attributes()
+
+    def allFids(self):
+        """Returns the set of ids of all the features of the layer,
+        including those outside of the extent or without a geometry.
+        """
+        if self._allFids is None:
+            request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setSubsetOfAttributes([])
+            self._allFids = set(f.id() for f in QgsProcessingUtils.getFeatures(self.layer, self.context, request))
+        return self._allFids
+
+    def matches(self, geometry, predicates, converse=False):
+        """Returns the ids of the indexed features for which any of the
+        predicates is true, in the order given by the spatial index.
+
+        Predicates are evaluated as probe.predicate(feature), or as
+        feature.predicate(probe) if converse is True. The 'disjoint'
+        predicate is not supported, as it can not be answered from the
+        index; use allFids() minus the intersecting features instead.
+        """
+        if geometry is None or geometry.isNull() or geometry.isEmpty():
+            return []
+
+        probe = snapToPrecision(geometry, self.precision)
+        engine = QgsGeometry.createGeometryEngine(probe.geometry())
+        engine.prepareGeometry()
+
+        tests = []
+        for predicate in predicates:
+            if converse:
+                predicate = self.CONVERSE.get(predicate, predicate)
+            if predicate == 'equals':
+                predicate = 'isEqual'
+            tests.append(getattr(engine, predicate))
+
+        bbox = probe.boundingBox()
+        bbox.grow(0.51 * self.precision)
+        fids = []
+        for fid in self.index.intersects(bbox):
+            candidate = self.geometries[fid].geometry()
+            for test in tests:
+                if test(candidate):
+                    fids.append(fid)
+                    break
+        return fids
+
+
+class FeatureCache(object):
+
+    """Serves the geometries and attributes of the features of a layer
+    by id, for the overlay algorithms that look up, for every feature
+    of a layer, the candidate features of another one.
+
+    The layer is read once with a sequential scan, optionally limited to
+    an extent, which also builds the spatial index. Features are kept in
+    memory, up to maxSize megabytes. When a lookup needs features that
+    did not fit in the cache or were evicted, they are fetched with a
+    single request filtered by the bounding box of the lookup, and the
+    other features in that window are cached too, as neighbouring
+    lookups are likely to need them. The least recently used features
+    are evicted first. Features are always read through the processing
+    context, so its selection and invalid geometry settings apply.
+
+    The number of requests sent to the provider is kept in requests.
+    """
+
+    # estimated memory used by a cached feature, besides its geometry
+    FEATURE_OVERHEAD = 200
+    ATTRIBUTE_OVERHEAD = 16
+    COORDINATE_SIZE = 32
+
+    def __init__(self, layer, context, attributes=True, maxSize=None, extent=None):
+        """If attributes is False, the features are cached without
+        attributes. maxSize defaults to the processing setting. If an
+        extent is given, only the features within it are read.
+        """
+        self.layer = layer
+        self.context = context
+        self.withAttributes = attributes
+        if maxSize is None:
+            try:
+                maxSize = float(ProcessingConfig.getSetting(ProcessingConfig.OVERLAY_CACHE_SIZE))
+            except (TypeError, ValueError):
+                maxSize = 256
+        self.maxSize = maxSize * 1024 * 1024
+        self.size = 0
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.index = QgsSpatialIndex()
+        self.features = OrderedDict()
+        self.fids = set()
+
+        request = self._request()
+        if extent is not None:
+            request.setFilterRect(extent)
+        self.requests += 1
+        for f in QgsProcessingUtils.getFeatures(layer, context, request):
+            if not f.hasGeometry():
+                continue
+            self.index.insertFeature(f)
+            self.fids.add(f.id())
+            self._add(f)
+
+    def __len__(self):
+        return len(self.fids)
+
+    def _request(self):
+        request = QgsFeatureRequest()
+        if not self.withAttributes:
+            request.setSubsetOfAttributes([])
+        return request
+
+    def _add(self, feature):
+        """Caches a feature, if it fits in the cache, and returns its
+        (geometry, attributes, size) tuple.
+        """
+        geometry = feature.geometry()
+        attributes = feature.attributes() if self.withAttributes else []
+        size = self.FEATURE_OVERHEAD + len(attributes) * self.ATTRIBUTE_OVERHEAD
+        size += geometry.geometry().nCoordinates() * self.COORDINATE_SIZE
+        for value in attributes:
+            if isinstance(value, str):
+                size += len(value)
+
+        item = (geometry, attributes, size)
+        if size > self.maxSize:
+            return item
+        self.features[feature.id()] = item
+        self.size += size
+        while self.size > self.maxSize:
+            fid, evicted = self.features.popitem(last=False)
+            self.size -= evicted[2]
+        return item
+
+    def candidates(self, rect):
+        """Returns a list of (id, geometry, attributes) tuples for the
+        features whose bounding box intersects rect, sorted by id.
+        """
+        found = {}
+        missing = set()
+        for fid in self.index.intersects(rect):
+            item = self.features.get(fid)
+            if item is None:
+                missing.add(fid)
+            else:
+                self.features.move_to_end(fid)
+                found[fid] = item
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            self.requests += 1
+            request = self._request().setFilterRect(rect)
+            for f in QgsProcessingUtils.getFeatures(self.layer, self.context, request):
+                fid = f.id()
+                if fid not in self.fids or fid in self.features or not f.hasGeometry():
+                    continue
+                item = self._add(f)
+                if fid in missing:
+                    found[fid] = item
+                    missing.discard(fid)
+        if missing:
+            # not expected, unless the provider filters bounding boxes
+            # differently from the index
+            self.requests += 1
+            request = self._request().setFilterFids(list(missing))
+            for f in QgsProcessingUtils.getFeatures(self.layer, self.context, request):
+                found[f.id()] = self._add(f)
+
+        return [(fid, found[fid][0], found[fid][1]) for fid in sorted(found)]
+
+
+class PointsInPolygonCounter(object):
+
+    """Aggregates, for every polygon of a layer, the points of another
+    layer that it contains: their number (COUNT), the sum of the
+    numeric values of a field (SUM) or the number of distinct values of
+    a field (UNIQUE).
+
+    The strategy is chosen from the size of the layers. When there are
+    more points than polygons, the polygons are indexed and the points
+    are read once, accumulating the values of every polygon containing
+    them in arrays. Otherwise, the points are indexed and the candidate
+    points are fetched for every polygon.
+    """
+
+    COUNT = 0
+    SUM = 1
+    UNIQUE = 2
+
+    def __init__(self, polyLayer, pointLayer, context, mode=COUNT, field=None):
+        """field is the index of the field of the points to aggregate,
+        for the SUM and UNIQUE modes.
+        """
+        self.polyLayer = polyLayer
+        self.pointLayer = pointLayer
+        self.context = context
+        self.mode = mode
+        self.field = field
+
+    def pointMajor(self):
+        """Returns True if the points should be read only once, rather
+        than fetched for every polygon.
+        """
+        return (QgsProcessingUtils.featureCount(self.pointLayer, self.context) >=
+                QgsProcessingUtils.featureCount(self.polyLayer, self.context))
+
+    def _pointRequest(self):
+        request = QgsFeatureRequest()
+        if self.mode == self.COUNT:
+            request.setSubsetOfAttributes([])
+        else:
+            request.setSubsetOfAttributes([self.field])
+        return request
+
+    def _value(self, point):
+        if self.mode == self.COUNT:
+            return 1
+        value = point.attributes()[self.field]
+        if self.mode == self.SUM:
+            try:
+                return float(str(value))
+            except:
+                # Ignore fields with non-numeric values
+                return 0
+        return value
+
+    def _result(self, accumulated):
+        if self.mode == self.UNIQUE:
+            return len(accumulated)
+        return accumulated
+
+    def values(self, feedback):
+        """Iterates over the polygons, in the order of the layer,
+        yielding (polygon feature, aggregated value) tuples.
+        """
+        if self.pointMajor():
+            return self._pointMajor(feedback)
+        return self._polygonMajor(feedback)
+
+    def _polygonMajor(self, feedback):
+        spatialIndex = SpatialIndexCache.index(self.pointLayer, self.context, feedback)
+
+        features = QgsProcessingUtils.getFeatures(self.polyLayer, self.context)
+        total = 100.0 / QgsProcessingUtils.featureCount(self.polyLayer, self.context)
+        for current, ftPoly in enumerate(features):
+            geom = ftPoly.geometry()
+            accumulated = set() if self.mode == self.UNIQUE else 0
+
+            points = spatialIndex.intersects(geom.boundingBox())
+            if len(points) > 0:
+                engine = QgsGeometry.createGeometryEngine(geom.geometry())
+                engine.prepareGeometry()
+                request = self._pointRequest().setFilterFids(points)
+                for ftPoint in self.pointLayer.getFeatures(request):
+                    if engine.contains(ftPoint.geometry().geometry()):
+                        if self.mode == self.UNIQUE:
+                            accumulated.add(self._value(ftPoint))
+                        else:
+                            accumulated += self._value(ftPoint)
+
+            yield ftPoly, self._result(accumulated)
+            feedback.setProgress(int(current * total))
+
+    def _pointMajor(self, feedback):
+        index = QgsSpatialIndex()
+        geometries = []
+        engines = []
+        positions = {}
+        request = QgsFeatureRequest().setSubsetOfAttributes([])
+        for f in QgsProcessingUtils.getFeatures(self.polyLayer, self.context, request):
+            if not f.hasGeometry():
+                continue
+            positions[f.id()] = len(geometries)
+            geometries.append(f.geometry())
+            engines.append(None)
+            index.insertFeature(f)
+
+        if self.mode == self.UNIQUE:
+            accumulated = [set() for g in geometries]
+        else:
+            accumulated = numpy.zeros(len(geometries))
+
+        count = QgsProcessingUtils.featureCount(self.pointLayer, self.context)
+        total = 50.0 / count if count else 0
+        features = QgsProcessingUtils.getFeatures(self.pointLayer, self.context, self._pointRequest())
+        for current, ftPoint in enumerate(features):
+            if not ftPoint.hasGeometry():
+                continue
+            point = ftPoint.geometry()
+            for fid in index.intersects(point.boundingBox()):
+                i = positions[fid]
+                engine = engines[i]
+                if engine is None:
+                    # polygons are only prepared when a point falls in
+                    # their bounding box
+                    engine = QgsGeometry.createGeometryEngine(geometries[i].geometry())
+                    engine.prepareGeometry()
+                    engines[i] = engine
+                if engine.contains(point.geometry()):
+                    if self.mode == self.UNIQUE:
+                        accumulated[i].add(self._value(ftPoint))
+                    else:
+                        accumulated[i] += self._value(ftPoint)
+            feedback.setProgress(int(current * total))
+
+        features = QgsProcessingUtils.getFeatures(self.polyLayer, self.context)
+        total = 50.0 / QgsProcessingUtils.featureCount(self.polyLayer, self.context)
+        for current, ftPoly in enumerate(features):
+            i = positions.get(ftPoly.id())
+            if i is None:
+                value = 0
+            elif self.mode == self.UNIQUE:
+                value = len(accumulated[i])
+            elif self.mode == self.COUNT:
+                value = int(accumulated[i])
+            else:
+                value = float(accumulated[i])
+            yield ftPoly, value
+            feedback.setProgress(50 + int(current * total))
+
+
 def ogrConnectionString(uri):
     """Generates OGR connection sting from layer source
     """
@@ -409,6 +1023,84 @@ def ogrLayerName(uri):
     return name
 
 
+class PartitionedFeatureSink(object):
+
+    """Routes features to one output per partition key while the
+    source is read a single time.
+
+    Outputs are created lazily when the first feature of a key arrives.
+    destination is a callable returning the destination for a key. At
+    most maxOpenSinks outputs are kept open; when the limit is hit the
+    least recently used one is closed, and reopened later to append
+    more features if needed.
+    """
+
+    def __init__(self, destination, fields, geomType, crs, context,
+                 encoding=None, maxOpenSinks=64):
+        self.destination = destination
+        self.fields = fields
+        self.geomType = geomType
+        self.crs = crs
+        self.context = context
+        self.encoding = encoding
+        self.maxOpenSinks = maxOpenSinks
+        # key -> destination of every output created so far
+        self.destinations = OrderedDict()
+        # key -> (sink, layer) for open outputs, least recently used first
+        self.sinks = OrderedDict()
+
+    def addFeature(self, key, feature):
+        return self._sink(key).addFeature(feature)
+
+    def addFeatures(self, key, features):
+        return self._sink(key).addFeatures(features)
+
+    def _sink(self, key):
+        if key in self.sinks:
+            self.sinks.move_to_end(key)
+            return self.sinks[key][0]
+
+        while self.sinks and len(self.sinks) >= self.maxOpenSinks:
+            self._close(next(iter(self.sinks)))
+
+        if key in self.destinations:
+            # closed earlier, append to the existing output
+            layer = QgsVectorLayer(self.destinations[key], str(key), 'ogr')
+            if not layer.isValid():
+                raise GeoAlgorithmExecutionException(
+                    QCoreApplication.translate('PartitionedFeatureSink', 'Could not reopen {0}').format(
+                        self.destinations[key]))
+            sink = layer.dataProvider()
+        else:
+            layer = None
+            sink, dest = QgsProcessingUtils.createFeatureSink(self.destination(key), self.encoding,
+                                                              self.fields, self.geomType, self.crs,
+                                                              self.context)
+            self.destinations[key] = dest
+
+        self.sinks[key] = (sink, layer)
+        return sink
+
+    def _close(self, key):
+        """Closes the output of a key right away, instead of leaving it
+        to the garbage collector: writers and reopened layers are
+        deleted, which closes their files.
+        """
+        sink, layer = self.sinks.pop(key)
+        if layer is not None:
+            sip.delete(layer)
+        elif isinstance(sink, QgsVectorFileWriter):
+            sip.delete(sink)
+
+    def close(self):
+        """Closes all open outputs and returns a dict with the
+        destination of each key.
+        """
+        for key in list(self.sinks.keys()):
+            self._close(key)
+        return dict(self.destinations)
+
+
 NOGEOMETRY_EXTENSIONS = [
     u'csv',
     u'dbf',
@@ -417,28 +1109,139 @@ NOGEOMETRY_EXTENSIONS = [
 ]
 
 
+COLUMNAR_EXTENSIONS = [
+    u'npz',
+    u'parquet',
+    u'feather',
+]
+
+
 class TableWriter(object):
 
+    """Writes records to a table file. The format is chosen from the
+    file extension: CSV (the default), gzip compressed CSV (.csv.gz),
+    or a columnar format (.npz, and .parquet or .feather when pyarrow
+    is available). Columnar formats keep the records in memory and
+    write them when the writer is closed.
+
+    The file is kept open until close() is called or the writer is
+    deleted, and the writer can be used as a context manager.
+    """
+
+    BUFFER_SIZE = 1024 * 1024
+
     def __init__(self, fileName, encoding, fields):
         self.fileName = fileName
-        if not self.fileName.lower().endswith('csv'):
-            self.fileName += '.csv'
+        lowerName = self.fileName.lower()
+        self.format = 'csv'
+        if lowerName.endswith('.csv.gz'):
+            self.format = 'csv.gz'
+        else:
+            ext = os.path.splitext(lowerName)[1][1:]
+            if ext in COLUMNAR_EXTENSIONS:
+                self.format = ext
+            elif not lowerName.endswith('csv'):
+                self.fileName += '.csv'
 
         self.encoding = encoding
         if self.encoding is None or encoding == 'System':
             self.encoding = 'utf-8'
 
-        with open(self.fileName, 'w', newline='', encoding=self.encoding) as f:
-            self.writer = csv.writer(f)
-            if len(fields) != 0:
-                self.writer.writerow(fields)
+        self.file = None
+        self.fields = [str(f) for f in fields]
+        self.records = []
+        if self.format in COLUMNAR_EXTENSIONS:
+            if self.format != 'npz':
+                # fail early rather than after the algorithm has run
+                import pyarrow  # NOQA
+            return
+
+        if self.format == 'csv.gz':
+            self.file = gzip.open(self.fileName, 'wt', newline='', encoding=self.encoding)
+        else:
+            self.file = open(self.fileName, 'w', newline='', encoding=self.encoding,
+                             buffering=self.BUFFER_SIZE)
+        self.writer = csv.writer(self.file)
+        if len(fields) != 0:
+            self.writer.writerow(fields)
 
     def addRecord(self, values):
-        with open(self.fileName, 'a', newline='', encoding=self.encoding) as f:
-            self.writer = csv.writer(f)
+        if self.file is not None:
             self.writer.writerow(values)
+        elif not self.fields:
+            # the first record is the header
+            self.fields = [str(v) for v in values]
+        else:
+            self.records.append(list(values))
 
     def addRecords(self, records):
-        with open(self.fileName, 'a', newline='', encoding=self.encoding) as f:
-            self.writer = csv.writer(f)
+        if self.file is not None:
             self.writer.writerows(records)
+        else:
+            for values in records:
+                self.addRecord(values)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        elif self.format in COLUMNAR_EXTENSIONS and self.records is not None:
+            self._writeColumns()
+            self.records = None
+
+    def _columns(self):
+        columns = OrderedDict()
+        for i, name in enumerate(self.fields):
+            values = [r[i] if i < len(r) else None for r in self.records]
+            values = [None if isinstance(v, QVariant) else v for v in values]
+            try:
+                column = numpy.array([numpy.nan if v is None else float(v) for v in values])
+            except (TypeError, ValueError):
+                column = numpy.array(['' if v is None else str(v) for v in values])
+            columns[name] = column
+        return columns
+
+    def _writeColumns(self):
+        columns = self._columns()
+        if self.format == 'npz':
+            self._writeNpz(columns)
+            return
+
+        import pyarrow
+        table = pyarrow.Table.from_arrays([pyarrow.array(c) for c in columns.values()],
+                                          names=list(columns.keys()))
+        if self.format == 'parquet':
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(table, self.fileName)
+        else:
+            import pyarrow.feather
+            pyarrow.feather.write_feather(table, self.fileName)
+
+    def _writeNpz(self, columns):
+        """Writes the columns as the arrays of a compressed .npz file.
+        numpy.savez_compressed is not used, as it takes field names
+        such as 'file' as its own arguments. Array names are the field
+        names, without path separators and made unique.
+        """
+        names = set()
+        with zipfile.ZipFile(self.fileName, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for name, column in columns.items():
+                key = re.sub(r'[/\\]', '_', name) or '_'
+                while key in names:
+                    key += '_'
+                names.add(key)
+                data = io.BytesIO()
+                numpy.lib.format.write_array(data, column, allow_pickle=False)
+                archive.writestr(key + '.npy', data.getvalue())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass